@@ -4,17 +4,22 @@ För Migration (Laddpunkter) och Service
 """
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import io
 import json
+import os
+import time
 
 # Import custom modules
-from optimizer import run_optimization, HomeBaseManager
-from excel_export import create_excel_report, create_csv_export
+from optimizer import reprice_result, requires_rerouting, result_fingerprint, HomeBaseManager
+from job_runner import JobRunner
+from upload_cache import UploadCache
+from observers import STEP_NAMES
+from profiles import PROFILES
+from time_budget import STAGE_NAMES
+from excel_export import create_excel_report, create_csv_export, daily_summary, schedule_frame
 from map_visualization import create_route_map, create_simple_overview_map
+from workday_calendar import parse_date
 
 # Page config
 st.set_page_config(
@@ -45,6 +50,43 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Diskcache för avståndsmatriser - nya körningar på samma kunddata återanvänder matrisen
+DISTANCE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.distance_cache')
+
+# Optimeringar körs i bakgrundstrådar som delas av alla sessioner
+JOB_POLL_INTERVAL_S = 0.5
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    return JobRunner(max_workers=2)
+
+
+@st.cache_resource
+def get_upload_cache() -> UploadCache:
+    # Delas av alla sessioner - samma fil läses bara in en gång
+    return UploadCache(max_mb=512)
+
+
+job_runner = get_job_runner()
+upload_cache = get_upload_cache()
+
+
+def get_artifact(name: str, fingerprint: str, build=None):
+    """
+    Genererad karta/Excel för aktuellt resultat (None om den inte byggts än)
+    
+    Med build byggs den om den saknas. Artefakterna sparas per session och
+    kastas när resultatet (fingeravtrycket) ändras.
+    """
+    artifacts = st.session_state.artifacts
+    if artifacts.get('fingerprint') != fingerprint:
+        artifacts.clear()
+        artifacts['fingerprint'] = fingerprint
+    if name not in artifacts and build is not None:
+        artifacts[name] = build()
+    return artifacts.get(name)
+
 # Initialize session state
 if 'config' not in st.session_state:
     st.session_state.config = {}
@@ -52,54 +94,12 @@ if 'results' not in st.session_state:
     st.session_state.results = None
 if 'optimization_done' not in st.session_state:
     st.session_state.optimization_done = False
-
-# Profiles
-PROFILES = {
-    'migration': {
-        'name': '🔌 Migration (Laddpunkter)',
-        'description': 'Installation av laddpunkter med kWh-filtrering',
-        'work_unit': 'laddpunkter',
-        'work_time_per_unit': 6,
-        'setup_time': 10,
-        'filter_field': 'kWh 2025',
-        'filter_type': 'sum',
-        'filter_threshold': 100000,
-        'default_labor_cost': 500,
-        'default_team_size': 2,
-        'default_vehicle_cost': 2.5,
-        'default_hotel_cost': 2000,
-        'exclude_customers': ['Skistar', 'Helsingborgs Stad'],
-        'data_columns': {
-            'customer': 'Kundnamn',
-            'latitude': 'Latitud',
-            'longitude': 'Longitud',
-            'units': 'Antal uttag',
-            'filter_value': 'kWh 2025'
-        }
-    },
-    'service': {
-        'name': '🔧 Service',
-        'description': 'Fältservice med prioritering och tidsfönster',
-        'work_unit': 'serviceärenden',
-        'work_time_per_unit': 45,
-        'setup_time': 10,
-        'filter_field': 'Priority',
-        'filter_type': 'value',
-        'filter_threshold': 1,
-        'default_labor_cost': 750,
-        'default_team_size': 1,
-        'default_vehicle_cost': 3.5,
-        'default_hotel_cost': 1500,
-        'exclude_customers': [],
-        'data_columns': {
-            'customer': 'Customer Name',
-            'latitude': 'Latitude',
-            'longitude': 'Longitude',
-            'units': 'Service Type',
-            'filter_value': 'Priority'
-        }
-    }
-}
+if 'results_input' not in st.session_state:
+    st.session_state.results_input = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'artifacts' not in st.session_state:
+    st.session_state.artifacts = {}
 
 # Header
 st.markdown('<p class="main-header">🗺️ Universal Route Optimizer</p>', unsafe_allow_html=True)
@@ -143,26 +143,8 @@ with st.sidebar:
         
         # Load and preview data
         try:
-            if uploaded_file.name.endswith('.csv'):
-                # Try different separators
-                try:
-                    df = pd.read_csv(uploaded_file, encoding='utf-8-sig')
-                except:
-                    uploaded_file.seek(0)
-                    df = pd.read_csv(uploaded_file, sep=';', encoding='utf-8-sig')
-            else:
-                df = pd.read_excel(uploaded_file)
-            
-            # Normalize column names (case-insensitive, trim spaces)
-            df.columns = df.columns.str.strip()
-            
-            # Fix common column name variations
-            column_mapping = {
-                'kwh 2025': 'kWh 2025',
-                'Kwh 2025': 'kWh 2025',
-                'KWH 2025': 'kWh 2025',
-            }
-            df = df.rename(columns=column_mapping)
+            # Cachad på filens innehåll - omkörningar läser inte om filen
+            file_digest, df = upload_cache.dataframe(uploaded_file.getvalue(), uploaded_file.name)
             
             st.metric("Antal rader", len(df))
             
@@ -173,8 +155,10 @@ with st.sidebar:
         except Exception as e:
             st.error(f"❌ Fel vid laddning: {e}")
             df = None
+            file_digest = None
     else:
         df = None
+        file_digest = None
 
 # Main content
 if uploaded_file is None:
@@ -445,6 +429,29 @@ else:
             
             st.info(f"🔍 Testar {max_teams - min_teams + 1} konfigurationer med K-means optimerade hemmabaser")
             
+            time_limit = st.number_input(
+                "Tidsgräns (sekunder, 0 = ingen)",
+                min_value=0,
+                max_value=3600,
+                value=0,
+                step=10,
+                help="Optimeringen returnerar bästa hittills funna lösning när tiden är slut och kan sedan fortsätta förbättras"
+            )
+            
+            parallel_workers = st.number_input(
+                "Parallella processer (0 = alla kärnor)",
+                min_value=0,
+                max_value=64,
+                value=1,
+                help="Testar flera antal team samtidigt i separata processer"
+            )
+            
+            profile_memory = st.checkbox(
+                "Mät minnesanvändning per steg",
+                value=False,
+                help="Visar högsta minnesanvändning i Prestanda-panelen - gör optimeringen flera gånger långsammare"
+            )
+            
             # NYTT: Göteborg Weekend Work Mode
             st.divider()
             st.markdown("**🏖️ Specialläge: Göteborg Weekend Work**")
@@ -494,6 +501,24 @@ else:
                 value=3,
                 step=1
             )
+            
+            day_split = st.checkbox(
+                "Optimal dagsindelning (hemresa eller hotell)",
+                value=False,
+                help="Delar varje rutt i dagar och väljer hemresa eller hotell för varje natt efter kostnad, istället för dag för dag"
+            )
+            
+            public_holidays = st.checkbox(
+                "Lediga svenska helgdagar",
+                value=True,
+                help="Ingen arbetar på röda dagar, midsommarafton, julafton och nyårsafton (gäller även med helgarbete)"
+            )
+            
+            blackout_text = st.text_input(
+                "Spärrdatum (ÅÅÅÅ-MM-DD, kommaseparerade)",
+                value="",
+                help="Extra lediga dagar för alla team, t.ex. 2026-11-02, 2026-11-03"
+            )
         
         # ============================================================
         # HEMMABASHANTERING
@@ -551,13 +576,9 @@ else:
                     # Visa förslag baserat på data
                     if df is not None and st.button("💡 Få AI-förslag baserat på din data"):
                         with st.spinner("Analyserar datadensitet..."):
-                            from optimizer import RouteOptimizer, Location
-                            
-                            # Skapa temporära locations för analys
+                            # Platser för analys (cachade per fil och config)
                             temp_config = {'setup_time': setup_time, 'work_time_per_unit': work_time_per_unit, 'team_size': team_size}
-                            temp_optimizer = RouteOptimizer(temp_config)
-                            processed_data = temp_optimizer.load_data(df, profile)
-                            locations = temp_optimizer.create_locations(processed_data, profile)
+                            _, locations = upload_cache.processed(file_digest, df, project_type, profile, temp_config)
                             
                             # Få förslag
                             num_suggestions = min(max_teams, len(allowed_home_bases))
@@ -645,10 +666,12 @@ else:
     col1, col2, col3 = st.columns([2, 1, 1])
     
     with col1:
+        running_job = job_runner.get(st.session_state.job_id)
         optimize_button = st.button(
             "🚀 Optimera Rutt & Beräkna Kostnad",
             type="primary",
-            use_container_width=True
+            use_container_width=True,
+            disabled=running_job is not None and not running_job.finished
         )
     
     with col2:
@@ -675,12 +698,14 @@ else:
     with col3:
         if st.button("♻️ Återställ", use_container_width=True):
             st.session_state.results = None
+            st.session_state.results_input = None
             st.session_state.optimization_done = False
+            st.session_state.artifacts = {}
             st.rerun()
     
     # Run optimization
     if optimize_button:
-        with st.spinner("🔄 Optimerar rutt och beräknar kostnader... Detta kan ta någon minut."):
+        with st.spinner("🔄 Startar optimering..."):
             try:
                 # Prepare configuration
                 config = {
@@ -701,6 +726,13 @@ else:
                     'setup_time': setup_time,  # Använd user-defined värde
                     'driving_speed': 80,
                     'weekend_work_mode': weekend_work_mode,  # NYTT: Weekend work mode
+                    'day_split': day_split,
+                    'public_holidays': public_holidays,
+                    'blackout_dates': [parse_date(value).isoformat() for value in blackout_text.split(',') if value.strip()],
+                    'time_limit_s': time_limit if time_limit > 0 else None,
+                    'parallel_workers': parallel_workers,
+                    'profile_memory': profile_memory,
+                    'distance_cache_dir': DISTANCE_CACHE_DIR,
                     
                     # Hemmabashantering
                     'allowed_home_bases': allowed_home_bases if home_base_mode == 'restricted' else None,
@@ -717,17 +749,38 @@ else:
                     config['urgent_first'] = urgent_first
                     config['same_day'] = same_day
                 
-                # Run optimization
-                result = run_optimization(df, config, profile)
+                # Samma data och bara nya kostnadsparametrar: prissätt befintliga
+                # rutter om istället för att optimera igen
+                previous = st.session_state.results
+                previous_input = st.session_state.results_input
+                can_reprice = (
+                    previous is not None
+                    and previous.get('optimizer') is not None
+                    and previous_input is not None
+                    and previous_input[0] == project_type
+                    and previous_input[1] == file_digest
+                    and not requires_rerouting(st.session_state.config, config)
+                )
                 
-                if result['success']:
+                if can_reprice:
+                    result = reprice_result(previous, config)
                     st.session_state.results = result
                     st.session_state.config = config  # SAVE CONFIG TO SESSION STATE
-                    st.session_state.optimization_done = True
-                    st.success("✅ Optimering klar!")
+                    st.session_state.artifacts = {}
+                    st.success("✅ Kostnaderna omräknade för befintliga rutter!")
                     st.rerun()
                 else:
-                    st.error(f"❌ Optimering misslyckades: {result.get('error', 'Okänt fel')}")
+                    # Filtrerad data och platstabell från cachen - samma fil och
+                    # filterinställningar bearbetas inte om vid nästa optimering
+                    prepared = upload_cache.processed(file_digest, df, project_type, profile, config)
+                    
+                    # Run optimization i bakgrunden - resultatet hämtas nedan när jobbet är klart
+                    st.session_state.job_id = job_runner.submit_optimization(
+                        df, config, profile, profiling=True, prepared=prepared
+                    )
+                    st.session_state.job_input = (project_type, file_digest)
+                    st.session_state.job_config = config
+                    st.rerun()
                     
             except Exception as e:
                 st.error(f"❌ Ett fel uppstod: {str(e)}")
@@ -735,8 +788,48 @@ else:
                 with st.expander("Teknisk information"):
                     st.code(traceback.format_exc())
     
+    # Pågående optimering: förlopp, avbrytning och hämtning av resultatet
+    job = job_runner.get(st.session_state.job_id)
+    if st.session_state.job_id is not None and job is None:
+        # Jobbet finns inte längre (t.ex. efter omstart av servern)
+        st.session_state.job_id = None
+    
+    if job is not None and not job.finished:
+        st.progress(job.progress, text=f"🔄 {job.message}")
+        if st.button("⏹️ Avbryt optimering", help="Avbryter och visar bästa hittills funna lösning"):
+            job_runner.cancel(job.id)
+    elif job is not None:
+        job_runner.discard(job.id)
+        st.session_state.job_id = None
+        finished_job, job = job, None
+        # Indata för en ny optimering (saknas när ett resultat förbättrats vidare)
+        job_input = st.session_state.pop('job_input', None)
+        job_config = st.session_state.pop('job_config', None)
+        
+        if finished_job.status == 'failed':
+            st.error(f"❌ Ett fel uppstod: {finished_job.error}")
+        elif finished_job.result is None:
+            st.info("ℹ️ Optimeringen avbröts innan den startade")
+        elif finished_job.result['success']:
+            st.session_state.results = finished_job.result
+            st.session_state.artifacts = {}
+            if job_input is not None:
+                st.session_state.results_input = job_input
+                st.session_state.config = job_config  # SAVE CONFIG TO SESSION STATE
+            st.session_state.optimization_done = True
+            if finished_job.status == 'cancelled':
+                st.warning("⏹️ Optimeringen avbröts - visar bästa hittills funna lösning")
+            else:
+                st.success("✅ Optimering klar!")
+        else:
+            st.error(f"❌ Optimering misslyckades: {finished_job.result.get('error', 'Okänt fel')}")
+    
     # Display results if optimization is done
     if st.session_state.optimization_done and st.session_state.results:
+        # Tunga bibliotek laddas först när det finns resultat att visa
+        import pandas as pd
+        import plotly.express as px
+        
         result = st.session_state.results
         team_routes = result.get('team_routes', [])
         config = st.session_state.get('config', {})  # GET CONFIG FROM SESSION STATE
@@ -746,6 +839,9 @@ else:
             st.error("Ingen ruttdata tillgänglig. Försök köra optimeringen igen.")
             st.stop()
         
+        # Karta och Excel byggs först på begäran och återanvänds tills resultatet ändras
+        fingerprint = result_fingerprint(result, config)
+        
         # Results
         st.markdown("---")
         st.markdown("### 📊 Resultat")
@@ -788,6 +884,76 @@ else:
             help="Totalt alla team"
         )
         
+        # Tidsbudget: visa tid per steg och möjlighet att fortsätta förbättra
+        time_report = result.get('time_report')
+        if time_report:
+            if not result.get('complete', True):
+                st.warning("⏱️ Tidsgränsen nåddes - resultatet är bästa hittills funna lösning")
+                
+                if st.button("⏩ Fortsätt förbättra", disabled=job is not None,
+                             help="Kör vidare med samma tidsgräns (utan gräns om ingen är satt)"):
+                    st.session_state.job_id = job_runner.submit_continuation(
+                        result, config.get('time_limit_s')
+                    )
+                    st.rerun()
+            
+            with st.expander("⏱️ Tidsåtgång per steg"):
+                limit = time_report['limit_s']
+                st.caption(
+                    f"Total tid: {time_report['elapsed_s']:.1f} s"
+                    + (f" av {limit:.1f} s" if limit else "")
+                )
+                st.dataframe(pd.DataFrame([
+                    {
+                        'Steg': STAGE_NAMES.get(name, name),
+                        'Sekunder': round(stage['seconds'], 2),
+                        'Andel': f"{stage['share']:.0%}"
+                    }
+                    for name, stage in time_report['stages'].items()
+                ]), use_container_width=True, hide_index=True)
+        
+        # Prestanda: tid, CPU, anrop, avstånd och minne per steg och team-antal
+        performance = result.get('profile')
+        if performance:
+            with st.expander("⚡ Prestanda"):
+                memory = performance['peak_memory_mb']
+                perf_cols = st.columns(4)
+                perf_cols[0].metric("Total tid", f"{performance['wall_s']:.2f} s")
+                perf_cols[1].metric("CPU-tid", f"{performance['cpu_s']:.2f} s")
+                perf_cols[2].metric("Beräknade avstånd", f"{performance['distance_evaluations']:,}")
+                perf_cols[3].metric("Högsta minne", f"{memory:.0f} MB" if memory is not None else "–",
+                                    help="Aktivera minnesmätning under Avancerat")
+                
+                st.markdown("**Per steg**")
+                st.dataframe(pd.DataFrame([
+                    {
+                        'Steg': (f"  └ {STEP_NAMES.get(entry['name'], entry['name'])}" if entry['stage']
+                                 else STAGE_NAMES.get(entry['name'], entry['name'])),
+                        'Anrop': entry['calls'],
+                        'Tid (s)': round(entry['wall_s'], 3),
+                        'CPU (s)': round(entry['cpu_s'], 3),
+                        'Avstånd': entry['distance_evaluations'],
+                        'Minne (MB)': round(entry['peak_memory_mb'], 1) if entry['peak_memory_mb'] is not None else None,
+                    }
+                    for entry in performance['stages']
+                ]), use_container_width=True, hide_index=True)
+                
+                if performance['team_counts']:
+                    st.markdown("**Per antal team**")
+                    st.dataframe(pd.DataFrame([
+                        {
+                            'Antal team': entry['num_teams'],
+                            'Tid (s)': round(entry['wall_s'], 3) if entry['wall_s'] is not None else None,
+                            'CPU (s)': round(entry['cpu_s'], 3) if entry['cpu_s'] is not None else None,
+                            'Avstånd': entry['distance_evaluations'],
+                            'Minne (MB)': round(entry['peak_memory_mb'], 1) if entry['peak_memory_mb'] is not None else None,
+                            'Total kostnad': f"{entry['total_cost']:,.0f} kr" if 'total_cost' in entry else None,
+                        }
+                        for entry in performance['team_counts']
+                    ]), use_container_width=True, hide_index=True)
+                    if any(entry['wall_s'] is None for entry in performance['team_counts']):
+                        st.caption("Team-antal som testats i parallella processer saknar mätvärden")
+        
         # Visa optimerade hemmabaser
         if 'best_result' in result and 'home_bases' in result['best_result']:
             st.markdown("---")
@@ -808,6 +974,10 @@ else:
                 help="Systemet placerade hemmabaser där dina uttag finns koncentrerade"
             )
         
+        def get_schedule():
+            # Utplattat schema, delas av Excel-planen och kostnadsnedbrytningen
+            return get_artifact('schedule', fingerprint, lambda: schedule_frame(team_routes))
+        
         # Tabs for results
         result_tabs = st.tabs(["📈 Översikt", "🗺️ Karta", "📋 Detaljplan", "💰 Kostnadsnedbrytning"])
         
@@ -878,36 +1048,36 @@ else:
             st.markdown("#### Interaktiv Karta")
             st.info("🗺️ Kartan visar alla planerade rutter färgkodade per team")
             
-            try:
-                # Hämta obesökta platser från results
-                all_locations = result.get('all_locations', [])
-                unassigned_locations = result.get('unassigned_locations', [])
-                
+            def build_map() -> str:
                 # Skapa lista med besökta platser (alla platser i segments)
-                visited_locations = []
-                for route in team_routes:
-                    for segment in route.segments:
-                        visited_locations.append(segment.location)
-                
-                # Generate map med obesökta platser
-                map_html = create_route_map(
-                    team_routes, 
+                visited_locations = [segment.location for route in team_routes for segment in route.segments]
+                return create_route_map(
+                    team_routes,
                     config if config else {},
-                    all_locations=all_locations,
+                    all_locations=result.get('all_locations', []),
                     visited_locations=visited_locations
                 )
+            
+            try:
+                map_html = get_artifact('map_html', fingerprint)
+                if map_html is None and st.button("🗺️ Visa karta", use_container_width=True):
+                    with st.spinner("Skapar karta..."):
+                        map_html = get_artifact('map_html', fingerprint, build_map)
                 
-                # Display map
-                st.components.v1.html(map_html, height=600, scrolling=True)
-                
-                # Download button
-                st.download_button(
-                    "📥 Ladda ner interaktiv HTML-karta",
-                    data=map_html,
-                    file_name=f"route_map_{datetime.now().strftime('%Y%m%d_%H%M')}.html",
-                    mime="text/html",
-                    use_container_width=True
-                )
+                if map_html is None:
+                    st.caption("Kartan skapas när du klickar och sparas sedan tills resultatet ändras")
+                else:
+                    # Display map
+                    st.components.v1.html(map_html, height=600, scrolling=True)
+                    
+                    # Download button
+                    st.download_button(
+                        "📥 Ladda ner interaktiv HTML-karta",
+                        data=map_html,
+                        file_name=f"route_map_{datetime.now().strftime('%Y%m%d_%H%M')}.html",
+                        mime="text/html",
+                        use_container_width=True
+                    )
             except Exception as e:
                 st.error(f"Kunde inte skapa karta: {e}")
                 with st.expander("Teknisk information"):
@@ -920,19 +1090,25 @@ else:
             st.info("📄 Excel-filen innehåller 3 flikar:\n- **Sammanfattning**: Översikt per team\n- **Detaljerat Schema**: Varje besök med restider\n- **Daglig Ruttanalys**: Sammanfattning per dag")
             
             try:
-                # Generate Excel
-                excel_bytes = create_excel_report(team_routes, config if config else {})
-                
-                # Download button
-                st.download_button(
-                    "📥 Ladda ner komplett Excel-plan",
-                    data=excel_bytes,
-                    file_name=f"optimerad_plan_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+                excel_bytes = get_artifact('excel', fingerprint)
+                if excel_bytes is None and st.button("📄 Skapa Excel-plan", use_container_width=True):
+                    with st.spinner("Skapar Excel-rapport..."):
+                        excel_bytes = get_artifact(
+                            'excel', fingerprint,
+                            lambda: create_excel_report(team_routes, config if config else {}, get_schedule())
+                        )
                 
-                st.success(f"✅ Excel-rapport genererad med {len(team_routes)} team och {result['total_locations']} platser")
+                if excel_bytes is not None:
+                    # Download button
+                    st.download_button(
+                        "📥 Ladda ner komplett Excel-plan",
+                        data=excel_bytes,
+                        file_name=f"optimerad_plan_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        use_container_width=True
+                    )
+                    
+                    st.success(f"✅ Excel-rapport genererad med {len(team_routes)} team och {result['total_locations']} platser")
                 
             except Exception as e:
                 st.error(f"Kunde inte skapa Excel: {e}")
@@ -1004,8 +1180,13 @@ else:
                 
                 st.caption(f"💡 Kostnad per område: {result['cost_per_location']:,.0f} kr")
                 if project_type == 'migration':
-                    total_units = sum(s.location.units for r in team_routes for s in r.segments)
+                    total_units = get_schedule()['Enheter'].sum()
                     st.caption(f"💡 Kostnad per {profile['work_unit']}: {result['total_cost']/total_units:,.0f} kr")
+                if result.get('day_split_saving', 0) > 0:
+                    st.caption(f"💡 Optimal dagsindelning sparade {result['day_split_saving']:,.0f} kr mot dag-för-dag-planering")
+            
+            with st.expander("📅 Daglig ruttanalys"):
+                st.dataframe(daily_summary(get_schedule()), use_container_width=True, hide_index=True)
 
 # Footer
 st.divider()
@@ -1015,3 +1196,9 @@ st.markdown("""
     <p>Optimerad ruttplanering för Migration och Service med faktisk algoritm</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Uppdatera förloppet tills bakgrundsjobbet är klart
+active_job = job_runner.get(st.session_state.job_id)
+if active_job is not None and not active_job.finished:
+    time.sleep(JOB_POLL_INTERVAL_S)
+    st.rerun()
@@ -0,0 +1,476 @@
+"""
+Benchmark Module
+Reproducerbara benchmarks på syntetiska svenska instanser
+
+Genererar data för Migration- och Service-profilen med platser samlade runt
+HomeBaseManager.AVAILABLE_CITIES, kör hela run_optimization samt varje steg
+för sig och skriver resultatet (tid, minne, kostnad och skalningskurvor) som
+JSON. Två JSON-filer kan jämföras för att hitta regressioner mellan versioner.
+Importtiden för optimizer, excel_export och map_visualization mäts i nya
+processer mot en budget (IMPORT_BUDGETS_S) - tunga beroenden ska laddas
+först när de används.
+
+Användning:
+    python benchmark.py --sizes 100 1000 10000 100000 --output benchmark.json
+    python benchmark.py --sizes 100 1000 --compare benchmark.json
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from optimizer import HomeBaseManager, RouteOptimizer, run_optimization
+from profiles import PROFILES, default_config
+
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+# Över så här många platser körs bara de steg som skalar (inläsning och
+# fördelning) - hela kedjan bygger rutter med tiotusentals stopp per team
+DEFAULT_MAX_PIPELINE_SITES = 10000
+
+# Spridning runt respektive stad (grader)
+CITY_SPREAD_DEG = (0.25, 0.4)
+
+# Tidsökning (kvot) som räknas som regression vid jämförelse
+REGRESSION_THRESHOLD = 1.2
+
+# Importtid (s) i en ny process som modulerna ska hålla sig under
+IMPORT_BUDGETS_S = {
+    'optimizer': 0.3,
+    'excel_export': 0.1,
+    'map_visualization': 0.2,
+}
+
+# Tunga beroenden som ska laddas först när de används, inte vid import
+HEAVY_MODULES = ('pandas', 'scipy', 'sklearn', 'folium', 'plotly', 'xlsxwriter')
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'heavy': [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def generate_dataset(profile_name: str, num_sites: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Syntetiska platser samlade runt städerna i HomeBaseManager.AVAILABLE_CITIES
+    
+    Samma profil, storlek och seed ger alltid samma data.
+    """
+    rng = np.random.default_rng(seed)
+    cities = np.array([(lat, lon) for lat, lon, _ in HomeBaseManager.AVAILABLE_CITIES])
+    
+    city = rng.integers(0, len(cities), num_sites)
+    latitudes = cities[city, 0] + rng.normal(0, CITY_SPREAD_DEG[0], num_sites)
+    longitudes = cities[city, 1] + rng.normal(0, CITY_SPREAD_DEG[1], num_sites)
+    
+    columns = PROFILES[profile_name]['data_columns']
+    customers = [f"Kund {i}" for i in rng.integers(0, max(num_sites // 5, 1), num_sites)]
+    
+    if profile_name == 'migration':
+        units = rng.integers(1, 13, num_sites)
+        filter_values = rng.integers(50000, 400000, num_sites)
+    else:
+        units = rng.integers(1, 4, num_sites)
+        filter_values = rng.integers(1, 4, num_sites)  # Prioritet 1-3
+    
+    return pd.DataFrame({
+        columns['customer']: customers,
+        columns['latitude']: latitudes,
+        columns['longitude']: longitudes,
+        columns['units']: units,
+        columns['filter_value']: filter_values,
+    })
+
+
+def benchmark_config(profile_name: str) -> Dict:
+    """Config med profilens standardvärden där inga platser filtreras bort"""
+    config = default_config(profile_name)
+    config.update({
+        'max_teams': 8,
+        'min_filter_value': 0,
+        'exclude_customers': [],
+        'priority_threshold': 3,
+    })
+    return config
+
+
+@contextlib.contextmanager
+def _measure(results: Dict, name: str, memory: bool):
+    """Mäter väggtid, CPU-tid och (med memory) högsta minne för ett block"""
+    if memory:
+        tracemalloc.start()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        entry = {
+            'wall_s': time.perf_counter() - wall,
+            'cpu_s': time.process_time() - cpu,
+            'peak_memory_mb': None,
+        }
+        if memory:
+            entry['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        results[name] = entry
+
+
+def run_stages(df: pd.DataFrame, config: Dict, profile: Dict,
+               max_pipeline_sites: int, memory: bool = False) -> Dict:
+    """
+    Kör varje steg för sig för min_teams team
+    
+    Returns:
+        Dictionary med stages (namn -> wall_s, cpu_s, peak_memory_mb) och
+        total_cost för rutterna (None om ruttstegen hoppades över)
+    """
+    optimizer = RouteOptimizer(config)
+    stages: Dict[str, Dict] = {}
+    
+    with _measure(stages, 'load', memory):
+        data = optimizer.load_data(df, profile)
+        optimizer.create_locations(data, profile)
+    
+    # Hela matrisen byggs bara upp till full_matrix_max_locations platser
+    if optimizer._use_full_matrix():
+        with _measure(stages, 'distance_matrix', memory):
+            optimizer.build_full_matrix()
+    
+    teams = optimizer.create_teams(config['min_teams'])
+    
+    with _measure(stages, 'distribute', memory):
+        assignments = optimizer.distribute_locations(teams)
+    
+    if len(optimizer.location_table) > max_pipeline_sites:
+        return {'stages': stages, 'total_cost': None}
+    
+    routes = {}
+    with _measure(stages, 'nearest_neighbour', memory):
+        for team in teams:
+            if assignments[team.id]:
+                routes[team.id] = optimizer.build_nearest_neighbour_route(assignments[team.id], team.home_base)
+    
+    with _measure(stages, 'route_search', memory):
+        home_bases = {team.id: team.home_base for team in teams}
+        routes = {team_id: optimizer.improve_route(route, home_bases[team_id])
+                  for team_id, route in routes.items()}
+    
+    with _measure(stages, 'fleet_search', memory):
+        if len(routes) > 1:
+            routes = optimizer.improve_fleet(teams, routes)
+    
+    with _measure(stages, 'scheduling', memory):
+        team_routes = optimizer.build_team_routes(teams, routes)
+    
+    return {'stages': stages, 'total_cost': sum(tr.total_cost for tr in team_routes)}
+
+
+def run_case(profile_name: str, num_sites: int, seed: int = 0,
+             max_pipeline_sites: int = DEFAULT_MAX_PIPELINE_SITES,
+             memory: bool = False, time_limit_s: Optional[float] = None) -> Dict:
+    """
+    Kör en benchmark: hela run_optimization och varje steg för sig
+    
+    Args:
+        profile_name: 'migration' eller 'service'
+        num_sites: Antal platser
+        seed: Slumpfrö för datan
+        max_pipeline_sites: Största antal platser som hela kedjan körs för
+        memory: Mät högsta minne per steg med tracemalloc (långsammare)
+        time_limit_s: Tidsgräns för run_optimization (None = ingen)
+    """
+    df = generate_dataset(profile_name, num_sites, seed)
+    profile = PROFILES[profile_name]
+    config = benchmark_config(profile_name)
+    
+    case = {'profile': profile_name, 'sites': num_sites, 'seed': seed}
+    
+    if num_sites <= max_pipeline_sites:
+        pipeline_config = {**config, 'profile_memory': memory, 'time_limit_s': time_limit_s}
+        result = run_optimization(df, pipeline_config, profile, profiling=True)
+        
+        performance = result['profile']
+        case['pipeline'] = {
+            'wall_s': performance['wall_s'],
+            'cpu_s': performance['cpu_s'],
+            'peak_memory_mb': performance['peak_memory_mb'],
+            'distance_evaluations': performance['distance_evaluations'],
+            'complete': result['complete'],
+            'optimal_teams': result['optimal_teams'],
+            'total_cost': result['total_cost'],
+            'cost_per_location': result['cost_per_location'],
+            'total_days': result['total_days'],
+            'stages': performance['stages'],
+        }
+    else:
+        case['pipeline'] = {'skipped': f"fler än {max_pipeline_sites} platser"}
+    
+    case['isolated'] = run_stages(df, config, profile, max_pipeline_sites, memory)
+    
+    case['peak_rss_mb'] = _peak_rss_mb()
+    return case
+
+
+def scaling_curves(cases: Sequence[Dict]) -> Dict:
+    """
+    Skalningsexponent (lutning i log-log) för tiden per profil och steg
+    
+    Exponenten k betyder att tiden växer ungefär som antal platser^k.
+    """
+    series: Dict[str, Dict[str, List]] = {}
+    
+    for case in cases:
+        curves = series.setdefault(case['profile'], {})
+        if 'wall_s' in case['pipeline']:
+            curves.setdefault('pipeline', []).append((case['sites'], case['pipeline']['wall_s']))
+        for name, stage in case['isolated']['stages'].items():
+            curves.setdefault(name, []).append((case['sites'], stage['wall_s']))
+    
+    curves_out = {}
+    for profile_name, curves in series.items():
+        curves_out[profile_name] = {}
+        for name, points in curves.items():
+            points = sorted(points)
+            exponent = None
+            valid = [(n, t) for n, t in points if n > 0 and t > 0]
+            if len({n for n, _ in valid}) >= 2:
+                x = np.log([n for n, _ in valid])
+                y = np.log([t for _, t in valid])
+                exponent = float(np.polyfit(x, y, 1)[0])
+            curves_out[profile_name][name] = {'exponent': exponent, 'points': [list(p) for p in points]}
+    
+    return curves_out
+
+
+def measure_imports(budgets: Dict[str, float] = IMPORT_BUDGETS_S, repeats: int = 3) -> Dict:
+    """
+    Importtid per modul i nya processer (bästa av repeats, utan
+    Python-uppstart) och vilka tunga beroenden importen laddar
+    """
+    imports = {}
+    
+    for module, budget in budgets.items():
+        runs = []
+        for _ in range(repeats):
+            completed = subprocess.run(
+                [sys.executable, '-c', _IMPORT_SCRIPT, module, *HEAVY_MODULES],
+                cwd=Path(__file__).parent, capture_output=True, text=True, check=True, timeout=120
+            )
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        
+        seconds = min(run['seconds'] for run in runs)
+        imports[module] = {
+            'seconds': seconds,
+            'budget_s': budget,
+            'within_budget': seconds <= budget,
+            'heavy_modules': runs[0]['heavy'],
+        }
+    
+    return imports
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[Dict]:
+    """
+    Jämför två benchmarkresultat
+    
+    Returns:
+        En rad per gemensamt fall och mätvärde där tiden ökat mer än
+        threshold gånger eller kostnaden ökat
+    """
+    def key(case):
+        return case['profile'], case['sites'], case['seed']
+    
+    baseline_cases = {key(case): case for case in baseline['cases']}
+    regressions = []
+    
+    for case in current['cases']:
+        old = baseline_cases.get(key(case))
+        if old is None:
+            continue
+        
+        timings = [('pipeline', old['pipeline'].get('wall_s'), case['pipeline'].get('wall_s'))]
+        timings += [
+            (name, old['isolated']['stages'].get(name, {}).get('wall_s'), stage['wall_s'])
+            for name, stage in case['isolated']['stages'].items()
+        ]
+        
+        for name, before, after in timings:
+            # Mycket korta steg varierar för mycket för att jämföras
+            if before and after and max(before, after) > 0.05 and after / before > threshold:
+                regressions.append({'profile': case['profile'], 'sites': case['sites'],
+                                    'metric': f"{name} (s)", 'before': before, 'after': after})
+        
+        costs = [('pipeline', old['pipeline'].get('total_cost'), case['pipeline'].get('total_cost')),
+                 ('isolated', old['isolated']['total_cost'], case['isolated']['total_cost'])]
+        for name, before, after in costs:
+            if before is not None and after is not None and after > before * (1 + 1e-9):
+                regressions.append({'profile': case['profile'], 'sites': case['sites'],
+                                    'metric': f"{name} kostnad (kr)", 'before': before, 'after': after})
+    
+    for module, measured in current.get('imports', {}).items():
+        before = baseline.get('imports', {}).get(module, {}).get('seconds')
+        after = measured['seconds']
+        if before and max(before, after) > 0.05 and after / before > threshold:
+            regressions.append({'profile': 'import', 'sites': 0,
+                                'metric': f"import {module} (s)", 'before': before, 'after': after})
+    
+    return regressions
+
+
+def run_benchmarks(profiles: Sequence[str], sizes: Sequence[int], seed: int = 0,
+                   max_pipeline_sites: int = DEFAULT_MAX_PIPELINE_SITES,
+                   memory: bool = False, time_limit_s: Optional[float] = None,
+                   isolate: bool = True, imports: bool = True) -> Dict:
+    """
+    Kör alla fall (varje fall i en egen process om isolate, så att
+    minnestoppen per fall blir rättvisande) och sammanställer resultatet
+    
+    Med imports mäts även importtiden för modulerna i IMPORT_BUDGETS_S.
+    """
+    cases = []
+    
+    for profile_name in profiles:
+        for num_sites in sizes:
+            print(f"▶ {profile_name} {num_sites:>7,} platser ...", end=' ', flush=True)
+            args = (profile_name, num_sites, seed, max_pipeline_sites, memory, time_limit_s)
+            
+            if isolate:
+                with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+                    case = pool.apply(run_case, args)
+            else:
+                case = run_case(*args)
+            
+            cases.append(case)
+            pipeline = case['pipeline']
+            if 'wall_s' in pipeline:
+                print(f"{pipeline['wall_s']:.2f} s, {pipeline['total_cost']:,.0f} kr")
+            else:
+                print(f"bara steg ({pipeline['skipped']})")
+    
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'settings': {
+            'seed': seed,
+            'max_pipeline_sites': max_pipeline_sites,
+            'memory': memory,
+            'time_limit_s': time_limit_s,
+        },
+        'cases': cases,
+        'scaling': scaling_curves(cases),
+        'imports': measure_imports() if imports else {},
+    }
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Processens högsta minnesanvändning (RSS), None där det inte går att läsa"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux anger kB, macOS byte
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def _environment() -> Dict:
+    """Version och plattform, så att resultat kan jämföras mellan körningar"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks för Route Optimizer")
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=sorted(PROFILES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-pipeline-sites', type=int, default=DEFAULT_MAX_PIPELINE_SITES,
+                        help="Största antal platser som hela kedjan körs för")
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help="Tidsgräns (s) för run_optimization per fall")
+    parser.add_argument('--memory', action='store_true',
+                        help="Mät högsta minne per steg med tracemalloc (långsammare)")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Kör alla fall i samma process")
+    parser.add_argument('--output', type=Path, default=Path('benchmark.json'))
+    parser.add_argument('--compare', type=Path, default=None,
+                        help="Tidigare resultat att jämföra med")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Tidskvot som räknas som regression")
+    args = parser.parse_args(argv)
+    
+    results = run_benchmarks(
+        args.profiles, args.sizes, args.seed, args.max_pipeline_sites,
+        args.memory, args.time_limit, isolate=not args.in_process
+    )
+    
+    args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"\n💾 Resultat sparat i {args.output}")
+    
+    print("\nSkalning (tid ~ platser^k):")
+    for profile_name, curves in results['scaling'].items():
+        exponents = ', '.join(
+            f"{name} {curve['exponent']:.2f}" for name, curve in curves.items()
+            if curve['exponent'] is not None and not math.isnan(curve['exponent'])
+        )
+        print(f"  {profile_name}: {exponents or '-'}")
+    
+    print("\nImporttid (ny process):")
+    over_budget = []
+    for module, measured in results['imports'].items():
+        heavy = f", laddar {', '.join(measured['heavy_modules'])}" if measured['heavy_modules'] else ''
+        mark = '✅' if measured['within_budget'] else '❌'
+        print(f"  {mark} import {module}: {measured['seconds']*1000:.0f} ms "
+              f"(budget {measured['budget_s']*1000:.0f} ms{heavy})")
+        if not measured['within_budget']:
+            over_budget.append(module)
+    
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text(encoding='utf-8'))
+        regressions = compare(baseline, results, args.threshold)
+        
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressioner mot {args.compare}:")
+            for row in regressions:
+                case = f"{row['profile']} {row['sites']:,} platser, " if row['sites'] else ''
+                print(f"  {case}{row['metric']}: {row['before']:,.2f} -> {row['after']:,.2f}")
+            return 1
+        
+        print(f"\n✅ Inga regressioner mot {args.compare}")
+    
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+CLI Module
+Kör optimeringar från kommandoraden utan Streamlit (t.ex. nattliga batchkörningar med cron)
+
+Varje indatafil optimeras med samma profil och config, och resultatet skrivs
+som Excel-plan, CSV-schema och HTML-karta i utdatamappen (och med
+--formats parquet som resultatpaket som kan läsas in igen). Alla filer körs i
+samma process och delar diskcachen för avståndsmatriser (samma som appen
+använder som standard). Filer med identiskt innehåll optimeras bara en gång.
+
+Config-filen är JSON med samma nycklar som appen skickar till
+run_optimization; nycklar som saknas får appens standardvärden för profilen.
+En sammanfattning av körningen skrivs till batch_sammanfattning.json.
+
+Användning:
+    python cli.py data/*.xlsx --profile migration --config natt.json --output-dir ut/
+    python cli.py service.csv --profile service --formats xlsx --time-limit 600
+
+Avslutas med kod 0 om alla filer lyckades, 1 om någon misslyckades.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from data_loading import SUPPORTED_EXTENSIONS, read_locations_file
+from excel_export import create_csv_export, schedule_frame, write_excel_report
+from map_visualization import create_route_map
+from observers import PrintObserver
+from optimizer import run_optimization
+from profiles import PROFILES, default_config
+from result_io import save_result
+
+
+# Samma diskcache som appen, så att körningar i appen och batch delar matriser
+DEFAULT_DISTANCE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.distance_cache')
+
+# Utdataformat och filnamnens ändelse ('parquet' är en mapp, se result_io.py)
+OUTPUT_FORMATS = {
+    'xlsx': '_plan.xlsx',
+    'csv': '_schema.csv',
+    'html': '_karta.html',
+    'parquet': '_resultat',
+}
+
+# Skrivs om --formats inte anges
+DEFAULT_FORMATS = ('xlsx', 'csv', 'html')
+
+SUMMARY_FILENAME = 'batch_sammanfattning.json'
+
+
+def load_config(path: Optional[Path], profile_name: str) -> Dict:
+    """Profilens standardconfig uppdaterad med nycklarna i JSON-filen"""
+    config = default_config(profile_name)
+    
+    if path is not None:
+        overrides = json.loads(Path(path).read_text(encoding='utf-8'))
+        if not isinstance(overrides, dict):
+            raise ValueError(f"Config-filen {path} måste innehålla ett JSON-objekt")
+        if overrides.get('team_assignments'):
+            # JSON-nycklar är alltid text - create_teams jämför team-ID som int
+            try:
+                overrides['team_assignments'] = {
+                    int(team_id): city for team_id, city in overrides['team_assignments'].items()
+                }
+            except ValueError:
+                raise ValueError(f"team_assignments i {path} måste ha team-ID som nycklar") from None
+        config.update(overrides)
+    
+    return config
+
+
+def expand_inputs(patterns: Sequence[str]) -> List[Path]:
+    """Sökvägar för argumenten (glob-mönster expanderas, dubbletter tas bort)"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise ValueError(f"Inga filer matchar {pattern}")
+        for match in matches:
+            path = Path(match)
+            if path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+                raise ValueError(f"Filtypen stöds inte: {path} (använd {', '.join(SUPPORTED_EXTENSIONS)})")
+            if path not in paths:
+                paths.append(path)
+    
+    return paths
+
+
+def _output_stems(paths: Sequence[Path]) -> List[str]:
+    """Filnamnsprefix per indatafil (numreras om flera filer har samma namn)"""
+    stems = []
+    for path in paths:
+        stem = path.stem
+        candidate = stem
+        suffix = 2
+        while candidate in stems:
+            candidate = f"{stem}_{suffix}"
+            suffix += 1
+        stems.append(candidate)
+    return stems
+
+
+def write_outputs(result: Dict, config: Dict, output_dir: Path, stem: str,
+                  formats: Sequence[str], profile: Optional[Dict] = None) -> Dict[str, str]:
+    """Skriver plan, schema, karta och resultatpaket för ett resultat och returnerar sökvägarna"""
+    team_routes = result['team_routes']
+    written = {}
+    
+    # Schemat plattas ut en gång för både Excel och CSV
+    schedule = schedule_frame(team_routes) if {'xlsx', 'csv'} & set(formats) else None
+    
+    for output_format in formats:
+        path = output_dir / f"{stem}{OUTPUT_FORMATS[output_format]}"
+        
+        if output_format == 'xlsx':
+            write_excel_report(team_routes, config, path, schedule)
+        elif output_format == 'csv':
+            path.write_bytes(create_csv_export(team_routes, schedule))
+        elif output_format == 'parquet':
+            save_result(result, path, config, profile)
+        else:
+            visited_locations = [
+                segment.location for route in team_routes for segment in route.segments
+            ]
+            map_html = create_route_map(
+                team_routes, config,
+                all_locations=result.get('all_locations', []),
+                visited_locations=visited_locations
+            )
+            path.write_text(map_html, encoding='utf-8')
+        
+        written[output_format] = str(path)
+    
+    return written
+
+
+def run_batch(paths: Sequence[Path], profile_name: str, config: Dict, output_dir: Path,
+              formats: Sequence[str] = DEFAULT_FORMATS, verbose: bool = False) -> Dict:
+    """
+    Optimerar varje fil och skriver dess utdata
+    
+    Ett fel i en fil stoppar inte de övriga; det registreras i sammanfattningen.
+    
+    Returns:
+        Sammanfattning med en rad per fil
+    """
+    profile = PROFILES[profile_name]
+    output_dir.mkdir(parents=True, exist_ok=True)
+    observer = PrintObserver() if verbose else None
+    
+    # Resultat per filinnehåll - samma data optimeras bara en gång
+    results_by_digest: Dict[str, Dict] = {}
+    files = []
+    started = time.perf_counter()
+    
+    for path, stem in zip(paths, _output_stems(paths)):
+        entry = {'input': str(path), 'success': False}
+        file_started = time.perf_counter()
+        print(f"▶️ {path}")
+        
+        try:
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()
+            result = results_by_digest.get(digest)
+            
+            if result is None:
+                df = read_locations_file(path)
+                result = run_optimization(df, config, profile, observer=observer)
+                results_by_digest[digest] = result
+            else:
+                entry['reused'] = True
+            
+            if not result['success']:
+                entry['error'] = result.get('error', 'Okänt fel')
+            else:
+                entry.update({
+                    'success': True,
+                    'optimal_teams': result['optimal_teams'],
+                    'total_cost': result['total_cost'],
+                    'total_days': result['total_days'],
+                    'total_locations': result['total_locations'],
+                    'cost_per_location': result['cost_per_location'],
+                    'complete': result['complete'],
+                    'outputs': write_outputs(result, config, output_dir, stem, formats, profile),
+                })
+        except Exception as e:
+            entry['error'] = f"{type(e).__name__}: {e}"
+        
+        entry['duration_s'] = time.perf_counter() - file_started
+        files.append(entry)
+        
+        if entry['success']:
+            print(f"   ✅ {entry['optimal_teams']} team, {entry['total_cost']:,.0f} kr, "
+                  f"{entry['total_days']} dagar ({entry['duration_s']:.1f} s)")
+        else:
+            print(f"   ❌ {entry['error']}")
+    
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'profile': profile_name,
+        'duration_s': time.perf_counter() - started,
+        'succeeded': sum(entry['success'] for entry in files),
+        'failed': sum(not entry['success'] for entry in files),
+        'files': files,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Optimera rutter för en eller flera filer utan Streamlit")
+    parser.add_argument('inputs', nargs='+', help="Excel-/CSV-filer eller glob-mönster")
+    parser.add_argument('--profile', choices=sorted(PROFILES), required=True,
+                        help="Uppdragstyp")
+    parser.add_argument('--config', type=Path, default=None,
+                        help="JSON-fil med config (saknade nycklar får standardvärden)")
+    parser.add_argument('--output-dir', type=Path, default=Path('resultat'))
+    parser.add_argument('--formats', nargs='+', choices=list(OUTPUT_FORMATS),
+                        default=list(DEFAULT_FORMATS),
+                        help="Utdata som skrivs per fil (parquet = resultatpaket för result_io.load_result)")
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help="Tidsgräns (s) per fil, ersätter time_limit_s i config")
+    parser.add_argument('--distance-cache-dir', default=None,
+                        help="Diskcache för avståndsmatriser (standard: appens cache)")
+    parser.add_argument('--no-distance-cache', action='store_true',
+                        help="Använd ingen diskcache")
+    parser.add_argument('--verbose', action='store_true',
+                        help="Skriv optimeringens förlopp")
+    args = parser.parse_args(argv)
+    
+    try:
+        paths = expand_inputs(args.inputs)
+        config = load_config(args.config, args.profile)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    
+    if args.time_limit is not None:
+        config['time_limit_s'] = args.time_limit if args.time_limit > 0 else None
+    if args.no_distance_cache:
+        config['distance_cache_dir'] = None
+    elif args.distance_cache_dir is not None:
+        config['distance_cache_dir'] = args.distance_cache_dir
+    else:
+        config.setdefault('distance_cache_dir', DEFAULT_DISTANCE_CACHE_DIR)
+    
+    summary = run_batch(paths, args.profile, config, args.output_dir, args.formats, args.verbose)
+    
+    summary_path = args.output_dir / SUMMARY_FILENAME
+    summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"\n💾 {summary['succeeded']} av {len(summary['files'])} filer klara, "
+          f"sammanfattning i {summary_path}")
+    
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
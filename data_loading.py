@@ -0,0 +1,57 @@
+"""
+Data Loading Module
+Läser in Excel-/CSV-filer med platser
+
+Delas av appen (uppladdade filer) och kommandoradsverktyget (filer på disk).
+"""
+
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Filändelser som kan läsas
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
+# Vanliga varianter av kolumnnamn
+COLUMN_MAPPING = {
+    'kwh 2025': 'kWh 2025',
+    'Kwh 2025': 'kWh 2025',
+    'KWH 2025': 'kWh 2025',
+}
+
+
+def read_locations_file(source: Union[str, Path, BinaryIO], filename: str = None) -> 'pd.DataFrame':
+    """
+    Läser en Excel- eller CSV-fil och normaliserar kolumnnamnen
+    
+    Args:
+        source: Sökväg eller öppen fil (t.ex. Streamlits UploadedFile)
+        filename: Filnamn som avgör formatet (standard: source om det är en sökväg)
+    
+    Returns:
+        DataFrame med trimmade kolumnnamn
+    """
+    import pandas as pd
+    
+    if filename is None:
+        filename = str(source)
+    
+    if filename.lower().endswith('.csv'):
+        # Prova komma först och sedan semikolon (svensk Excel-export ger
+        # semikolon, som med komma läses som en enda kolumn)
+        try:
+            df = pd.read_csv(source, encoding='utf-8-sig')
+        except Exception:
+            df = None
+        if df is None or len(df.columns) == 1:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            df = pd.read_csv(source, sep=';', encoding='utf-8-sig')
+    else:
+        df = pd.read_excel(source)
+    
+    df.columns = df.columns.str.strip()
+    return df.rename(columns=COLUMN_MAPPING)
@@ -0,0 +1,158 @@
+"""
+Day Split Module
+Kostnadsoptimal indelning av en ordnad rutt i arbetsdagar ("split")
+
+Ruttens ordning är given. Varje dag är en sammanhängande följd av stopp och
+varje natt (utom den sista) tillbringas hemma eller på hotell:
+    
+    hemma:   nästa dag börjar med körning från hemmabasen. Tillåtet om
+             dagens körning plus hemresan ryms i max_drive_hours
+    hotell:  nästa dag börjar vid föregående stopp; kostar en hotellnatt
+
+Kostnaden är densamma som calculate_team_costs räknar för segmenten:
+körtid (med pauser och navigering) gånger timkostnad, körsträcka gånger
+kilometerkostnad och hotellnätter. Arbetstiden är oberoende av indelningen.
+
+Dynamisk programmering över stoppen med prefixsummor för arbetstid och
+körning inom dagen ger O(n·k), där k är största antal stopp per dag.
+"""
+
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+
+# Nattens typ efter en dag
+HOME = 0
+HOTEL = 1
+
+
+@dataclass
+class DaySplit:
+    """Indelning av en rutt i dagar"""
+    day_starts: List[int]      # Index för varje dags första stopp
+    hotel_after: np.ndarray    # True för stopp som följs av en hotellnatt
+    cost: float                # Körning och hotellnätter (kr)
+
+
+def leg_hours(distance: np.ndarray, driving_speed: float, pause_time: float,
+              navigation_time: float = 0.0) -> np.ndarray:
+    """
+    Körtid (h) för sträckor som calculate_route_segments räknar den
+    
+    En paus per påbörjade två timmars körning (avrundat nedåt) och
+    navigeringstid per besök. pause_time och navigation_time anges i timmar.
+    """
+    drive = np.asarray(distance, dtype=float) / driving_speed
+    return drive + np.floor(drive / 2) * pause_time + navigation_time
+
+
+def optimal_day_split(dist: np.ndarray, home_dist: np.ndarray, work_times: np.ndarray,
+                      work_hours: float, max_drive_hours: float, driving_speed: float,
+                      pause_time: float, navigation_time: float,
+                      hourly_cost: float, km_cost: float, hotel_night_cost: float,
+                      allow_home_nights: bool = True) -> DaySplit:
+    """
+    Billigaste indelning i dagar och nätter för en ordnad rutt
+    
+    En dag får ha högst work_hours arbete och max_drive_hours körning; ett
+    ensamt stopp som bryter mot gränserna får ändå en egen dag (som i
+    calculate_route_segments).
+    
+    Args:
+        dist: Avstånd mellan ruttens platser i ruttens ordning (n x n)
+        home_dist: Avstånd från hemmabasen till varje plats (n)
+        work_times: Arbetstid per plats (h)
+        work_hours: Max arbetstid per dag (h)
+        max_drive_hours: Max körtid per dag (h)
+        driving_speed: Hastighet (km/h)
+        pause_time: Paus per två timmars körning (h)
+        navigation_time: Navigeringstid per besök (h)
+        hourly_cost: Kostnad per körtimme för hela teamet
+        km_cost: Kostnad per km
+        hotel_night_cost: Kostnad per hotellnatt för hela teamet
+        allow_home_nights: False om teamet aldrig åker hem mellan dagarna
+    
+    Returns:
+        DaySplit med dagarnas startindex, hotellnätter och kostnad
+    """
+    n = len(home_dist)
+    if n == 0:
+        return DaySplit([], np.zeros(0, dtype=bool), 0.0)
+    
+    home_dist = np.asarray(home_dist, dtype=float)
+    work_times = np.asarray(work_times, dtype=float)
+    
+    # Sträcka in till stopp i från föregående stopp (index 0 används inte)
+    inner_km = np.zeros(n)
+    inner_km[1:] = np.asarray(dist, dtype=float)[np.arange(n - 1), np.arange(1, n)]
+    inner_h = leg_hours(inner_km, driving_speed, pause_time, navigation_time)
+    inner_h[0] = 0.0
+    home_h = leg_hours(home_dist, driving_speed, pause_time, navigation_time)
+    return_h = leg_hours(home_dist, driving_speed, pause_time)
+    
+    # Prefixsummor: körning inom en dag [i, j) är cum[j-1] - cum[i]
+    cum_h = np.cumsum(inner_h)
+    cum_km = np.cumsum(inner_km)
+    cum_work = np.concatenate(([0.0], np.cumsum(work_times)))
+    
+    # best[j, s]: billigaste kostnad för stopp [0, j) med natten s efter stopp j-1
+    best = np.full((n + 1, 2), np.inf)
+    best[0, HOME] = 0.0
+    parent_start = np.full((n + 1, 2), -1, dtype=int)
+    parent_night = np.full((n + 1, 2), -1, dtype=int)
+    
+    for j in range(1, n + 1):
+        last = j - 1
+        
+        for i in range(last, -1, -1):
+            inner_hours = cum_h[last] - cum_h[i]
+            single = i == last
+            
+            # Arbetstid och körning inom dagen växer när i minskar
+            if not single and (cum_work[j] - cum_work[i] > work_hours or inner_hours > max_drive_hours):
+                break
+            
+            for night in (HOME, HOTEL):
+                if not np.isfinite(best[i, night]):
+                    continue
+                
+                if night == HOME:
+                    first_h, first_km = home_h[i], home_dist[i]
+                else:
+                    first_h, first_km = inner_h[i], inner_km[i]
+                
+                day_h = first_h + inner_hours
+                if not single and day_h > max_drive_hours:
+                    continue
+                
+                cost = best[i, night] + hourly_cost * day_h + km_cost * (first_km + cum_km[last] - cum_km[i])
+                
+                if j == n:
+                    # Sista dagen - ingen natt efter
+                    candidates = ((HOME, cost),)
+                else:
+                    candidates = ((HOTEL, cost + hotel_night_cost),)
+                    if allow_home_nights and day_h + return_h[last] <= max_drive_hours:
+                        candidates += ((HOME, cost),)
+                
+                for end_night, end_cost in candidates:
+                    if end_cost < best[j, end_night]:
+                        best[j, end_night] = end_cost
+                        parent_start[j, end_night] = i
+                        parent_night[j, end_night] = night
+    
+    # Följ föräldrarna bakåt från slutet
+    day_starts = []
+    hotel_after = np.zeros(n, dtype=bool)
+    j, night = n, HOME
+    while j > 0:
+        i = parent_start[j, night]
+        if j < n:
+            hotel_after[j - 1] = night == HOTEL
+        day_starts.append(int(i))
+        j, night = i, parent_night[j, night]
+    day_starts.reverse()
+    
+    return DaySplit(day_starts, hotel_after, float(best[n, HOME]))
@@ -0,0 +1,134 @@
+"""
+Distance Cache Module
+Beständig cache på disk för avståndsmatriser (config 'distance_cache_dir')
+
+Matriserna sparas som .npy-filer namngivna efter en hash av de avrundade
+koordinaterna (i matrisens ordning) och road_factor. En cachad matris
+öppnas minnesmappad, så den läses från disk först när den används. Restider
+beräknas från avstånden och behöver därför ingen egen cache.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+# Decimaler i nyckeln, 6 decimaler ~ 0,1 m
+COORDINATE_DECIMALS = 6
+
+# Ändras om matrisens beräkning ändras, så att gamla filer inte återanvänds
+CACHE_VERSION = 1
+
+
+class DistanceCache:
+    """
+    Innehållsadresserad cache för avståndsmatriser med storleksgräns
+    
+    När cachen blir större än max_mb tas de filer bort som använts längst
+    tillbaka (filens mtime uppdateras vid varje träff).
+    """
+    
+    def __init__(self, directory: str, max_mb: float = 2048):
+        if max_mb <= 0:
+            raise ValueError(f"distance_cache_max_mb måste vara positiv, fick {max_mb}")
+        
+        self.directory = Path(directory)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.directory.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def key(latitudes: Sequence[float], longitudes: Sequence[float],
+            road_factor: float) -> str:
+        """Nyckel för en koordinatmängd (ordningen ingår, den styr matrisens index)"""
+        coords = np.round(np.column_stack([
+            np.asarray(latitudes, dtype=float),
+            np.asarray(longitudes, dtype=float)
+        ]), COORDINATE_DECIMALS)
+        
+        digest = hashlib.sha256()
+        digest.update(f"v{CACHE_VERSION}:{float(road_factor)!r}:{len(coords)}:".encode())
+        digest.update(np.ascontiguousarray(coords).tobytes())
+        return digest.hexdigest()
+    
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.npy"
+    
+    def load(self, latitudes: Sequence[float], longitudes: Sequence[float],
+             road_factor: float) -> Optional[np.ndarray]:
+        """
+        Öppnar en cachad matris minnesmappad (skrivskyddad)
+        
+        Returns:
+            Matrisen, eller None om den inte finns i cachen
+        """
+        path = self.path(self.key(latitudes, longitudes, road_factor))
+        n = len(latitudes)
+        
+        try:
+            matrix = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Trasig fil (t.ex. avbruten skrivning) - ta bort och räkna om
+            path.unlink(missing_ok=True)
+            return None
+        
+        if matrix.shape != (n, n):
+            del matrix
+            path.unlink(missing_ok=True)
+            return None
+        
+        # Markera som senast använd
+        os.utime(path)
+        return matrix
+    
+    def store(self, latitudes: Sequence[float], longitudes: Sequence[float],
+              road_factor: float, matrix: np.ndarray) -> Path:
+        """Sparar en matris och rensar gamla filer om cachen blivit för stor"""
+        path = self.path(self.key(latitudes, longitudes, road_factor))
+        
+        # Skriv till temporär fil och byt namn, så att ingen läser en halvskriven fil
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(matrix))
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        
+        self.evict(keep=path)
+        return path
+    
+    def size_bytes(self) -> int:
+        """Total storlek för cachade matriser"""
+        return sum(entry.stat().st_size for entry in self.directory.glob('*.npy'))
+    
+    def evict(self, keep: Optional[Path] = None):
+        """Tar bort de längst oanvända matriserna tills cachen ryms i max_mb"""
+        entries = []
+        for entry in self.directory.glob('*.npy'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        
+        total = sum(size for _, size, _ in entries)
+        
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and entry == keep:
+                continue
+            entry.unlink(missing_ok=True)
+            total -= size
+    
+    def clear(self):
+        """Tömmer cachen"""
+        for entry in self.directory.glob('*.npy'):
+            entry.unlink(missing_ok=True)
@@ -0,0 +1,165 @@
+"""
+Distance Matrix Module
+Förberäknade avståndsmatriser (Haversine) som delas av alla ruttsteg
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from route_improvement import neighbour_lists
+
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_matrix(lats1: np.ndarray, lons1: np.ndarray,
+                     lats2: np.ndarray, lons2: np.ndarray,
+                     road_factor: float = 1.3) -> np.ndarray:
+    """
+    Beräknar alla avstånd mellan två koordinatmängder med broadcast-NumPy
+    
+    Args:
+        lats1, lons1: Koordinater (grader) för raderna
+        lats2, lons2: Koordinater (grader) för kolumnerna
+        road_factor: Verklig vägsträcka vs fågelväg
+    
+    Returns:
+        Matris (len(lats1) x len(lats2)) med avstånd i km
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=float))[None, :]
+    
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    # Avrundningsfel kan ge a något utanför [0, 1]
+    np.clip(a, 0.0, 1.0, out=a)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    return EARTH_RADIUS_KM * c * road_factor
+
+
+class DistanceMatrix:
+    """
+    Avstånd mellan alla platser samt från hemmabaser till platser
+    
+    Platserna indexeras med heltalsposition i listan som matrisen byggs från.
+    Plats-till-plats-matrisen (n x n) beräknas första gången den används;
+    innan dess beräknas delmatriser direkt från koordinaterna, så stora
+    datamängder kan tilldelas och filtreras utan den fulla matrisen. Raderna
+    för hemmabaser beräknas vid första användning och cachas per koordinat.
+    En redan beräknad matris (t.ex. i delat minne) kan skickas in via matrix.
+    """
+    
+    def __init__(self, latitudes: Sequence[float], longitudes: Sequence[float],
+                 road_factor: float = 1.3, matrix: Optional[np.ndarray] = None):
+        self.road_factor = road_factor
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        
+        if matrix is not None and matrix.shape != (len(self.latitudes), len(self.latitudes)):
+            raise ValueError(f"Avståndsmatrisen har fel storlek: {matrix.shape}")
+        
+        self._matrix = matrix
+        self._spatial_index = None
+        self._base_rows: Dict[Tuple[float, float], np.ndarray] = {}
+        self._neighbours: Dict[int, np.ndarray] = {}
+    
+    @classmethod
+    def from_locations(cls, locations: List, road_factor: float = 1.3) -> 'DistanceMatrix':
+        """Bygger matrisen från en lista med Location-objekt"""
+        return cls(
+            [loc.latitude for loc in locations],
+            [loc.longitude for loc in locations],
+            road_factor
+        )
+    
+    def __len__(self) -> int:
+        return len(self.latitudes)
+    
+    @property
+    def matrix(self) -> np.ndarray:
+        """Avstånd mellan alla platser (n x n), beräknas vid första användning"""
+        if self._matrix is None:
+            self._matrix = haversine_matrix(
+                self.latitudes, self.longitudes,
+                self.latitudes, self.longitudes,
+                self.road_factor
+            )
+        return self._matrix
+    
+    @property
+    def is_computed(self) -> bool:
+        """True om den fulla matrisen finns i minnet"""
+        return self._matrix is not None
+    
+    @property
+    def spatial_index(self):
+        """Rumsligt index över platserna (byggs vid första användning)"""
+        if self._spatial_index is None:
+            # Importeras här eftersom spatial_index bygger på den här modulen
+            from spatial_index import SpatialIndex
+            self._spatial_index = SpatialIndex(self.latitudes, self.longitudes, self.road_factor)
+        return self._spatial_index
+    
+    def base_row(self, home_base: Tuple[float, float]) -> np.ndarray:
+        """Avstånd från en hemmabas till alla platser (cachas per koordinat)"""
+        key = (float(home_base[0]), float(home_base[1]))
+        row = self._base_rows.get(key)
+        
+        if row is None:
+            row = haversine_matrix(
+                [key[0]], [key[1]],
+                self.latitudes, self.longitudes,
+                self.road_factor
+            )[0]
+            self._base_rows[key] = row
+        
+        return row
+    
+    def base_rows(self, home_bases: List[Tuple[float, float]]) -> np.ndarray:
+        """Matris (antal baser x antal platser) med avstånd från varje hemmabas"""
+        if not home_bases:
+            return np.empty((0, len(self)))
+        return np.vstack([self.base_row(base) for base in home_bases])
+    
+    def submatrix(self, indices: Sequence[int]) -> np.ndarray:
+        """Avståndsmatris för ett urval av platser (i given ordning)"""
+        idx = np.asarray(indices, dtype=int)
+        
+        if self._matrix is None:
+            # Beräkna bara urvalet istället för hela matrisen
+            return haversine_matrix(
+                self.latitudes[idx], self.longitudes[idx],
+                self.latitudes[idx], self.longitudes[idx],
+                self.road_factor
+            )
+        
+        return self._matrix[np.ix_(idx, idx)]
+    
+    def neighbours(self, k: int = 10) -> np.ndarray:
+        """
+        De k närmaste grannarna för varje plats (cachas per k)
+        Tas från matrisen om den är beräknad, annars från det rumsliga indexet
+        """
+        if k not in self._neighbours:
+            if self._matrix is not None:
+                self._neighbours[k] = neighbour_lists(self._matrix, k)
+            else:
+                self._neighbours[k] = self._index_neighbours(k)
+        return self._neighbours[k]
+    
+    def _index_neighbours(self, k: int) -> np.ndarray:
+        """Grannlistor via det rumsliga indexet (platsen själv exkluderas)"""
+        n = len(self)
+        k = max(0, min(k, n - 1))
+        if k == 0:
+            return np.empty((n, 0), dtype=int)
+        
+        _, indices = self.spatial_index.nearest(self.latitudes, self.longitudes, k + 1)
+        
+        # Ta bort platsen själv (normalt första träffen, men inte vid dubbletter)
+        is_self = indices == np.arange(n)[:, None]
+        is_self[~is_self.any(axis=1), -1] = True
+        return indices[~is_self].reshape(n, k)
@@ -1,286 +1,384 @@
 """
 Excel Export Module
 Skapar detaljerad Excel-rapport med flera flikar
+
+Schemat plattas ut en gång till en kolumnbaserad tabell (schedule_frame) som
+den dagliga analysen aggregeras ur. Rapporten skrivs rad för rad med
+xlsxwriters constant_memory-läge; schemafliken direkt från segmenten, så att
+även årsplaner med hundratusentals besök kan exporteras utan att en formaterad
+kopia av schemat eller arbetsboken hålls i minnet.
 """
 
-import pandas as pd
 import io
+import math
+import os
 from datetime import datetime
-from typing import Dict, List
-from optimizer import TeamRoute, RouteSegment
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterator, List, Tuple, Union
 
+# pandas (och xlsxwriter) importeras först när en rapport skapas och
+# optimeraren bara för typnamnen, så att modulen laddas snabbt
+if TYPE_CHECKING:
+    import pandas as pd
+    from optimizer import TeamRoute
 
-def create_summary_sheet(team_routes: List[TeamRoute], config: Dict) -> pd.DataFrame:
-    """Skapar sammanfattningsfliken"""
-    
-    summary_data = []
+
+SUMMARY_COLUMNS = [
+    'Team', 'Hemmabas', 'Antal områden', 'Totalt arbetsdagar', 'Total körsträcka (km)',
+    'Total arbetstid (h)', 'Total körtid (h)', 'Hotellnätter', 'Arbetskostnad (kr)',
+    'Körkostnad personal (kr)', 'Drivmedelskostnad (kr)', 'Hotellkostnad (kr)', 'Total kostnad (kr)'
+]
+
+SCHEDULE_COLUMNS = [
+    'Team', 'Hemmabas', 'Löpnummer', 'Kund', 'Ankomstdatum', 'Ankoms tid', 'Arbetstid (h)',
+    'Avresetid', 'Körsträcka till (km)', 'Körtid till (h)', 'Latitud', 'Longitud', 'Enheter',
+    'Filtervärde', 'Hotellnatt efter besök'
+]
+
+DAILY_COLUMNS = [
+    'Team', 'Hemmabas', 'Datum', 'Veckodag', 'Antal besök', 'Körsträcka (km)', 'Körtid (h)',
+    'Arbetstid (h)', 'Total tid (h)', 'Hotellnatt'
+]
+
+# schedule_frame: oavrundade värden, tider som datetime och hotellnatt som bool
+SCHEDULE_FRAME_COLUMNS = [
+    'Team', 'Hemmabas', 'Löpnummer', 'Kund', 'Ankomst', 'Avresa', 'Arbetstid (h)',
+    'Körsträcka till (km)', 'Körtid till (h)', 'Latitud', 'Longitud', 'Enheter',
+    'Filtervärde', 'Hotellnatt'
+]
+
+WEEKDAY_NAMES = ['Mån', 'Tis', 'Ons', 'Tor', 'Fre', 'Lör', 'Sön']
+
+
+def _team_label(route: 'TeamRoute') -> str:
+    return f'Team {route.team.id}'
+
+
+def _sorted_routes(team_routes: List['TeamRoute']) -> List['TeamRoute']:
+    """Rutterna i schemaflikarnas ordning (teamnamnet sorterat som text)"""
+    return sorted(team_routes, key=_team_label)
+
+
+def _summary_rows(team_routes: List['TeamRoute'], config: Dict) -> Iterator[Tuple]:
+    """En rad per team i SUMMARY_COLUMNS ordning"""
+    # Kostnadsuppdelning
+    labor_cost_per_hour = config.get('labor_cost', 500)
+    team_size = config.get('team_size', 2)
+    vehicle_cost_per_km = config.get('vehicle_cost', 2.5)
+    hotel_cost_per_night = config.get('hotel_cost', 2000)
     
     for route in team_routes:
-        # Beräkna kostnadsuppdelning
-        labor_cost_per_hour = config.get('labor_cost', 500)
-        team_size = config.get('team_size', 2)
-        vehicle_cost_per_km = config.get('vehicle_cost', 2.5)
-        hotel_cost_per_night = config.get('hotel_cost', 2000)
-        
         labor_cost = route.total_work_time * labor_cost_per_hour * team_size
         drive_labor_cost = route.total_drive_time * labor_cost_per_hour * team_size
         vehicle_cost = route.total_distance * vehicle_cost_per_km
         hotel_cost = route.hotel_nights * hotel_cost_per_night * team_size
         
-        summary_data.append({
-            'Team': f'Team {route.team.id}',
-            'Hemmabas': route.team.home_name,
-            'Antal områden': len(route.segments),
-            'Totalt arbetsdagar': route.total_days,
-            'Total körsträcka (km)': round(route.total_distance, 1),
-            'Total arbetstid (h)': round(route.total_work_time, 1),
-            'Total körtid (h)': round(route.total_drive_time, 1),
-            'Hotellnätter': route.hotel_nights,
-            'Arbetskostnad (kr)': round(labor_cost, 0),
-            'Körkostnad personal (kr)': round(drive_labor_cost, 0),
-            'Drivmedelskostnad (kr)': round(vehicle_cost, 0),
-            'Hotellkostnad (kr)': round(hotel_cost, 0),
-            'Total kostnad (kr)': round(route.total_cost, 0)
-        })
-    
-    df = pd.DataFrame(summary_data)
-    
-    # Lägg till totalrad
-    totals = {
-        'Team': 'TOTALT',
-        'Hemmabas': '',
-        'Antal områden': df['Antal områden'].sum(),
-        'Totalt arbetsdagar': df['Totalt arbetsdagar'].max(),
-        'Total körsträcka (km)': df['Total körsträcka (km)'].sum(),
-        'Total arbetstid (h)': df['Total arbetstid (h)'].sum(),
-        'Total körtid (h)': df['Total körtid (h)'].sum(),
-        'Hotellnätter': df['Hotellnätter'].sum(),
-        'Arbetskostnad (kr)': df['Arbetskostnad (kr)'].sum(),
-        'Körkostnad personal (kr)': df['Körkostnad personal (kr)'].sum(),
-        'Drivmedelskostnad (kr)': df['Drivmedelskostnad (kr)'].sum(),
-        'Hotellkostnad (kr)': df['Hotellkostnad (kr)'].sum(),
-        'Total kostnad (kr)': df['Total kostnad (kr)'].sum()
-    }
+        yield (
+            _team_label(route),
+            route.team.home_name,
+            len(route.segments),
+            route.total_days,
+            round(route.total_distance, 1),
+            round(route.total_work_time, 1),
+            round(route.total_drive_time, 1),
+            route.hotel_nights,
+            round(labor_cost, 0),
+            round(drive_labor_cost, 0),
+            round(vehicle_cost, 0),
+            round(hotel_cost, 0),
+            round(route.total_cost, 0),
+        )
+
+
+def _summary_totals(rows: List[Tuple]) -> Tuple:
+    """Totalraden: summor, utom arbetsdagar som är det längsta teamets"""
+    if not rows:
+        return ('TOTALT', '') + (0,) * (len(SUMMARY_COLUMNS) - 2)
     
-    df = pd.concat([df, pd.DataFrame([totals])], ignore_index=True)
+    columns = list(zip(*rows))
+    totals = ['TOTALT', '']
+    for name, values in zip(SUMMARY_COLUMNS[2:], columns[2:]):
+        totals.append(max(values) if name == 'Totalt arbetsdagar' else sum(values))
+    return tuple(totals)
+
+
+def _schedule_rows(team_routes: List['TeamRoute']) -> Iterator[Tuple]:
+    """En rad per besök i SCHEDULE_COLUMNS ordning, sorterat efter team och löpnummer"""
+    for route in _sorted_routes(team_routes):
+        team = _team_label(route)
+        for i, segment in enumerate(route.segments):
+            yield (
+                team,
+                route.team.home_name,
+                i + 1,
+                segment.location.customer,
+                segment.arrival_time.strftime('%Y-%m-%d'),
+                segment.arrival_time.strftime('%H:%M'),
+                round(segment.work_time, 2),
+                segment.departure_time.strftime('%H:%M'),
+                round(segment.drive_distance, 1),
+                round(segment.drive_time, 2),
+                segment.location.latitude,
+                segment.location.longitude,
+                segment.location.units,
+                segment.location.filter_value,
+                'Ja' if segment.is_hotel_night else 'Nej',
+            )
+
+
+def schedule_frame(team_routes: List['TeamRoute']) -> 'pd.DataFrame':
+    """
+    Hela schemat som en kolumnbaserad tabell med en rad per besök
+    
+    Rutterna gås igenom en gång; Excel-rapporten, CSV-exporten och appen
+    bygger sina tabeller ur resultatet. Värdena är oavrundade och tiderna
+    datetime-kolumner. Raderna är sorterade efter team och löpnummer.
+    
+    Returns:
+        DataFrame med kolumnerna i SCHEDULE_FRAME_COLUMNS
+    """
+    import pandas as pd
+    
+    columns = {name: [] for name in SCHEDULE_FRAME_COLUMNS}
+    
+    for route in _sorted_routes(team_routes):
+        num_segments = len(route.segments)
+        columns['Team'].extend([_team_label(route)] * num_segments)
+        columns['Hemmabas'].extend([route.team.home_name] * num_segments)
+        columns['Löpnummer'].extend(range(1, num_segments + 1))
+        
+        for segment in route.segments:
+            location = segment.location
+            columns['Kund'].append(location.customer)
+            columns['Ankomst'].append(segment.arrival_time)
+            columns['Avresa'].append(segment.departure_time)
+            columns['Arbetstid (h)'].append(segment.work_time)
+            columns['Körsträcka till (km)'].append(segment.drive_distance)
+            columns['Körtid till (h)'].append(segment.drive_time)
+            columns['Latitud'].append(location.latitude)
+            columns['Longitud'].append(location.longitude)
+            columns['Enheter'].append(location.units)
+            columns['Filtervärde'].append(location.filter_value)
+            columns['Hotellnatt'].append(segment.is_hotel_night)
+    
+    df = pd.DataFrame(columns)
+    df['Ankomst'] = pd.to_datetime(df['Ankomst'])
+    df['Avresa'] = pd.to_datetime(df['Avresa'])
+    df['Hotellnatt'] = df['Hotellnatt'].astype(bool)
     
     return df
 
 
-def create_detailed_schedule_sheet(team_routes: List[TeamRoute]) -> pd.DataFrame:
-    """Skapar detaljerad schemafliken"""
+def daily_summary(schedule: 'pd.DataFrame') -> 'pd.DataFrame':
+    """
+    Daglig ruttanalys (en rad per team och datum) ur schedule_frame
     
-    schedule_data = []
+    Returns:
+        DataFrame med kolumnerna i DAILY_COLUMNS, sorterad efter team och datum
+    """
+    import pandas as pd
     
-    for route in team_routes:
-        for i, segment in enumerate(route.segments):
-            schedule_data.append({
-                'Team': f'Team {route.team.id}',
-                'Hemmabas': route.team.home_name,
-                'Löpnummer': i + 1,
-                'Kund': segment.location.customer,
-                'Ankomstdatum': segment.arrival_time.strftime('%Y-%m-%d'),
-                'Ankoms tid': segment.arrival_time.strftime('%H:%M'),
-                'Arbetstid (h)': round(segment.work_time, 2),
-                'Avresetid': segment.departure_time.strftime('%H:%M'),
-                'Körsträcka till (km)': round(segment.drive_distance, 1),
-                'Körtid till (h)': round(segment.drive_time, 2),
-                'Latitud': segment.location.latitude,
-                'Longitud': segment.location.longitude,
-                'Enheter': segment.location.units,
-                'Filtervärde': segment.location.filter_value,
-                'Hotellnatt efter besök': 'Ja' if segment.is_hotel_night else 'Nej'
-            })
-    
-    df = pd.DataFrame(schedule_data)
-    
-    # Sortera efter team och löpnummer
-    df = df.sort_values(['Team', 'Löpnummer'])
+    if schedule.empty:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
     
-    return df
+    day = schedule['Ankomst'].dt.normalize().rename('Dag')
+    daily = schedule.groupby(['Team', 'Hemmabas', day], sort=False).agg(**{
+        'Antal besök': ('Löpnummer', 'size'),
+        'Körsträcka (km)': ('Körsträcka till (km)', 'sum'),
+        'Körtid (h)': ('Körtid till (h)', 'sum'),
+        'Arbetstid (h)': ('Arbetstid (h)', 'sum'),
+        'Hotellnatt': ('Hotellnatt', 'last'),
+    }).reset_index()
+    
+    daily['Total tid (h)'] = (daily['Körtid (h)'] + daily['Arbetstid (h)']).round(2)
+    daily['Körsträcka (km)'] = daily['Körsträcka (km)'].round(1)
+    daily['Körtid (h)'] = daily['Körtid (h)'].round(2)
+    daily['Arbetstid (h)'] = daily['Arbetstid (h)'].round(2)
+    daily['Datum'] = daily['Dag'].dt.strftime('%Y-%m-%d')
+    daily['Veckodag'] = daily['Dag'].dt.dayofweek.map(dict(enumerate(WEEKDAY_NAMES)))
+    daily['Hotellnatt'] = daily['Hotellnatt'].map({True: 'Ja', False: 'Nej'})
+    
+    return daily[DAILY_COLUMNS]
 
 
-def create_daily_summary_sheet(team_routes: List[TeamRoute]) -> pd.DataFrame:
-    """Skapar daglig sammanfattning"""
+def create_summary_sheet(team_routes: List['TeamRoute'], config: Dict) -> 'pd.DataFrame':
+    """Skapar sammanfattningsfliken"""
+    import pandas as pd
     
-    daily_data = []
+    rows = list(_summary_rows(team_routes, config))
+    rows.append(_summary_totals(rows))
     
-    for route in team_routes:
-        current_day = None
-        day_segments = []
-        day_distance = 0
-        day_drive_time = 0
-        day_work_time = 0
-        
-        for segment in route.segments:
-            day = segment.arrival_time.date()
-            
-            if current_day is None:
-                current_day = day
-            
-            if day != current_day:
-                # Spara föregående dag
-                daily_data.append({
-                    'Team': f'Team {route.team.id}',
-                    'Hemmabas': route.team.home_name,
-                    'Datum': current_day.strftime('%Y-%m-%d'),
-                    'Veckodag': ['Mån', 'Tis', 'Ons', 'Tor', 'Fre', 'Lör', 'Sön'][current_day.weekday()],
-                    'Antal besök': len(day_segments),
-                    'Körsträcka (km)': round(day_distance, 1),
-                    'Körtid (h)': round(day_drive_time, 2),
-                    'Arbetstid (h)': round(day_work_time, 2),
-                    'Total tid (h)': round(day_drive_time + day_work_time, 2),
-                    'Hotellnatt': 'Ja' if day_segments and day_segments[-1].is_hotel_night else 'Nej'
-                })
-                
-                # Återställ för ny dag
-                current_day = day
-                day_segments = []
-                day_distance = 0
-                day_drive_time = 0
-                day_work_time = 0
-            
-            day_segments.append(segment)
-            day_distance += segment.drive_distance
-            day_drive_time += segment.drive_time
-            day_work_time += segment.work_time
-        
-        # Lägg till sista dagen
-        if day_segments:
-            daily_data.append({
-                'Team': f'Team {route.team.id}',
-                'Hemmabas': route.team.home_name,
-                'Datum': current_day.strftime('%Y-%m-%d'),
-                'Veckodag': ['Mån', 'Tis', 'Ons', 'Tor', 'Fre', 'Lör', 'Sön'][current_day.weekday()],
-                'Antal besök': len(day_segments),
-                'Körsträcka (km)': round(day_distance, 1),
-                'Körtid (h)': round(day_drive_time, 2),
-                'Arbetstid (h)': round(day_work_time, 2),
-                'Total tid (h)': round(day_drive_time + day_work_time, 2),
-                'Hotellnatt': 'Ja' if day_segments[-1].is_hotel_night else 'Nej'
-            })
-    
-    df = pd.DataFrame(daily_data)
-    
-    # Sortera efter team och datum
-    df = df.sort_values(['Team', 'Datum'])
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+def create_detailed_schedule_sheet(team_routes: List['TeamRoute'],
+                                   schedule: 'pd.DataFrame' = None) -> 'pd.DataFrame':
+    """Skapar detaljerad schemafliken (ur schedule om den redan finns)"""
+    import pandas as pd
     
-    return df
+    if schedule is None:
+        schedule = schedule_frame(team_routes)
+    
+    return pd.DataFrame({
+        'Team': schedule['Team'],
+        'Hemmabas': schedule['Hemmabas'],
+        'Löpnummer': schedule['Löpnummer'],
+        'Kund': schedule['Kund'],
+        'Ankomstdatum': schedule['Ankomst'].dt.strftime('%Y-%m-%d'),
+        'Ankoms tid': schedule['Ankomst'].dt.strftime('%H:%M'),
+        'Arbetstid (h)': schedule['Arbetstid (h)'].round(2),
+        'Avresetid': schedule['Avresa'].dt.strftime('%H:%M'),
+        'Körsträcka till (km)': schedule['Körsträcka till (km)'].round(1),
+        'Körtid till (h)': schedule['Körtid till (h)'].round(2),
+        'Latitud': schedule['Latitud'],
+        'Longitud': schedule['Longitud'],
+        'Enheter': schedule['Enheter'],
+        'Filtervärde': schedule['Filtervärde'],
+        'Hotellnatt efter besök': schedule['Hotellnatt'].map({True: 'Ja', False: 'Nej'}),
+    }, columns=SCHEDULE_COLUMNS)
+
+
+def create_daily_summary_sheet(team_routes: List['TeamRoute'],
+                               schedule: 'pd.DataFrame' = None) -> 'pd.DataFrame':
+    """Skapar daglig sammanfattning (ur schedule om den redan finns)"""
+    if schedule is None:
+        schedule = schedule_frame(team_routes)
+    
+    return daily_summary(schedule)
+
+
+def _write_row(worksheet, row: int, values: Tuple, cell_format=None):
+    """Skriver en rad; saknade värden (None/NaN) blir tomma celler"""
+    for col, value in enumerate(values):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            if cell_format is not None:
+                worksheet.write_blank(row, col, None, cell_format)
+            continue
+        worksheet.write(row, col, value, cell_format)
 
 
-def create_excel_report(team_routes: List[TeamRoute], config: Dict) -> bytes:
+def _write_sheet(worksheet, columns: List[str], rows, header_format, column_formats: Dict) -> int:
+    """Skriver rubrikrad och rader i ordning och returnerar nästa lediga rad"""
+    for col_num, name in enumerate(columns):
+        width, cell_format = column_formats.get(name, (15, None))
+        worksheet.set_column(col_num, col_num, width, cell_format)
+    worksheet.freeze_panes(1, 0)
+    
+    _write_row(worksheet, 0, tuple(columns), header_format)
+    
+    row_num = 1
+    for row in rows:
+        _write_row(worksheet, row_num, row)
+        row_num += 1
+    
+    return row_num
+
+
+def write_excel_report(team_routes: List['TeamRoute'], config: Dict,
+                       output: Union[str, 'os.PathLike', BinaryIO], schedule: 'pd.DataFrame' = None):
+    """
+    Skriver Excel-rapporten till en fil eller ström
+    
+    I constant_memory-läge skrivs varje rad till disk så fort nästa rad
+    påbörjats. Schemaraderna skapas en i taget från segmenten; schemat som
+    tabell (schedule, annars schedule_frame) används bara för den dagliga
+    analysen.
+    
+    Args:
+        team_routes: Rutter från optimeringen
+        config: Config (kostnader per timme, km och natt)
+        output: Sökväg eller skrivbar binär fil (t.ex. BytesIO)
+        schedule: schedule_frame för rutterna om den redan finns
+    """
+    import xlsxwriter
+    
+    if isinstance(output, os.PathLike):
+        output = os.fspath(output)
+    
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    
+    # Definiera format
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#4472C4',
+        'font_color': 'white',
+        'border': 1,
+        'align': 'center',
+        'valign': 'vcenter'
+    })
+    
+    total_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#FFC000',
+        'border': 1
+    })
+    
+    currency_format = workbook.add_format({
+        'num_format': '#,##0',
+        'border': 1
+    })
+    
+    decimal_format = workbook.add_format({
+        'num_format': '0.0',
+        'border': 1
+    })
+    
+    # 1. Sammanfattning (få rader - totalraden kräver alla team)
+    summary_formats = {}
+    for name in SUMMARY_COLUMNS:
+        if 'kostnad' in name.lower() or 'kr' in name.lower():
+            summary_formats[name] = (15, currency_format)
+        elif any(x in name.lower() for x in ['tid', 'sträcka']):
+            summary_formats[name] = (12, decimal_format)
+    
+    summary_rows = list(_summary_rows(team_routes, config))
+    worksheet = workbook.add_worksheet('Sammanfattning')
+    last_row = _write_sheet(worksheet, SUMMARY_COLUMNS, summary_rows, header_format, summary_formats)
+    _write_row(worksheet, last_row, _summary_totals(summary_rows), total_format)
+    
+    # 2. Detaljerat Schema
+    schedule_formats = {}
+    for name in SCHEDULE_COLUMNS:
+        if 'tid' in name.lower() or 'sträcka' in name.lower():
+            schedule_formats[name] = (12, decimal_format)
+        elif 'datum' in name.lower():
+            schedule_formats[name] = (12, None)
+    
+    worksheet = workbook.add_worksheet('Detaljerat Schema')
+    _write_sheet(worksheet, SCHEDULE_COLUMNS, _schedule_rows(team_routes), header_format, schedule_formats)
+    
+    # 3. Daglig Sammanfattning
+    daily_formats = {
+        name: (12, decimal_format) for name in DAILY_COLUMNS
+        if 'tid' in name.lower() or 'sträcka' in name.lower()
+    }
+    
+    # Dagsfliken aggregeras ur schemat som tabell (samma som CSV och appen)
+    daily = daily_summary(schedule if schedule is not None else schedule_frame(team_routes))
+    
+    worksheet = workbook.add_worksheet('Daglig Ruttanalys')
+    _write_sheet(worksheet, DAILY_COLUMNS, daily.itertuples(index=False, name=None),
+                 header_format, daily_formats)
+    
+    workbook.close()
+
+
+def create_excel_report(team_routes: List['TeamRoute'], config: Dict,
+                        schedule: 'pd.DataFrame' = None) -> bytes:
     """
     Skapar komplett Excel-rapport med flera flikar
     
     Returns:
         Excel-fil som bytes
     """
-    
     output = io.BytesIO()
-    
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        workbook = writer.book
-        
-        # Definiera format
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#4472C4',
-            'font_color': 'white',
-            'border': 1,
-            'align': 'center',
-            'valign': 'vcenter'
-        })
-        
-        total_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#FFC000',
-            'border': 1
-        })
-        
-        currency_format = workbook.add_format({
-            'num_format': '#,##0',
-            'border': 1
-        })
-        
-        decimal_format = workbook.add_format({
-            'num_format': '0.0',
-            'border': 1
-        })
-        
-        # 1. Sammanfattning
-        df_summary = create_summary_sheet(team_routes, config)
-        df_summary.to_excel(writer, sheet_name='Sammanfattning', index=False)
-        
-        worksheet = writer.sheets['Sammanfattning']
-        
-        # Formatera headers
-        for col_num, value in enumerate(df_summary.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-        
-        # Formatera sista raden (totals)
-        last_row = len(df_summary)
-        for col_num in range(len(df_summary.columns)):
-            worksheet.write(last_row, col_num, df_summary.iloc[-1, col_num], total_format)
-        
-        # Formatera valuta kolumner
-        for col_num, col_name in enumerate(df_summary.columns):
-            if 'kostnad' in col_name.lower() or 'kr' in col_name.lower():
-                worksheet.set_column(col_num, col_num, 15, currency_format)
-            elif any(x in col_name.lower() for x in ['tid', 'sträcka']):
-                worksheet.set_column(col_num, col_num, 12, decimal_format)
-            else:
-                worksheet.set_column(col_num, col_num, 15)
-        
-        # 2. Detaljerat Schema
-        df_schedule = create_detailed_schedule_sheet(team_routes)
-        df_schedule.to_excel(writer, sheet_name='Detaljerat Schema', index=False)
-        
-        worksheet = writer.sheets['Detaljerat Schema']
-        
-        # Formatera headers
-        for col_num, value in enumerate(df_schedule.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-        
-        # Auto-width
-        for col_num, col_name in enumerate(df_schedule.columns):
-            if 'tid' in col_name.lower():
-                worksheet.set_column(col_num, col_num, 12, decimal_format)
-            elif 'sträcka' in col_name.lower():
-                worksheet.set_column(col_num, col_num, 12, decimal_format)
-            elif 'datum' in col_name.lower():
-                worksheet.set_column(col_num, col_num, 12)
-            else:
-                worksheet.set_column(col_num, col_num, 15)
-        
-        # 3. Daglig Sammanfattning
-        df_daily = create_daily_summary_sheet(team_routes)
-        df_daily.to_excel(writer, sheet_name='Daglig Ruttanalys', index=False)
-        
-        worksheet = writer.sheets['Daglig Ruttanalys']
-        
-        # Formatera headers
-        for col_num, value in enumerate(df_daily.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-        
-        # Auto-width
-        for col_num, col_name in enumerate(df_daily.columns):
-            if 'tid' in col_name.lower() or 'sträcka' in col_name.lower():
-                worksheet.set_column(col_num, col_num, 12, decimal_format)
-            else:
-                worksheet.set_column(col_num, col_num, 15)
-        
-        # Frys översta raden i alla ark
-        for sheet_name in writer.sheets:
-            writer.sheets[sheet_name].freeze_panes(1, 0)
-    
-    output.seek(0)
+    write_excel_report(team_routes, config, output, schedule)
     return output.getvalue()
 
 
-def create_csv_export(team_routes: List[TeamRoute]) -> bytes:
+def create_csv_export(team_routes: List['TeamRoute'], schedule: 'pd.DataFrame' = None) -> bytes:
     """Skapar enkel CSV-export av detaljerat schema"""
     
-    df = create_detailed_schedule_sheet(team_routes)
+    df = create_detailed_schedule_sheet(team_routes, schedule)
     
     output = io.StringIO()
     df.to_csv(output, index=False, encoding='utf-8-sig')  # BOM för Excel-kompatibilitet
@@ -0,0 +1,242 @@
+"""
+Fleet Improvement Module
+Lokalsökning mellan teamens rutter (relocate, swap, 2-opt*)
+
+Rutterna är listor med platsernas positioner i avståndsmatrisen och
+startar i respektive teams hemmabas. Ändringar utvärderas inkrementellt
+med samma öppna väg-modell som route_improvement.
+"""
+
+import time
+import numpy as np
+from collections import deque
+from typing import List, Optional
+
+from route_improvement import DEADLINE_CHECK_INTERVAL, IMPROVEMENT_EPSILON
+
+
+class FleetSearch:
+    """
+    Flyttar och byter stopp mellan teamens rutter så länge totala
+    körsträckan för hela flottan minskar
+    
+    Drag:
+        relocate: flytta ett stopp till en annan rutt, bredvid en granne
+        swap:     byt plats på två stopp i olika rutter
+        2-opt*:   byt svansar mellan två rutter
+    """
+    
+    def __init__(self, matrix: np.ndarray, base_rows: np.ndarray,
+                 routes: List[List[int]], neighbours: np.ndarray,
+                 allowed: Optional[np.ndarray] = None,
+                 loads: Optional[np.ndarray] = None,
+                 capacity: Optional[float] = None):
+        """
+        Args:
+            matrix: Avstånd mellan alla platser (n x n)
+            base_rows: Avstånd från varje rutts hemmabas till alla platser (m x n)
+            routes: En lista med platspositioner per rutt (m rutter)
+            neighbours: Grannlistor över alla platser (n x k)
+            allowed: Bool-matris (m x n), False = platsen får inte läggas i rutten
+            loads: Belastning per plats (t.ex. arbetstid), används med capacity
+            capacity: Max belastning per rutt (None = största startbelastningen)
+        """
+        self.matrix = matrix
+        self.base_rows = base_rows
+        self.routes = [list(route) for route in routes]
+        self.neighbours = neighbours
+        self.allowed = allowed
+        self.loads = loads
+        self.moves = 0
+        
+        # Rutternas belastning, så att inget team får mer arbete än det tyngsta hade
+        self.route_loads = None
+        self.capacity = None
+        if loads is not None:
+            self.route_loads = np.array([loads[route].sum() if route else 0.0
+                                         for route in self.routes])
+            self.capacity = capacity if capacity is not None else float(self.route_loads.max(initial=0.0))
+        
+        n = len(matrix)
+        self.route_of = np.full(n, -1, dtype=int)
+        self.pos = np.full(n, -1, dtype=int)
+        for r in range(len(self.routes)):
+            self._reindex(r)
+    
+    def run(self, max_moves: Optional[int] = None,
+            deadline: Optional[float] = None) -> List[List[int]]:
+        """
+        Kör sökningen tills inga förbättrande drag finns kvar
+        
+        Args:
+            max_moves: Max antal genomförda drag (None = obegränsat)
+            deadline: time.perf_counter()-tid då sökningen avbryts (None = ingen)
+        """
+        queue = deque(node for route in self.routes for node in route)
+        queued = np.zeros(len(self.matrix), dtype=bool)
+        queued[list(queue)] = True
+        checks = 0
+        
+        while queue:
+            checks += 1
+            if deadline is not None and checks % DEADLINE_CHECK_INTERVAL == 0:
+                if time.perf_counter() >= deadline:
+                    break
+            
+            u = queue.popleft()
+            queued[u] = False
+            
+            touched = self._improve_node(u)
+            if not touched:
+                continue
+            
+            self.moves += 1
+            if max_moves is not None and self.moves >= max_moves:
+                break
+            
+            # Väck stoppen runt de ändrade kanterna
+            for node in touched:
+                if node is not None and not queued[node]:
+                    queued[node] = True
+                    queue.append(node)
+        
+        return self.routes
+    
+    def total_length(self) -> float:
+        """Total körsträcka för alla rutter (öppna vägar från hemmabasen)"""
+        return fleet_length(self.matrix, self.base_rows, self.routes)
+    
+    def _reindex(self, *routes: int):
+        """Uppdaterar rutt-, positions- och belastningsindex för rutterna"""
+        for r in routes:
+            route = np.array(self.routes[r], dtype=int)
+            self.route_of[route] = r
+            self.pos[route] = np.arange(len(route))
+            if self.route_loads is not None:
+                self.route_loads[r] = self.loads[route].sum()
+    
+    def _edge(self, r: int, a: Optional[int], b: Optional[int]) -> float:
+        """Kantlängd i rutt r, a=None är hemmabasen och b=None ruttens slut"""
+        if b is None:
+            return 0.0
+        if a is None:
+            return self.base_rows[r, b]
+        return self.matrix[a, b]
+    
+    def _neighbours_of(self, r: int, i: int):
+        """Föregående och nästa stopp (None för hemmabas/slut)"""
+        route = self.routes[r]
+        pred = route[i - 1] if i > 0 else None
+        succ = route[i + 1] if i < len(route) - 1 else None
+        return pred, succ
+    
+    def _is_allowed(self, r: int, nodes) -> bool:
+        """Kontrollerar att alla platser får läggas i rutt r"""
+        if self.allowed is None:
+            return True
+        return bool(np.all(self.allowed[r, nodes]))
+    
+    def _fits(self, r: int, added, removed) -> bool:
+        """Kontrollerar att rutt r håller sig inom kapaciteten efter ändringen"""
+        if self.route_loads is None:
+            return True
+        new_load = self.route_loads[r] + self.loads[added].sum() - self.loads[removed].sum()
+        return new_load <= self.capacity + IMPROVEMENT_EPSILON
+    
+    def _improve_node(self, u: int) -> list:
+        """Genomför första förbättrande draget för stopp u, returnerar berörda stopp"""
+        r = int(self.route_of[u])
+        i = int(self.pos[u])
+        pred_u, succ_u = self._neighbours_of(r, i)
+        
+        # Vinst av att ta bort u ur sin rutt
+        removal_gain = (self._edge(r, pred_u, u) + self._edge(r, u, succ_u)
+                        - self._edge(r, pred_u, succ_u))
+        
+        for v in self.neighbours[u]:
+            v = int(v)
+            s = int(self.route_of[v])
+            if s == r or s < 0:
+                continue
+            
+            j = int(self.pos[v])
+            pred_v, succ_v = self._neighbours_of(s, j)
+            
+            # Relocate: u in före eller efter v
+            if self._is_allowed(s, [u]) and self._fits(s, [u], []):
+                for at, x, y in ((j, pred_v, v), (j + 1, v, succ_v)):
+                    insert_cost = (self._edge(s, x, u) + self._edge(s, u, y)
+                                   - self._edge(s, x, y))
+                    if insert_cost - removal_gain < -IMPROVEMENT_EPSILON:
+                        self.routes[r].pop(i)
+                        self.routes[s].insert(at, u)
+                        self._reindex(r, s)
+                        return [u, pred_u, succ_u, x, y]
+            
+            # Swap: u och v byter plats
+            if (self._is_allowed(s, [u]) and self._is_allowed(r, [v])
+                    and self._fits(s, [u], [v]) and self._fits(r, [v], [u])):
+                delta = (self._edge(r, pred_u, v) + self._edge(r, v, succ_u)
+                         - self._edge(r, pred_u, u) - self._edge(r, u, succ_u)
+                         + self._edge(s, pred_v, u) + self._edge(s, u, succ_v)
+                         - self._edge(s, pred_v, v) - self._edge(s, v, succ_v))
+                if delta < -IMPROVEMENT_EPSILON:
+                    self.routes[r][i] = v
+                    self.routes[s][j] = u
+                    self._reindex(r, s)
+                    return [u, v, pred_u, succ_u, pred_v, succ_v]
+            
+            # 2-opt*: ny kant u -> v (u:s början + v:s svans, v:s början + u:s svans)
+            delta = (self.matrix[u, v] + self._edge(s, pred_v, succ_u)
+                     - self._edge(r, u, succ_u) - self._edge(s, pred_v, v))
+            if delta < -IMPROVEMENT_EPSILON:
+                head_r, tail_r = self.routes[r][:i + 1], self.routes[r][i + 1:]
+                head_s, tail_s = self.routes[s][:j], self.routes[s][j:]
+                if (self._is_allowed(r, tail_s) and self._is_allowed(s, tail_r)
+                        and self._fits(r, tail_s, tail_r) and self._fits(s, tail_r, tail_s)):
+                    self.routes[r] = head_r + tail_s
+                    self.routes[s] = head_s + tail_r
+                    self._reindex(r, s)
+                    return [u, v, pred_v, succ_u]
+            
+            # 2-opt*: ny kant v -> u
+            delta = (self.matrix[v, u] + self._edge(r, pred_u, succ_v)
+                     - self._edge(s, v, succ_v) - self._edge(r, pred_u, u))
+            if delta < -IMPROVEMENT_EPSILON:
+                head_s, tail_s = self.routes[s][:j + 1], self.routes[s][j + 1:]
+                head_r, tail_r = self.routes[r][:i], self.routes[r][i:]
+                if (self._is_allowed(s, tail_r) and self._is_allowed(r, tail_s)
+                        and self._fits(s, tail_r, tail_s) and self._fits(r, tail_s, tail_r)):
+                    self.routes[s] = head_s + tail_r
+                    self.routes[r] = head_r + tail_s
+                    self._reindex(r, s)
+                    return [u, v, pred_u, succ_v]
+        
+        return []
+
+
+def fleet_length(matrix: np.ndarray, base_rows: np.ndarray,
+                 routes: List[List[int]]) -> float:
+    """Total körsträcka för rutterna (öppna vägar från respektive hemmabas)"""
+    total = 0.0
+    for r, route in enumerate(routes):
+        if route:
+            total += base_rows[r, route[0]]
+            total += matrix[route[:-1], route[1:]].sum()
+    return float(total)
+
+
+def improve_fleet(matrix: np.ndarray, base_rows: np.ndarray,
+                  routes: List[List[int]], neighbours: np.ndarray,
+                  allowed: Optional[np.ndarray] = None,
+                  loads: Optional[np.ndarray] = None,
+                  capacity: Optional[float] = None,
+                  max_moves: Optional[int] = None,
+                  deadline: Optional[float] = None) -> List[List[int]]:
+    """
+    Kör relocate/swap/2-opt* mellan rutterna och returnerar nya rutter
+    
+    Se FleetSearch för argumenten
+    """
+    search = FleetSearch(matrix, base_rows, routes, neighbours, allowed, loads, capacity)
+    return search.run(max_moves, deadline)
@@ -0,0 +1,197 @@
+"""
+Job Runner Module
+Kör optimeringar i bakgrundstrådar så att Streamlit-gränssnittet inte blockeras
+
+Varje jobb får ett id som sparas i st.session_state. Gränssnittet frågar
+runnern om jobbets status och förlopp vid varje omritning. Ett jobb avbryts
+genom att dess tidsbudget avslutas (TimeBudget.cancel) - optimeringen
+returnerar då bästa hittills funna lösning, som kan förbättras vidare med
+"Fortsätt förbättra". Med parallel_workers > 1 når avbrottet även
+processerna för pågående team-antal (se parallel_sweep.py).
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from optimizer import continue_optimization, run_optimization
+from time_budget import TimeBudget
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from optimizer import LocationTable
+
+
+# Färdiga jobb som ingen hämtat tas bort efter så här lång tid
+FINISHED_JOB_TTL_S = 3600
+
+# Jobbstatus
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+
+class OptimizationJob:
+    """Ett optimeringsjobb med status, förlopp och resultat"""
+    
+    def __init__(self, job_id: str, budget: Optional[TimeBudget] = None):
+        self.id = job_id
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Väntar på ledig arbetstråd..."
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.budget = budget
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cancel_requested = False
+        self._lock = threading.Lock()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, CANCELLED, FAILED)
+    
+    def cancel(self):
+        """Begär avbrott - jobbet avslutas med bästa hittills funna lösning"""
+        with self._lock:
+            self._cancel_requested = True
+            if self.budget is not None:
+                self.budget.cancel()
+    
+    def on_progress(self, event: Dict):
+        """progress_callback för optimeraren"""
+        if event['event'] == 'team_count_started':
+            message = f"Testar {event['num_teams']} team ({event['done'] + 1}/{event['total']})"
+        elif event['event'] == 'team_count_skipped':
+            message = f"{event['num_teams']} team hann inte testas före tidsgränsen"
+        else:
+            message = f"{event['num_teams']} team klart ({event['done']}/{event['total']})"
+        
+        with self._lock:
+            self.progress = event['progress']
+            self.message = message
+            # continue_optimization förlänger budgeten vid start, vilket
+            # nollställer ett avbrott som begärts precis innan
+            if self._cancel_requested and self.budget is not None and not self.budget.cancelled:
+                self.budget.cancel()
+    
+    def _attach_budget(self, budget: TimeBudget):
+        """Kopplar jobbets tidsbudget (ett avbrott som begärts innan start gäller direkt)"""
+        with self._lock:
+            self.budget = budget
+            if self._cancel_requested:
+                budget.cancel()
+    
+    def _run(self, function: Callable[[], Dict]):
+        with self._lock:
+            if self._cancel_requested:
+                self.status = CANCELLED
+                self.message = "Avbrutet innan start"
+                self.finished_at = time.time()
+                return
+            self.status = RUNNING
+            self.message = "Startar optimering..."
+        
+        try:
+            result = function()
+        except Exception as e:
+            with self._lock:
+                self.status = FAILED
+                self.error = str(e)
+                self.finished_at = time.time()
+            return
+        
+        with self._lock:
+            self.result = result
+            self.progress = 1.0
+            self.status = CANCELLED if self._cancel_requested else DONE
+            self.message = "Avbrutet" if self._cancel_requested else "Klart"
+            self.finished_at = time.time()
+
+
+class JobRunner:
+    """
+    Kö av optimeringsjobb som körs i en trådpool
+    
+    En instans delas av alla användare (t.ex. via st.cache_resource);
+    max_workers begränsar hur många optimeringar som körs samtidigt.
+    """
+    
+    def __init__(self, max_workers: int = 2):
+        if max_workers < 1:
+            raise ValueError(f"max_workers måste vara minst 1, fick {max_workers}")
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='optimering')
+        self._jobs: Dict[str, OptimizationJob] = {}
+        self._lock = threading.Lock()
+    
+    def submit_optimization(self, df: 'pd.DataFrame', config: Dict, profile: Dict,
+                            profiling: bool = False,
+                            prepared: Optional[Tuple['pd.DataFrame', 'LocationTable']] = None) -> str:
+        """
+        Startar run_optimization i bakgrunden och returnerar jobbets id
+        
+        prepared (filtrerad data och platstabell, t.ex. från UploadCache)
+        skickas vidare till run_optimization.
+        """
+        job = self._new_job()
+        budget = TimeBudget(config.get('time_limit_s'))
+        job._attach_budget(budget)
+        
+        self._executor.submit(job._run, lambda: run_optimization(
+            df, config, profile, progress_callback=job.on_progress, budget=budget,
+            profiling=profiling, prepared=prepared
+        ))
+        return job.id
+    
+    def submit_continuation(self, result: Dict, time_limit_s: Optional[float] = None) -> str:
+        """Startar continue_optimization i bakgrunden och returnerar jobbets id"""
+        job = self._new_job()
+        
+        optimizer = result.get('optimizer')
+        if optimizer is not None:
+            job._attach_budget(optimizer.budget)
+        
+        self._executor.submit(job._run, lambda: continue_optimization(
+            result, time_limit_s, progress_callback=job.on_progress
+        ))
+        return job.id
+    
+    def get(self, job_id: Optional[str]) -> Optional[OptimizationJob]:
+        """Jobbet med givet id, eller None om det inte finns (t.ex. efter omstart)"""
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+    
+    def discard(self, job_id: str):
+        """Glömmer ett färdigt jobb (när resultatet hämtats)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+    
+    def _new_job(self) -> OptimizationJob:
+        job = OptimizationJob(uuid.uuid4().hex)
+        
+        with self._lock:
+            # Rensa färdiga jobb som ingen hämtat (t.ex. stängda flikar)
+            now = time.time()
+            for old_id in [
+                old_id for old_id, old in self._jobs.items()
+                if old.finished and now - old.finished_at > FINISHED_JOB_TTL_S
+            ]:
+                del self._jobs[old_id]
+            
+            self._jobs[job.id] = job
+        
+        return job
@@ -3,11 +3,35 @@ Map Visualization Module - Med Hotellnatt-visualisering
 Skapar interaktiva kartor med Folium
 """
 
-import folium
-from folium import plugins
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import numpy as np
 
+# folium importeras först när en karta skapas, så att modulen laddas snabbt
+
+# Renderingslägen för create_route_map
+MAP_MODES = ('auto', 'detailed', 'clustered')
+
+# Över så här många punkter (stopp och obesökta platser) väljer 'auto' det
+# klustrade läget - detaljerade markörer med popups blir tiotals MB HTML
+CLUSTER_THRESHOLD = 1500
+
+# Popupfält (egenskap, rubrik) för stopp och obesökta platser i detaljerat läge
+STOP_POPUP_FIELDS = (
+    ('day', 'Dag'),
+    ('stop', 'Stopp'),
+    ('customer', '📍 Plats'),
+    ('team', '👥 Team'),
+    ('work_time', '⏱️ Arbetstid (h)'),
+    ('drive_distance', '🚗 Körsträcka hit (km)'),
+    ('status', 'Status'),
+)
+UNVISITED_POPUP_FIELDS = (
+    ('customer', '📍 Kund'),
+    ('units', '📦 Enheter'),
+    ('filter_value', '🔍 Filtervärde'),
+    ('status', 'Anledning'),
+)
+
 
 def create_color_palette(n: int) -> List[str]:
     """Skapar en palett med distinkta färger för teams"""
@@ -41,7 +65,8 @@ def safe_get_attr(obj: Any, attr: str, default: Any = None) -> Any:
         return default
 
 
-def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[Any] = None, visited_locations: List[Any] = None) -> str:
+def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[Any] = None, visited_locations: List[Any] = None,
+                     mode: str = 'auto') -> str:
     """
     Skapar interaktiv Folium-karta med alla team-rutter
     INKLUDERAR HOTELLNATT-VISUALISERING OCH OBESÖKTA PLATSER
@@ -54,15 +79,29 @@ def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[A
     - ⚪ Grå cirkel = Obesökt plats (filtrerad bort)
     - --- Streckad linje = Hemresa-rutt
     
+    Detaljerat läge: varje lager (team, hotellnätter, hemresor, obesökta) är
+    en GeoJSON-samling och popups byggs i webbläsaren från egenskaperna.
+    
+    Klustrat läge (många stopp): stoppen ritas i webbläsaren som klustrade
+    cirkelmarkörer (FastMarkerCluster) med popup byggd i JavaScript, och
+    rutten som en linje per team och dag.
+    
     Args:
         team_routes: Lista med TeamRoute-objekt
         config: Konfiguration
         all_locations: Alla platser från ursprunglig data (optional)
         visited_locations: Platser som faktiskt besöks (optional)
+        mode: 'detailed', 'clustered' eller 'auto' (klustrat över
+            config 'map_cluster_threshold', standard CLUSTER_THRESHOLD)
     
     Returns:
         HTML som sträng
     """
+    import folium
+    from folium import plugins
+    
+    if mode not in MAP_MODES:
+        raise ValueError(f"Okänt kartläge: {mode} (välj {', '.join(MAP_MODES)})")
     
     # Validera input
     if not team_routes or len(team_routes) == 0:
@@ -111,11 +150,19 @@ def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[A
     center_lat = np.mean(all_lats)
     center_lon = np.mean(all_lons)
     
-    # Skapa karta
+    # Välj renderingsläge efter antal punkter
+    num_points = len(all_lats)
+    if all_locations and visited_locations:
+        num_points += max(0, len(all_locations) - len(visited_locations))
+    threshold = config.get('map_cluster_threshold', CLUSTER_THRESHOLD)
+    clustered = mode == 'clustered' or (mode == 'auto' and num_points > threshold)
+    
+    # Skapa karta (canvas ritar många linjer snabbare än SVG)
     m = folium.Map(
         location=[center_lat, center_lon],
         zoom_start=6,
-        tiles='OpenStreetMap'
+        tiles='OpenStreetMap',
+        prefer_canvas=clustered
     )
     
     # Lägg till alternativt kartlager
@@ -124,12 +171,99 @@ def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[A
     # Färger för teams
     colors = create_color_palette(len(team_routes))
     
-    # Statistik
-    total_hotels = 0
-    total_home_returns = 0
-    total_normal_stops = 0
+    if clustered:
+        counts = _add_clustered_layers(m, team_routes, colors, all_locations, visited_locations)
+    else:
+        counts = _add_detailed_layers(m, team_routes, colors, all_locations, visited_locations)
+    total_normal_stops, total_hotels, total_home_returns, unvisited_count = counts
+    
+    # Layer control (för att visa/dölja teams)
+    folium.LayerControl(position='topright', collapsed=False).add_to(m)
+    
+    # Fullscreen-knapp
+    plugins.Fullscreen(
+        position='topleft',
+        title='Fullskärm',
+        title_cancel='Avsluta fullskärm',
+        force_separate_button=True
+    ).add_to(m)
+    
+    # Förbättrad legend med statistik
+    legend_html = f"""
+    <div style="position: fixed; 
+                bottom: 50px; right: 50px; width: 300px; 
+                background-color: white; border:2px solid #333; z-index:9999; 
+                font-size:13px; padding: 15px; border-radius: 8px;
+                box-shadow: 0 4px 12px rgba(0,0,0,0.3);
+                font-family: Arial, sans-serif;">
+        <h4 style="margin: 0 0 12px 0; border-bottom: 2px solid #333; padding-bottom: 8px;">
+            📊 Ruttöversikt
+        </h4>
+        <div style="margin: 8px 0;">
+            <p style="margin: 4px 0; line-height: 1.6;">
+                <b>👥 Antal team:</b> {len(team_routes)}<br>
+                <b>📍 Totalt stopp:</b> {total_normal_stops + total_hotels + total_home_returns}<br>
+                <b>⚑ Hotellnätter:</b> <span style="color: red; font-weight: bold;">{total_hotels}</span><br>
+                <b>✓ Hemresor:</b> <span style="color: green; font-weight: bold;">{total_home_returns}</span><br>
+                <b>⚪ Obesökta:</b> <span style="color: #999; font-weight: bold;">{unvisited_count}</span>
+            </p>
+        </div>
+        <hr style="margin: 12px 0; border: none; border-top: 1px solid #ddd;">
+        <div style="margin: 8px 0; font-size: 12px; line-height: 1.8;">
+            <p style="margin: 3px 0;">
+                <span style="font-size: 16px;">🏠</span> <b>Svart</b> = Hemmabas
+            </p>
+            <p style="margin: 3px 0;">
+                <span style="font-size: 16px; color: red;">⚑</span> <b>Röd</b> = Hotellnatt
+            </p>
+            <p style="margin: 3px 0;">
+                <span style="font-size: 16px; color: green;">✓</span> <b>Grön</b> = Hemresa (spar!)
+            </p>
+            <p style="margin: 3px 0;">
+                <span style="font-size: 16px;">⚫</span> <b>Färgad</b> = Arbetsplats
+            </p>
+            <p style="margin: 3px 0;">
+                <span style="font-size: 16px; color: #999;">⚪</span> <b>Grå</b> = Obesökt
+            </p>
+            <p style="margin: 3px 0;">
+                <span style="color: grey;">━━━</span> <b>Heldragen</b> = Normal rutt
+            </p>
+            <p style="margin: 3px 0;">
+                <span style="color: green;">╌╌╌</span> <b>Streckad</b> = Hemresa
+            </p>
+        </div>
+        <div style="margin-top: 12px; padding: 8px; background: #f8f9fa; border-radius: 4px; font-size: 11px; color: #666;">
+            💡 <b>Tips:</b> {'Zooma in eller klicka på ett kluster för enskilda stopp. ' if clustered else ''}Klicka på markers för detaljer. Använd Layer Control (↗) för att visa/dölja team.
+        </div>
+    </div>
+    """
+    
+    m.get_root().html.add_child(folium.Element(legend_html))
+    
+    # Generera HTML
+    html_string = m._repr_html_()
+    
+    return html_string
+
+
+def _add_detailed_layers(m: Any, team_routes: List[Any], colors: List[str], all_locations: List[Any],
+                         visited_locations: List[Any]) -> Tuple[int, int, int, int]:
+    """
+    Ritar alla stopp med popup och rutten som linjer
+    
+    Varje lager (team, hotellnätter, hemresor, obesökta platser) är en
+    GeoJSON-samling. Popups och tooltips byggs i webbläsaren från
+    egenskaperna, så HTML och stilar finns bara en gång per lager.
+    
+    Returns:
+        (normala stopp, hotellnätter, hemresor, obesökta platser)
+    """
+    import folium
+    
+    hotel_features = []
+    home_return_features = []
+    home_return_legs = []
     
-    # Rita varje team
     for team_idx, route in enumerate(team_routes):
         color = colors[team_idx]
         
@@ -138,6 +272,8 @@ def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[A
         team_id = safe_get_attr(team, 'id', team_idx + 1) if team else team_idx + 1
         team_name = safe_get_attr(team, 'home_name', f'Team {team_id}') if team else f'Team {team_id}'
         home_base = safe_get_attr(team, 'home_base', None) if team else None
+        home = (float(home_base[0]), float(home_base[1])) if home_base and len(home_base) >= 2 else None
+        team_label = f"{team_id} ({team_name})"
         
         segments = safe_get_attr(route, 'segments', [])
         
@@ -148,18 +284,21 @@ def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[A
         fg = folium.FeatureGroup(name=f"Team {team_id} - {team_name}", show=True)
         
         # Rita hemmabas
-        if home_base and len(home_base) >= 2:
+        if home:
             folium.Marker(
-                location=[home_base[0], home_base[1]],
+                location=list(home),
                 popup=f"<b>🏠 {team_name}</b><br>Hemmabas<br>Team {team_id}",
                 tooltip=f"🏠 Hemmabas: {team_name}",
                 icon=folium.Icon(color='black', icon='home', prefix='fa')
             ).add_to(fg)
         
-        # Håll koll på föregående plats för att rita linjer
-        prev_location = home_base
+        stop_features = []
+        line_features = []
+        final_features = []
+        
+        # Sammanhängande körning sedan föregående hemresa
+        run = [home] if home else []
         
-        # Rita alla segment
         for seg_idx, segment in enumerate(segments):
             location = safe_get_attr(segment, 'location', None)
             if not location:
@@ -171,283 +310,333 @@ def create_route_map(team_routes: List[Any], config: Dict, all_locations: List[A
             
             if lat is None or lon is None:
                 continue
+            point = (float(lat), float(lon))
             
             # Hämta hotellnatt-info
             is_hotel = safe_get_attr(segment, 'is_hotel_night', False)
             hotel_reason = safe_get_attr(segment, 'hotel_reason', '')
-            day = safe_get_attr(segment, 'day', seg_idx + 1)
-            work_time = safe_get_attr(segment, 'work_time', 0)
-            drive_distance = safe_get_attr(segment, 'drive_distance', 0)
+            kind = _stop_kind(is_hotel, hotel_reason)
             
-            # Bestäm typ av stopp
-            if is_hotel:
-                marker_type = 'hotel'
-                icon_color = 'red'
-                icon_name = 'bed'
-                marker_color = 'red'
-                total_hotels += 1
-            elif 'Hemresa' in hotel_reason or 'HEM' in hotel_reason.upper() or 'hem billigare' in hotel_reason.lower():
-                marker_type = 'home_return'
-                icon_color = 'green'
-                icon_name = 'home'
-                marker_color = 'green'
-                total_home_returns += 1
+            properties = {
+                'label': (f"⚑ HOTELL: {customer}" if kind == 'hotel'
+                          else f"✓ HEMRESA: {customer}" if kind == 'home_return'
+                          else f"#{seg_idx + 1}: {customer}"),
+                'day': safe_get_attr(segment, 'day', seg_idx + 1),
+                'stop': f"{seg_idx + 1}/{len(segments)}",
+                'customer': str(customer),
+                'team': team_label,
+                'work_time': round(float(safe_get_attr(segment, 'work_time', 0) or 0), 1),
+                'drive_distance': int(round(float(safe_get_attr(segment, 'drive_distance', 0) or 0))),
+                'status': hotel_reason if hotel_reason else 'Normal arbetsplats',
+            }
+            feature = _point_feature(point, properties)
+            
+            if kind == 'hotel':
+                hotel_features.append(feature)
+            elif kind == 'home_return':
+                home_return_features.append(feature)
             else:
-                marker_type = 'normal'
-                icon_color = 'blue'
-                icon_name = 'wrench'
-                marker_color = color
-                total_normal_stops += 1
+                stop_features.append(feature)
             
-            # Skapa popup med detaljerad info
-            popup_html = f"""
-            <div style='width: 260px; font-family: Arial;'>
-                <h4 style='margin: 0 0 8px 0; color: {color}; border-bottom: 2px solid {color}; padding-bottom: 5px;'>
-                    Dag {day} - Stopp {seg_idx+1}/{len(segments)}
-                </h4>
-                <p style='margin: 5px 0; font-size: 13px;'>
-                    <b>📍 Plats:</b> {customer}<br>
-                    <b>👥 Team:</b> {team_id} ({team_name})<br>
-                    <b>⏱️ Arbetstid:</b> {work_time:.1f}h<br>
-                    <b>🚗 Körsträcka hit:</b> {drive_distance:.0f} km
-                </p>
-                <hr style='margin: 8px 0; border: none; border-top: 1px solid #ddd;'>
-                <p style='margin: 5px 0; font-size: 12px; background: {'#ffe6e6' if marker_type == 'hotel' else '#e6ffe6' if marker_type == 'home_return' else '#f0f0f0'}; padding: 8px; border-radius: 4px;'>
-                    <b>Status:</b><br>{hotel_reason if hotel_reason else 'Normal arbetsplats'}
-                </p>
-            </div>
-            """
+            if kind != 'home_return':
+                run.append(point)
+                continue
             
-            # Rita marker baserat på typ
-            if marker_type == 'hotel':
-                # HOTELLNATT - Röd bed-icon
-                folium.Marker(
-                    location=[lat, lon],
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=f"⚑ HOTELL: {customer}",
-                    icon=folium.Icon(color='red', icon='bed', prefix='fa')
-                ).add_to(fg)
-                
-            elif marker_type == 'home_return':
-                # HEMRESA - Grön circle marker
-                folium.CircleMarker(
-                    location=[lat, lon],
-                    radius=10,
-                    color='darkgreen',
-                    fill=True,
-                    fillColor='lightgreen',
-                    fillOpacity=0.8,
-                    weight=3,
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=f"✓ HEMRESA: {customer}"
-                ).add_to(fg)
-                
-            else:
-                # NORMAL - Färgad circle marker
-                folium.CircleMarker(
-                    location=[lat, lon],
-                    radius=8,
-                    color=color,
-                    fill=True,
-                    fillColor=color,
-                    fillOpacity=0.7,
-                    weight=2,
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=f"#{seg_idx+1}: {customer}"
-                ).add_to(fg)
+            # Hemresa: körningen hit avslutas med en streckad linje hem
+            if len(run) >= 2:
+                line_features.append(_line_feature(run, {'label': f"Team {team_label}"}))
+            if run:
+                home_return_legs.append(_line_feature(
+                    [run[-1], point], {'label': f"Hemresa efter {customer}", 'weight': 4}
+                ))
             
-            # Rita linje från föregående plats
-            if prev_location and len(prev_location) >= 2:
-                
-                if marker_type == 'home_return':
-                    # GRÖN STRECKAD LINJE för hemresa
-                    folium.PolyLine(
-                        [[prev_location[0], prev_location[1]], [lat, lon]],
-                        color='green',
-                        weight=4,
-                        opacity=0.7,
-                        dash_array='10, 10',
-                        tooltip=f"Hemresa efter {customer}"
-                    ).add_to(fg)
-                    
-                    # Linje från hem till nästa stopp (om inte sista)
-                    if home_base and seg_idx < len(segments) - 1:
-                        next_seg = segments[seg_idx + 1]
-                        next_loc = safe_get_attr(next_seg, 'location', None)
-                        if next_loc:
-                            next_lat = safe_get_attr(next_loc, 'latitude', None)
-                            next_lon = safe_get_attr(next_loc, 'longitude', None)
-                            if next_lat and next_lon:
-                                folium.PolyLine(
-                                    [[home_base[0], home_base[1]], [next_lat, next_lon]],
-                                    color='green',
-                                    weight=3,
-                                    opacity=0.5,
-                                    dash_array='5, 5',
-                                    tooltip=f"Från hemmabasen"
-                                ).add_to(fg)
-                        
-                        # Nästa prev_location är hemmabasen
-                        prev_location = home_base
-                    else:
-                        prev_location = (lat, lon)
-                        
-                else:
-                    # NORMAL FÄRGAD LINJE
-                    folium.PolyLine(
-                        [[prev_location[0], prev_location[1]], [lat, lon]],
-                        color=color,
-                        weight=3,
-                        opacity=0.6,
-                        tooltip=f"Till {customer}"
-                    ).add_to(fg)
-                    
-                    prev_location = (lat, lon)
+            # Linje från hem till nästa stopp (om inte sista)
+            if home and seg_idx < len(segments) - 1:
+                next_loc = safe_get_attr(segments[seg_idx + 1], 'location', None)
+                next_lat = safe_get_attr(next_loc, 'latitude', None) if next_loc else None
+                next_lon = safe_get_attr(next_loc, 'longitude', None) if next_loc else None
+                if next_lat and next_lon:
+                    home_return_legs.append(_line_feature(
+                        [home, (float(next_lat), float(next_lon))], {'label': "Från hemmabasen", 'weight': 3}
+                    ))
+                run = [home]
             else:
-                prev_location = (lat, lon)
+                run = [point]
+        
+        if len(run) >= 2:
+            line_features.append(_line_feature(run, {'label': f"Team {team_label}"}))
         
         # Sista resan hem (om inte redan hemma)
-        if prev_location and home_base:
-            if (prev_location[0] != home_base[0] or prev_location[1] != home_base[1]):
-                folium.PolyLine(
-                    [[prev_location[0], prev_location[1]], [home_base[0], home_base[1]]],
-                    color=color,
-                    weight=3,
-                    opacity=0.6,
-                    dash_array='10, 10',
-                    tooltip=f"Slutlig hemresa: {team_name}"
-                ).add_to(fg)
+        if run and home and run[-1] != home:
+            final_features.append(_line_feature([run[-1], home], {'label': f"Slutlig hemresa: {team_name}"}))
+        
+        _geojson_layer(line_features, style={'color': color, 'weight': 3, 'opacity': 0.6}).add_to(fg)
+        _geojson_layer(final_features, style={
+            'color': color, 'weight': 3, 'opacity': 0.6, 'dashArray': '10, 10'
+        }).add_to(fg)
+        _geojson_layer(stop_features, marker=folium.CircleMarker(
+            radius=8, color=color, fill=True, fill_color=color, fill_opacity=0.7, weight=2
+        ), popup=True).add_to(fg)
         
         # Lägg till feature group till kartan
         fg.add_to(m)
     
+    if hotel_features:
+        hotel_fg = folium.FeatureGroup(name="⚑ Hotellnätter", show=True)
+        _geojson_layer(hotel_features, marker=folium.Marker(
+            icon=folium.Icon(color='red', icon='bed', prefix='fa')
+        ), popup=True).add_to(hotel_fg)
+        hotel_fg.add_to(m)
+    
+    if home_return_features or home_return_legs:
+        home_return_fg = folium.FeatureGroup(name="✓ Hemresor", show=True)
+        _geojson_layer(home_return_legs, style={
+            'color': 'green', 'weight': 4, 'opacity': 0.6, 'dashArray': '10, 10'
+        }).add_to(home_return_fg)
+        _geojson_layer(home_return_features, marker=folium.CircleMarker(
+            radius=10, color='darkgreen', fill=True, fill_color='lightgreen', fill_opacity=0.8, weight=3
+        ), popup=True).add_to(home_return_fg)
+        home_return_fg.add_to(m)
+    
     # ========================================
     # OBESÖKTA PLATSER (Filtrerade bort eller utanför räckvidd)
     # ========================================
-    unvisited_count = 0
+    unvisited_features = []
     if all_locations and visited_locations:
         # Hitta platser som INTE besöktes
-        visited_ids = set()
-        for loc in visited_locations:
-            visited_ids.add(safe_get_attr(loc, 'id', None))
-        
-        # Skapa feature group för obesökta platser
-        unvisited_fg = folium.FeatureGroup(name="⚪ Obesökta platser", show=True)
+        visited_ids = {safe_get_attr(loc, 'id', None) for loc in visited_locations}
         
         for location in all_locations:
             loc_id = safe_get_attr(location, 'id', None)
+            lat = safe_get_attr(location, 'latitude', None)
+            lon = safe_get_attr(location, 'longitude', None)
             
-            # Om platsen inte besöktes
-            if loc_id and loc_id not in visited_ids:
-                lat = safe_get_attr(location, 'latitude', None)
-                lon = safe_get_attr(location, 'longitude', None)
+            if loc_id and loc_id not in visited_ids and lat and lon:
                 customer = safe_get_attr(location, 'customer', 'Okänd')
-                units = safe_get_attr(location, 'units', 0)
-                filter_val = safe_get_attr(location, 'filter_value', 0)
-                
-                if lat and lon:
-                    unvisited_count += 1
-                    
-                    # Popup för obesökt plats
-                    popup_html = f"""
-                    <div style='width: 220px; font-family: Arial;'>
-                        <h4 style='margin: 0 0 8px 0; color: #999; border-bottom: 2px solid #999; padding-bottom: 5px;'>
-                            ⚪ Obesökt plats
-                        </h4>
-                        <p style='margin: 5px 0; font-size: 13px;'>
-                            <b>📍 Kund:</b> {customer}<br>
-                            <b>📦 Enheter:</b> {units}<br>
-                            <b>🔍 Filtervärde:</b> {filter_val:.0f}
-                        </p>
-                        <hr style='margin: 8px 0;'>
-                        <p style='margin: 5px 0; font-size: 11px; color: #666; background: #f5f5f5; padding: 6px; border-radius: 4px;'>
-                            <b>Anledning:</b> Filtrerad bort eller för långt från alla team-baser
-                        </p>
-                    </div>
-                    """
-                    
-                    # Grå cirkel för obesökta
-                    folium.CircleMarker(
-                        location=[lat, lon],
-                        radius=4,
-                        color='#999',
-                        fill=True,
-                        fillColor='#ddd',
-                        fillOpacity=0.5,
-                        weight=1,
-                        popup=folium.Popup(popup_html, max_width=250),
-                        tooltip=f"⚪ {customer} (obesökt)"
-                    ).add_to(unvisited_fg)
+                unvisited_features.append(_point_feature((float(lat), float(lon)), {
+                    'label': f"⚪ {customer} (obesökt)",
+                    'customer': str(customer),
+                    'units': safe_get_attr(location, 'units', 0),
+                    'filter_value': round(float(safe_get_attr(location, 'filter_value', 0) or 0)),
+                    'status': 'Filtrerad bort eller för långt från alla team-baser',
+                }))
         
-        unvisited_fg.add_to(m)
+        if unvisited_features:
+            unvisited_fg = folium.FeatureGroup(name="⚪ Obesökta platser", show=True)
+            _geojson_layer(unvisited_features, marker=folium.CircleMarker(
+                radius=4, color='#999', fill=True, fill_color='#ddd', fill_opacity=0.5, weight=1
+            ), popup=UNVISITED_POPUP_FIELDS).add_to(unvisited_fg)
+            unvisited_fg.add_to(m)
+    
+    normal_stops = sum(
+        1 for route in team_routes for segment in safe_get_attr(route, 'segments', [])
+        if _stop_kind(safe_get_attr(segment, 'is_hotel_night', False),
+                      safe_get_attr(segment, 'hotel_reason', '')) == 'normal'
+    )
+    return normal_stops, len(hotel_features), len(home_return_features), len(unvisited_features)
+
+
+def _stop_kind(is_hotel: bool, hotel_reason: str) -> str:
+    """'hotel', 'home_return' eller 'normal'"""
+    if is_hotel:
+        return 'hotel'
+    if 'Hemresa' in hotel_reason or 'HEM' in hotel_reason.upper() or 'hem billigare' in hotel_reason.lower():
+        return 'home_return'
+    return 'normal'
+
+
+def _point_feature(point: Tuple[float, float], properties: Dict) -> Dict:
+    """GeoJSON-punkt från (lat, lon) - GeoJSON anger longitud först"""
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [round(point[1], 6), round(point[0], 6)]},
+        'properties': properties,
+    }
+
+
+def _line_feature(points: List[Tuple[float, float]], properties: Dict) -> Dict:
+    """GeoJSON-linje genom punkterna (lat, lon)"""
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'LineString',
+            'coordinates': [[round(lon, 6), round(lat, 6)] for lat, lon in points],
+        },
+        'properties': properties,
+    }
+
+
+def _geojson_layer(features: List[Dict], style: Dict = None, marker: Any = None,
+                   popup: Any = None) -> Any:
+    """
+    GeoJSON-lager med samma stil för alla objekt och tooltip från 'label'
     
-    # Layer control (för att visa/dölja teams)
-    folium.LayerControl(position='topright', collapsed=False).add_to(m)
+    popup=True ger stoppens popup (STOP_POPUP_FIELDS), en tupel andra fält.
+    Tomma lager returneras som en tom FeatureGroup.
+    """
+    import folium
+    
+    if not features:
+        return folium.FeatureGroup(control=False)
+    
+    fields = STOP_POPUP_FIELDS if popup is True else popup
+    return folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        style_function=(lambda _feature: style) if style else None,
+        marker=marker,
+        tooltip=folium.GeoJsonTooltip(fields=['label'], labels=False),
+        popup=folium.GeoJsonPopup(
+            fields=[field for field, _ in fields], aliases=[alias for _, alias in fields],
+            style="font-family: Arial; font-size: 13px;"
+        ) if fields else None,
+        control=False
+    )
+
+
+# Markör för ett stopp i klustrat läge. Raden är [lat, lon, kund, dag,
+# stoppnummer, arbetstid (h), körsträcka (km), hotellnatt (0/1)].
+_STOP_CALLBACK = """
+function callback(row) {
+    var hotel = row[7] === 1;
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: hotel ? 8 : 6, color: hotel ? 'red' : '%(color)s',
+        fillColor: hotel ? 'red' : '%(color)s', fillOpacity: 0.7, weight: 2
+    });
+    marker.bindTooltip((hotel ? '⚑ HOTELL: ' : '#' + row[4] + ': ') + row[2]);
+    marker.bindPopup('<b>Dag ' + row[3] + ' - Stopp ' + row[4] + '</b><br>📍 ' + row[2]
+        + '<br>👥 %(team)s<br>⏱️ Arbetstid: ' + row[5] + 'h<br>🚗 Körsträcka hit: ' + row[6] + ' km'
+        + (hotel ? '<br><b>Hotellnatt</b>' : ''));
+    return marker;
+}
+"""
+
+_UNVISITED_CALLBACK = """
+function callback(row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 4, color: '#999', fillColor: '#ddd', fillOpacity: 0.5, weight: 1
+    });
+    marker.bindTooltip('⚪ ' + row[2] + ' (obesökt)');
+    return marker;
+}
+"""
+
+
+def _add_clustered_layers(m: Any, team_routes: List[Any], colors: List[str], all_locations: List[Any],
+                          visited_locations: List[Any]) -> Tuple[int, int, int, int]:
+    """
+    Ritar stoppen som klustrade punkter och rutten som en linje per team och dag
     
-    # Fullscreen-knapp
-    plugins.Fullscreen(
-        position='topleft',
-        title='Fullskärm',
-        title_cancel='Avsluta fullskärm',
-        force_separate_button=True
-    ).add_to(m)
+    Punkterna skickas som en kompakt datalista och markörer och popups skapas
+    i webbläsaren, så HTML-storleken växer med några tiotal byte per stopp.
     
-    # Förbättrad legend med statistik
-    legend_html = f"""
-    <div style="position: fixed; 
-                bottom: 50px; right: 50px; width: 300px; 
-                background-color: white; border:2px solid #333; z-index:9999; 
-                font-size:13px; padding: 15px; border-radius: 8px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.3);
-                font-family: Arial, sans-serif;">
-        <h4 style="margin: 0 0 12px 0; border-bottom: 2px solid #333; padding-bottom: 8px;">
-            📊 Ruttöversikt
-        </h4>
-        <div style="margin: 8px 0;">
-            <p style="margin: 4px 0; line-height: 1.6;">
-                <b>👥 Antal team:</b> {len(team_routes)}<br>
-                <b>📍 Totalt stopp:</b> {total_normal_stops + total_hotels + total_home_returns}<br>
-                <b>⚑ Hotellnätter:</b> <span style="color: red; font-weight: bold;">{total_hotels}</span><br>
-                <b>✓ Hemresor:</b> <span style="color: green; font-weight: bold;">{total_home_returns}</span><br>
-                <b>⚪ Obesökta:</b> <span style="color: #999; font-weight: bold;">{unvisited_count}</span>
-            </p>
-        </div>
-        <hr style="margin: 12px 0; border: none; border-top: 1px solid #ddd;">
-        <div style="margin: 8px 0; font-size: 12px; line-height: 1.8;">
-            <p style="margin: 3px 0;">
-                <span style="font-size: 16px;">🏠</span> <b>Svart</b> = Hemmabas
-            </p>
-            <p style="margin: 3px 0;">
-                <span style="font-size: 16px; color: red;">⚑</span> <b>Röd</b> = Hotellnatt
-            </p>
-            <p style="margin: 3px 0;">
-                <span style="font-size: 16px; color: green;">✓</span> <b>Grön</b> = Hemresa (spar!)
-            </p>
-            <p style="margin: 3px 0;">
-                <span style="font-size: 16px;">⚫</span> <b>Färgad</b> = Arbetsplats
-            </p>
-            <p style="margin: 3px 0;">
-                <span style="font-size: 16px; color: #999;">⚪</span> <b>Grå</b> = Obesökt
-            </p>
-            <p style="margin: 3px 0;">
-                <span style="color: grey;">━━━</span> <b>Heldragen</b> = Normal rutt
-            </p>
-            <p style="margin: 3px 0;">
-                <span style="color: green;">╌╌╌</span> <b>Streckad</b> = Hemresa
-            </p>
-        </div>
-        <div style="margin-top: 12px; padding: 8px; background: #f8f9fa; border-radius: 4px; font-size: 11px; color: #666;">
-            💡 <b>Tips:</b> Klicka på markers för detaljer. Använd Layer Control (↗) för att visa/dölja team.
-        </div>
-    </div>
+    Returns:
+        (normala stopp, hotellnätter, hemresor, obesökta platser)
     """
+    import folium
+    from folium import plugins
     
-    m.get_root().html.add_child(folium.Element(legend_html))
+    total_hotels = 0
+    total_normal_stops = 0
     
-    # Generera HTML
-    html_string = m._repr_html_()
+    for team_idx, route in enumerate(team_routes):
+        color = colors[team_idx]
+        
+        team = safe_get_attr(route, 'team', None)
+        team_id = safe_get_attr(team, 'id', team_idx + 1) if team else team_idx + 1
+        team_name = safe_get_attr(team, 'home_name', f'Team {team_id}') if team else f'Team {team_id}'
+        home_base = safe_get_attr(team, 'home_base', None) if team else None
+        
+        segments = safe_get_attr(route, 'segments', [])
+        if not segments:
+            continue
+        
+        fg = folium.FeatureGroup(name=f"Team {team_id} - {team_name}", show=True)
+        
+        if home_base and len(home_base) >= 2:
+            folium.Marker(
+                location=[home_base[0], home_base[1]],
+                popup=f"<b>🏠 {team_name}</b><br>Hemmabas<br>Team {team_id}",
+                tooltip=f"🏠 Hemmabas: {team_name}",
+                icon=folium.Icon(color='black', icon='home', prefix='fa')
+            ).add_to(fg)
+        
+        # Stoppen grupperade per arbetsdag (ankomstdatum) i ruttordning
+        rows = []
+        days: List[List[Tuple[float, float]]] = []
+        previous_date = None
+        for seg_idx, segment in enumerate(segments):
+            location = safe_get_attr(segment, 'location', None)
+            if not location:
+                continue
+            lat = safe_get_attr(location, 'latitude', None)
+            lon = safe_get_attr(location, 'longitude', None)
+            if lat is None or lon is None:
+                continue
+            
+            arrival = safe_get_attr(segment, 'arrival_time', None)
+            date = arrival.date() if arrival is not None else seg_idx
+            if date != previous_date or not days:
+                days.append([])
+                previous_date = date
+            days[-1].append((float(lat), float(lon)))
+            
+            is_hotel = bool(safe_get_attr(segment, 'is_hotel_night', False))
+            if is_hotel:
+                total_hotels += 1
+            else:
+                total_normal_stops += 1
+            
+            rows.append([
+                round(float(lat), 6), round(float(lon), 6), str(safe_get_attr(location, 'customer', 'Okänd kund')),
+                len(days), seg_idx + 1,
+                round(float(safe_get_attr(segment, 'work_time', 0) or 0), 1),
+                int(round(float(safe_get_attr(segment, 'drive_distance', 0) or 0))),
+                int(is_hotel)
+            ])
+        
+        # En linje per dag som fortsätter från föregående dags sista stopp
+        home = (float(home_base[0]), float(home_base[1])) if home_base and len(home_base) >= 2 else None
+        day_lines = []
+        previous_point = home
+        for day_number, points in enumerate(days, 1):
+            path = ([previous_point] if previous_point else []) + points
+            if len(path) >= 2:
+                day_lines.append(_line_feature(path, {'label': f"{team_name} dag {day_number}: {len(points)} stopp"}))
+            previous_point = points[-1]
+        _geojson_layer(day_lines, style={'color': color, 'weight': 3, 'opacity': 0.6}).add_to(fg)
+        
+        if previous_point and home and previous_point != home:
+            _geojson_layer(
+                [_line_feature([previous_point, home], {'label': f"Slutlig hemresa: {team_name}"})],
+                style={'color': color, 'weight': 3, 'opacity': 0.6, 'dashArray': '10, 10'}
+            ).add_to(fg)
+        
+        callback = _STOP_CALLBACK % {
+            'color': color,
+            'team': f"Team {team_id} ({team_name})".replace("'", "\\'")
+        }
+        plugins.FastMarkerCluster(rows, callback=callback, control=False).add_to(fg)
+        fg.add_to(m)
     
-    return html_string
+    unvisited_count = 0
+    if all_locations and visited_locations:
+        visited_ids = {safe_get_attr(loc, 'id', None) for loc in visited_locations}
+        unvisited_rows = []
+        for location in all_locations:
+            loc_id = safe_get_attr(location, 'id', None)
+            lat = safe_get_attr(location, 'latitude', None)
+            lon = safe_get_attr(location, 'longitude', None)
+            if loc_id and loc_id not in visited_ids and lat and lon:
+                unvisited_rows.append([round(float(lat), 6), round(float(lon), 6), str(safe_get_attr(location, 'customer', 'Okänd'))])
+        
+        unvisited_count = len(unvisited_rows)
+        if unvisited_rows:
+            plugins.FastMarkerCluster(
+                unvisited_rows, callback=_UNVISITED_CALLBACK, name="⚪ Obesökta platser"
+            ).add_to(m)
+    
+    # Hemresor markeras bara i det detaljerade läget
+    return total_normal_stops, total_hotels, 0, unvisited_count
 
 
 def create_simple_overview_map(team_routes: List[Any]) -> str:
@@ -461,6 +650,7 @@ def create_simple_overview_map(team_routes: List[Any]) -> str:
     Returns:
         HTML som sträng
     """
+    import folium
     
     if not team_routes:
         return "<html><body><h3>Ingen data att visa</h3></body></html>"
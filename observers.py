@@ -0,0 +1,387 @@
+"""
+Observers Module
+Händelser från optimeringen (steg, team-antal, rutter, förbättringar)
+
+RouteOptimizer anropar sin observer (attributet 'observer') istället för att
+skriva ut text. Standard är OptimizationObserver, som inte gör något. Appen,
+kommandoraden och benchmarks ärver och skriver över de metoder de behöver.
+Data som bara behövs för händelserna (t.ex. ruttlängd före förbättring)
+beräknas bara när observerns 'active' är True.
+"""
+
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence
+
+from time_budget import STAGES
+
+
+class OptimizationObserver:
+    """Bas för observers - alla metoder gör ingenting"""
+    
+    # True om observern tar emot händelser som kostar något att ta fram
+    active = False
+    
+    def stage_started(self, stage: str):
+        """Ett steg (se time_budget.STAGES) startar"""
+    
+    def stage_finished(self, stage: str, seconds: float):
+        """Ett steg är klart"""
+    
+    def step_started(self, step: str):
+        """Ett delsteg (se STEP_NAMES) inom ett steg startar"""
+    
+    def step_finished(self, step: str, seconds: float):
+        """Ett delsteg är klart"""
+    
+    def sweep_started(self, min_teams: int, max_teams: int):
+        """Genomsökningen av antal team startar"""
+    
+    def team_count_started(self, num_teams: int, done: int, total: int):
+        """Ett antal team börjar testas (done = antal klara innan detta)"""
+    
+    def team_count_finished(self, num_teams: int, result: Optional[Dict], done: int, total: int):
+        """Ett antal team är testat (result är None om inga rutter kunde byggas)"""
+    
+    def team_counts_submitted(self, team_counts: Sequence[int], done: int, total: int):
+        """
+        Flera antal team lämnas till parallella processer (config 'parallel_workers')
+        Standard är team_count_started för vart och ett.
+        """
+        for num_teams in team_counts:
+            self.team_count_started(num_teams, done, total)
+    
+    def team_count_skipped(self, num_teams: int, done: int, total: int):
+        """Ett antal team som lämnats till en process hann inte testas före tidsgränsen"""
+    
+    def time_limit_reached(self, untested: Sequence[int]):
+        """Tidsgränsen nåddes innan alla team-antal testats"""
+    
+    def sweep_finished(self, optimal_teams: Optional[int], best_result: Optional[Dict]):
+        """Bästa antal team är valt bland de testade"""
+    
+    def locations_distributed(self, teams: List, counts: Dict[int, int],
+                              outside_range: int, weekend_work_mode: bool):
+        """Platserna är fördelade på teamen (counts: team ID -> antal platser)"""
+    
+    def route_improved(self, kind: str, before_km: float, after_km: float):
+        """
+        En förbättring är klar ('route' = en rutt, 'fleet' = mellan team)
+        Anropas bara om observern är aktiv.
+        """
+    
+    def team_route_built(self, team_route):
+        """En rutt är schemalagd och prissatt (TeamRoute)"""
+    
+    def distances_computed(self, count: int):
+        """Antal avstånd som beräknats (hel matris eller delmatriser)"""
+    
+    def message(self, text: str):
+        """Övrig information, t.ex. att ett steg hoppas över"""
+
+
+class CompositeObserver(OptimizationObserver):
+    """Skickar varje händelse vidare till flera observers"""
+    
+    def __init__(self, observers: Sequence[OptimizationObserver]):
+        self.observers = list(observers)
+        self.active = any(observer.active for observer in self.observers)
+
+
+class PrintObserver(OptimizationObserver):
+    """Skriver optimeringens förlopp till stdout (som tidigare utskrifter)"""
+    
+    def sweep_started(self, min_teams: int, max_teams: int):
+        print(f"\n{'='*60}")
+        print(f"OPTIMERAR ANTAL TEAM ({min_teams}-{max_teams})")
+        print(f"{'='*60}\n")
+    
+    def team_count_started(self, num_teams: int, done: int, total: int):
+        print(f"\n--- Testar {num_teams} team ---")
+    
+    def team_count_finished(self, num_teams: int, result: Optional[Dict], done: int, total: int):
+        if result is None:
+            return
+        print(f"  Total kostnad: {result['total_cost']:,.0f} kr")
+        print(f"  Kostnad per plats: {result['cost_per_location']:,.0f} kr")
+        print(f"  Max dagar: {result['total_days']}")
+    
+    def time_limit_reached(self, untested: Sequence[int]):
+        print(f"\n⏱️ Tidsgränsen nådd - {len(untested)} team-antal otestade")
+    
+    def sweep_finished(self, optimal_teams: Optional[int], best_result: Optional[Dict]):
+        if best_result is None:
+            return
+        print(f"\n{'='*60}")
+        print(f"OPTIMALT: {optimal_teams} team med {best_result['cost_per_location']:,.0f} kr/plats")
+        print(f"{'='*60}\n")
+    
+    def locations_distributed(self, teams: List, counts: Dict[int, int],
+                              outside_range: int, weekend_work_mode: bool):
+        print("\n" + "="*60)
+        if weekend_work_mode:
+            print("GÖTEBORG WEEKEND WORK MODE - GEOGRAFISK FÖRDELNING")
+        else:
+            print("TILLDELAR PLATSER TILL NÄRMASTE TEAM")
+        print("="*60)
+        
+        total = sum(counts.values())
+        if weekend_work_mode:
+            clusters = sum(1 for count in counts.values() if count > 0)
+            print(f"\n✅ Geografisk clustering: {total} platser fördelade i {clusters} kluster")
+        elif outside_range > 0:
+            print(f"⚠️ {outside_range} platser utanför max_distance - tilldelade ändå till närmaste team")
+        
+        print(f"\nFördelning av {total} platser:")
+        for team in teams:
+            count = counts.get(team.id, 0)
+            if count > 0:
+                print(f"  Team {team.id} ({team.home_name}): {count:3d} platser")
+        print("="*60 + "\n")
+    
+    def message(self, text: str):
+        print(text)
+
+
+class ProgressObserver(OptimizationObserver):
+    """
+    Gör om team-antalshändelser till förloppshändelser för en callback
+    (dictionary med event, num_teams, done, total och progress 0-1)
+    """
+    
+    def __init__(self, callback: Callable[[Dict], None]):
+        self.callback = callback
+    
+    def team_count_started(self, num_teams: int, done: int, total: int):
+        self._send('team_count_started', num_teams, done, total)
+    
+    def team_count_finished(self, num_teams: int, result: Optional[Dict], done: int, total: int):
+        self._send('team_count_done', num_teams, done, total)
+    
+    def team_count_skipped(self, num_teams: int, done: int, total: int):
+        self._send('team_count_skipped', num_teams, done, total)
+    
+    def _send(self, event: str, num_teams: int, done: int, total: int):
+        self.callback({
+            'event': event,
+            'num_teams': num_teams,
+            'done': done,
+            'total': total,
+            'progress': done / max(total, 1),
+        })
+
+
+def _dispatch(name: str):
+    def dispatch(self, *args, **kwargs):
+        for observer in self.observers:
+            getattr(observer, name)(*args, **kwargs)
+    dispatch.__name__ = name
+    return dispatch
+
+
+# CompositeObserver delar ut alla händelsemetoder till sina observers
+for _name, _value in list(vars(OptimizationObserver).items()):
+    if callable(_value) and not _name.startswith('_'):
+        setattr(CompositeObserver, _name, _dispatch(_name))
+
+# Delsteg som ProfilingObserver redovisar under respektive steg
+STEP_NAMES = {
+    'load_data': 'Läsa och filtrera data',
+    'create_locations': 'Skapa platser',
+    'create_teams': 'Skapa team',
+    'distribute': 'Fördelning (KMeans/närmaste team)',
+    'nearest_neighbour': 'Nearest neighbour',
+    'route_search': 'Ruttförbättring (2-opt/Or-opt/3-opt)',
+    'fleet_search': 'Sökning mellan team',
+    'route_segments': 'Schema (calculate_route_segments)',
+    'day_split': 'Dagsindelning (split_route_days)',
+    'costing': 'Kostnadsberäkning',
+}
+
+
+class _Frame:
+    """Mätvärden för ett pågående steg, delsteg eller team-antal"""
+    
+    def __init__(self, key):
+        self.key = key
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.distances = 0
+        self.peak = 0
+
+
+class ProfilingObserver(OptimizationObserver):
+    """
+    Samlar väggtid, CPU-tid, antal anrop, antal beräknade avstånd och
+    (med memory=True) högsta minnesanvändning per steg, delsteg och testat
+    antal team. Används som context manager runt en körning; flera körningar
+    (t.ex. continue_optimization) ackumuleras.
+    
+    Minnet mäts med tracemalloc, som gör Python-koden märkbart långsammare
+    och gäller hela processen - samtidiga körningar påverkar varandras värden.
+    CPU-tiden är processens, dvs. alla trådar.
+    """
+    
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.distance_evaluations = 0
+        self.peak_bytes = 0
+        self.entries: Dict = {}
+        self.team_counts: Dict[int, Dict] = {}
+        self._frames: List[_Frame] = []
+        self._session: Optional[_Frame] = None
+        self._owns_tracing = False
+    
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self._session = _Frame(None)
+        self._frames.append(self._session)
+        self._sample_memory()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._sample_memory()
+        session = self._session
+        self._frames = []
+        self.wall_s += time.perf_counter() - session.wall
+        self.cpu_s += time.process_time() - session.cpu
+        self.peak_bytes = max(self.peak_bytes, session.peak)
+        self._session = None
+        
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        return False
+    
+    def stage_started(self, stage: str):
+        self._open((stage, None))
+    
+    def stage_finished(self, stage: str, seconds: float):
+        self._close((stage, None))
+    
+    def step_started(self, step: str):
+        # Delsteget redovisas under det yttersta pågående steget
+        stage = next((frame.key[0] for frame in self._frames
+                      if frame.key is not None and frame.key[1] is None), None)
+        self._open((stage, step))
+    
+    def step_finished(self, step: str, seconds: float):
+        frame = next((frame for frame in reversed(self._frames)
+                      if frame.key is not None and frame.key[1] == step), None)
+        if frame is not None:
+            self._close(frame.key)
+    
+    def team_count_started(self, num_teams: int, done: int, total: int):
+        self._open(('team_count', num_teams))
+    
+    def team_counts_submitted(self, team_counts: Sequence[int], done: int, total: int):
+        # Mäts i arbetsprocesserna - här blir bara resultatet känt
+        pass
+    
+    def team_count_finished(self, num_teams: int, result: Optional[Dict], done: int, total: int):
+        frame = self._close(('team_count', num_teams))
+        if frame is None:
+            # Testat i en annan process - bara resultatet är känt
+            self.team_counts[num_teams] = {'num_teams': num_teams, 'wall_s': None, 'cpu_s': None,
+                                           'distance_evaluations': None, 'peak_memory_mb': None}
+        if result is not None:
+            self.team_counts[num_teams]['total_cost'] = result['total_cost']
+    
+    def distances_computed(self, count: int):
+        self.distance_evaluations += count
+        for frame in self._frames:
+            frame.distances += count
+    
+    def report(self) -> Dict:
+        """
+        Sammanställer profilen
+        
+        Returns:
+            Dictionary med wall_s, cpu_s, distance_evaluations, peak_memory_mb
+            (None utan minnesmätning), stages (lista med name, stage (None för
+            steg, annars stegets namn för delsteg), calls, wall_s, cpu_s,
+            distance_evaluations, peak_memory_mb) och team_counts
+        """
+        stage_order = {name: i for i, name in enumerate(STAGES)}
+        step_order = {name: i for i, name in enumerate(STEP_NAMES)}
+        
+        def order(key):
+            stage, step = key
+            return (stage_order.get(stage, len(STAGES)), stage or '',
+                    -1 if step is None else step_order.get(step, len(STEP_NAMES)), step or '')
+        
+        stages = []
+        for key in sorted(self.entries, key=order):
+            stage, step = key
+            entry = self.entries[key]
+            stages.append({
+                'name': step if step is not None else stage,
+                'stage': stage if step is not None else None,
+                **self._measurements(entry),
+                'calls': entry['calls'],
+            })
+        
+        return {
+            'wall_s': self.wall_s,
+            'cpu_s': self.cpu_s,
+            'distance_evaluations': self.distance_evaluations,
+            'peak_memory_mb': self.peak_bytes / 2**20 if self.memory else None,
+            'stages': stages,
+            'team_counts': [self.team_counts[n] for n in sorted(self.team_counts)],
+        }
+    
+    def _measurements(self, entry: Dict) -> Dict:
+        return {
+            'wall_s': entry['wall_s'],
+            'cpu_s': entry['cpu_s'],
+            'distance_evaluations': entry['distance_evaluations'],
+            'peak_memory_mb': entry['peak_bytes'] / 2**20 if self.memory else None,
+        }
+    
+    def _open(self, key):
+        self._sample_memory()
+        self._frames.append(_Frame(key))
+    
+    def _close(self, key) -> Optional[Dict]:
+        frame = next((frame for frame in reversed(self._frames) if frame.key == key), None)
+        if frame is None:
+            return None
+        
+        self._sample_memory()
+        self._frames.remove(frame)
+        
+        wall = time.perf_counter() - frame.wall
+        cpu = time.process_time() - frame.cpu
+        
+        if key[0] == 'team_count':
+            entry = {'num_teams': key[1], 'wall_s': wall, 'cpu_s': cpu,
+                     'distance_evaluations': frame.distances, 'peak_bytes': frame.peak}
+            self.team_counts[key[1]] = {'num_teams': key[1], **self._measurements(entry)}
+            return self.team_counts[key[1]]
+        
+        entry = self.entries.setdefault(key, {
+            'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'distance_evaluations': 0, 'peak_bytes': 0
+        })
+        entry['calls'] += 1
+        entry['wall_s'] += wall
+        entry['cpu_s'] += cpu
+        entry['distance_evaluations'] += frame.distances
+        entry['peak_bytes'] = max(entry['peak_bytes'], frame.peak)
+        return entry
+    
+    def _sample_memory(self):
+        """För in högsta minnet sedan förra mätningen i alla pågående ramar"""
+        if not self.memory or not tracemalloc.is_tracing():
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        for frame in self._frames:
+            frame.peak = max(frame.peak, peak)
+        tracemalloc.reset_peak()
+
+
+# Delad no-op observer (standard i RouteOptimizer)
+NULL_OBSERVER = OptimizationObserver()
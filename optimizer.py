@@ -3,15 +3,56 @@ Route Optimizer Engine - Uppdaterad med Göteborg Weekend Work Mode
 Hanterar ruttoptimering, kostnadsberäkningar och schemaläggning
 """
 
-import pandas as pd
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
 import numpy as np
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
-from scipy.spatial.distance import cdist
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, replace
+from day_split import leg_hours, optimal_day_split
+from distance_cache import DistanceCache
+from distance_matrix import DistanceMatrix, haversine_matrix
+from fleet_improvement import fleet_length, improve_fleet
+from observers import (
+    NULL_OBSERVER, CompositeObserver, OptimizationObserver, ProfilingObserver, ProgressObserver
+)
+from time_budget import TimeBudget
+from workday_calendar import WorkdayCalendar
+from spatial_index import SpatialIndex
+from route_improvement import DEFAULT_MOVES, improve_route, matrix_with_depot, neighbour_lists, path_length
 import warnings
 warnings.filterwarnings('ignore')
 
+# pandas importeras först när data läses in (load_data/create_locations),
+# så att appen, jobbkön och arbetsprocesser startar snabbare
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Största antal platser som hela avståndsmatrisen byggs för (5 000 platser ~ 200 MB)
+FULL_MATRIX_MAX_LOCATIONS = 5000
+
+# Config-nycklar som bara påverkar prissättningen. Ändras bara dessa kan
+# befintliga rutter prissättas om utan ny optimering (team_size påverkar
+# även arbetstiden per plats och räknas därför som ruttpåverkande). Med
+# 'day_split' påverkar även priserna rutterna, se requires_rerouting.
+PRICING_CONFIG_KEYS = frozenset({'labor_cost', 'vehicle_cost', 'hotel_cost'})
+
+# Config-nycklar som bara styr själva körningen (tidsgräns, processer,
+# minnesmätning, cachekatalog, kartans klustring) - de påverkar varken rutter
+# eller priser och kräver därför aldrig ny optimering
+RUNTIME_CONFIG_KEYS = frozenset({
+    'time_limit_s', 'parallel_workers', 'profile_memory',
+    'distance_cache_dir', 'distance_cache_max_mb', 'map_cluster_threshold',
+})
+
+# Config-nycklar som load_data (filtrering) respektive create_locations
+# (arbetstid per plats) läser - resultaten kan cachas per värde på dessa
+FILTER_CONFIG_KEYS = ('min_filter_value', 'priority_threshold', 'exclude_customers')
+LOCATION_CONFIG_KEYS = ('team_size', 'setup_time', 'work_time_per_unit')
+
 
 @dataclass
 class Location:
@@ -56,6 +97,108 @@ class TeamRoute:
     total_drive_time: float
     hotel_nights: int
     total_cost: float
+    # Besparing (kr) mot den giriga dagsindelningen när config 'day_split' används
+    day_split_saving: float = 0.0
+
+
+class LocationTable:
+    """
+    Platser i kolumnformat - en NumPy-array per fält (struct-of-arrays)
+    
+    Beräkningar (avstånd, tilldelning, arbetstid) använder arrayerna direkt.
+    Location-objekt skapas först när de efterfrågas via indexering, iteration
+    eller to_locations() och cachas, så samma plats ger alltid samma objekt.
+    """
+    
+    def __init__(self, ids: Sequence[str], customers: Sequence[str],
+                 latitudes: Sequence[float], longitudes: Sequence[float],
+                 units: Sequence[int], filter_values: Sequence[float],
+                 work_times: Sequence[float]):
+        self.ids = np.asarray(ids, dtype=object)
+        self.customers = np.asarray(customers, dtype=object)
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.units = np.asarray(units, dtype=np.int64)
+        self.filter_values = np.asarray(filter_values, dtype=float)
+        self.work_times = np.asarray(work_times, dtype=float)
+        
+        lengths = {len(column) for column in (
+            self.ids, self.customers, self.latitudes, self.longitudes,
+            self.units, self.filter_values, self.work_times
+        )}
+        if len(lengths) > 1:
+            raise ValueError(f"Kolumnerna i LocationTable har olika längd: {sorted(lengths)}")
+        
+        self._objects: List[Optional[Location]] = [None] * len(self.ids)
+    
+    @classmethod
+    def from_locations(cls, locations: Sequence[Location]) -> 'LocationTable':
+        """Bygger tabellen från befintliga Location-objekt (som återanvänds)"""
+        table = cls(
+            [loc.id for loc in locations],
+            [loc.customer for loc in locations],
+            [loc.latitude for loc in locations],
+            [loc.longitude for loc in locations],
+            [loc.units for loc in locations],
+            [loc.filter_value for loc in locations],
+            [loc.work_time for loc in locations]
+        )
+        table._objects = list(locations)
+        return table
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __getitem__(self, index: int) -> Location:
+        if index < 0:
+            index += len(self)
+        location = self._objects[index]
+        
+        if location is None:
+            location = Location(
+                id=self.ids[index],
+                customer=self.customers[index],
+                latitude=float(self.latitudes[index]),
+                longitude=float(self.longitudes[index]),
+                units=int(self.units[index]),
+                filter_value=float(self.filter_values[index]),
+                work_time=float(self.work_times[index])
+            )
+            self._objects[index] = location
+        
+        return location
+    
+    def __iter__(self) -> Iterator[Location]:
+        for index in range(len(self)):
+            yield self[index]
+    
+    def to_locations(self) -> List[Location]:
+        """Alla platser som Location-objekt"""
+        missing = [i for i, location in enumerate(self._objects) if location is None]
+        
+        if missing:
+            columns = zip(
+                self.ids[missing].tolist(), self.customers[missing].tolist(),
+                self.latitudes[missing].tolist(), self.longitudes[missing].tolist(),
+                self.units[missing].tolist(), self.filter_values[missing].tolist(),
+                self.work_times[missing].tolist()
+            )
+            for i, values in zip(missing, columns):
+                self._objects[i] = Location(*values)
+        
+        return list(self._objects)
+    
+    def view(self) -> 'LocationTable':
+        """Tabell som delar kolumnerna men har en egen (tom) cache av Location-objekt"""
+        table = LocationTable.__new__(LocationTable)
+        table.__dict__.update(self.__getstate__())
+        return table
+    
+    def __getstate__(self) -> Dict:
+        # Skicka bara kolumnerna (t.ex. till andra processer), inte objektcachen
+        state = self.__dict__.copy()
+        state['_objects'] = [None] * len(self.ids)
+        return state
 
 
 class HomeBaseManager:
@@ -124,13 +267,13 @@ class HomeBaseManager:
         return cities
     
     @classmethod
-    def suggest_home_bases(cls, locations: List[Location], num_bases: int, 
+    def suggest_home_bases(cls, locations: Sequence[Location], num_bases: int, 
                           allowed_cities: Optional[List[str]] = None) -> List[Tuple[float, float, str]]:
         """
         Föreslår optimala hemmabaser baserat på datadensitet
         
         Args:
-            locations: Lista med platser att besöka
+            locations: Platser att besöka (lista eller LocationTable)
             num_bases: Antal hemmabaser som behövs
             allowed_cities: Lista med tillåtna städer (None = alla)
         
@@ -148,25 +291,29 @@ class HomeBaseManager:
         if not available_cities:
             return []
         
+        # Beräkna avstånd från alla städer till alla platser i en matris
+        if isinstance(locations, LocationTable):
+            latitudes, longitudes = locations.latitudes, locations.longitudes
+        else:
+            latitudes = [loc.latitude for loc in locations]
+            longitudes = [loc.longitude for loc in locations]
+        
+        distances = haversine_matrix(
+            [city[0] for city in available_cities],
+            [city[1] for city in available_cities],
+            latitudes,
+            longitudes
+        )
+        
         # Beräkna densitet för varje stad
         city_scores = []
         
-        for city in available_cities:
-            lat, lon, name = city
-            
-            # Beräkna genomsnittligt avstånd till alla platser
-            distances = []
-            for loc in locations:
-                dist = RouteOptimizer.static_calculate_distance(
-                    lat, lon, loc.latitude, loc.longitude
-                )
-                distances.append(dist)
-            
-            avg_distance = np.mean(distances)
-            min_distance = np.min(distances)
+        for city, city_distances in zip(available_cities, distances):
+            avg_distance = np.mean(city_distances)
+            min_distance = np.min(city_distances)
             
             # Räkna platser inom 200 km
-            nearby_count = sum(1 for d in distances if d <= 200)
+            nearby_count = int(np.count_nonzero(city_distances <= 200))
             
             # Score: lägre är bättre (närmare till data)
             # Vikta närhet och antal närliggande platser
@@ -186,11 +333,70 @@ class RouteOptimizer:
     
     def __init__(self, config: Dict):
         self.config = config
-        self.locations: List[Location] = []
         self.teams: List[Team] = []
         
-    def load_data(self, df: pd.DataFrame, profile: Dict) -> pd.DataFrame:
+        # Platserna finns som kolumntabell och/eller Location-lista; den som
+        # saknas byggs från den andra vid första användning
+        self._locations: Optional[List[Location]] = []
+        self._location_table: Optional[LocationTable] = None
+        self._table_source: Optional[List[Location]] = None
+        
+        # Förberäknad avståndsmatris, byggs vid första användning
+        self._distance_matrix: Optional[DistanceMatrix] = None
+        self._matrix_table: Optional[LocationTable] = None
+        self._positions_table: Optional[LocationTable] = None
+        self._location_positions: Dict[int, int] = {}
+        self._cache: Optional[DistanceCache] = None
+        
+        # Tidsbudget (config 'time_limit_s', None = ingen gräns) och tid per steg
+        self.budget = TimeBudget(config.get('time_limit_s'))
+        
+        # Team-antal som återstår att testa och hittills testade resultat
+        self.pending_team_counts: List[int] = []
+        self.team_results: List[Dict] = []
+        self.team_count_total = 0
+        
+        # Tar emot händelser från optimeringen (se observers.py), standard no-op
+        self.observer: OptimizationObserver = NULL_OBSERVER
+        
+        # Profil per steg och team-antal (sätts av run_optimization)
+        self.profiler: Optional[ProfilingObserver] = None
+        
+        # Arbetsdagskalender per team (None = utan teamets spärrdatum)
+        self._calendars: Dict[Optional[int], WorkdayCalendar] = {}
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Mäter ett steg i tidsbudgeten och meddelar observern"""
+        with self.budget.stage(name) as outer:
+            if not outer or self.observer is NULL_OBSERVER:
+                yield
+                return
+            
+            self.observer.stage_started(name)
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observer.stage_finished(name, time.perf_counter() - start)
+    
+    @contextmanager
+    def step(self, name: str):
+        """Delsteg inom ett steg - rapporteras bara till observern, inte tidsbudgeten"""
+        if self.observer is NULL_OBSERVER:
+            yield
+            return
+        
+        self.observer.step_started(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observer.step_finished(name, time.perf_counter() - start)
+    
+    def load_data(self, df: 'pd.DataFrame', profile: Dict) -> 'pd.DataFrame':
         """Laddar och bearbetar data enligt profil"""
+        import pandas as pd
         
         # Kopiera för att inte modifiera original
         data = df.copy()
@@ -240,10 +446,45 @@ class RouteOptimizer:
         
         return data
     
-    def create_locations(self, data: pd.DataFrame, profile: Dict) -> List[Location]:
-        """Skapar Location-objekt från data"""
+    @property
+    def locations(self) -> List[Location]:
+        """Platserna som Location-objekt (skapas från tabellen vid första användning)"""
+        if self._locations is None:
+            self._locations = self._location_table.to_locations()
+            self._table_source = self._locations
+        return self._locations
+    
+    @locations.setter
+    def locations(self, locations: List[Location]):
+        self._locations = locations
+        self._location_table = None
+        self._table_source = None
+    
+    @property
+    def location_table(self) -> LocationTable:
+        """Platserna i kolumnformat (byggs från self.locations om det behövs)"""
+        if self._locations is not None and (
+                self._location_table is None
+                or self._table_source is not self._locations
+                or len(self._location_table) != len(self._locations)):
+            self._location_table = LocationTable.from_locations(self._locations)
+            self._table_source = self._locations
+        return self._location_table
+    
+    @location_table.setter
+    def location_table(self, table: LocationTable):
+        self._location_table = table
+        self._locations = None
+        self._table_source = None
+    
+    def create_locations(self, data: 'pd.DataFrame', profile: Dict) -> LocationTable:
+        """
+        Skapar platstabellen från data med vektoriserade pandas-operationer
         
-        locations = []
+        Location-objekt skapas först när self.locations (eller tabellen)
+        indexeras, t.ex. när rutterna byggs.
+        """
+        import pandas as pd
         
         # Hämta team_size och beräkna efficiency factor
         team_size = self.config.get('team_size', 2)
@@ -257,40 +498,50 @@ class RouteOptimizer:
             # För fler än 2 personer, använd en generell formel
             efficiency_factor = 1.0 + (team_size - 1) * 0.8
         
-        for idx, row in data.iterrows():
-            # Beräkna arbetstid
-            units = row.get('units', 1)
-            if isinstance(units, str):
-                units = 1  # Om units är text (t.ex. servicetyp), sätt till 1
-            else:
-                try:
-                    units = int(units)
-                except:
-                    units = 1
-            
-            # Bas arbetstid (för 1 person)
-            base_work_time = (
-                self.config['setup_time'] / 60 +  # Setup i timmar
-                units * self.config['work_time_per_unit'] / 60  # Arbete per enhet i timmar
-            )
-            
-            # Justera arbetstid baserat på team efficiency
-            work_time = base_work_time / efficiency_factor
-            
-            location = Location(
-                id=f"LOC_{idx}",
-                customer=row['customer'],
-                latitude=row['latitude'],
-                longitude=row['longitude'],
-                units=units,
-                filter_value=row['filter_value'],
-                work_time=work_time
-            )
-            
-            locations.append(location)
+        units = self._coerce_units(data)
+        
+        # Bas arbetstid (för 1 person)
+        base_work_time = (
+            self.config['setup_time'] / 60 +  # Setup i timmar
+            units * self.config['work_time_per_unit'] / 60  # Arbete per enhet i timmar
+        )
+        
+        # Justera arbetstid baserat på team efficiency
+        work_time = base_work_time / efficiency_factor
+        
+        table = LocationTable(
+            ids=("LOC_" + data.index.astype(str)).to_numpy(dtype=object),
+            customers=data['customer'].to_numpy(dtype=object),
+            latitudes=data['latitude'].to_numpy(dtype=float),
+            longitudes=data['longitude'].to_numpy(dtype=float),
+            units=units,
+            filter_values=pd.to_numeric(data['filter_value'], errors='coerce').to_numpy(dtype=float),
+            work_times=work_time
+        )
+        
+        self.location_table = table
+        return table
+    
+    @staticmethod
+    def _coerce_units(data: 'pd.DataFrame') -> np.ndarray:
+        """
+        Antal enheter per rad som heltal
+        Text (t.ex. servicetyp), saknade och ogiltiga värden blir 1
+        """
+        import pandas as pd
+        
+        if 'units' not in data.columns:
+            return np.ones(len(data), dtype=np.int64)
+        
+        column = data['units']
         
-        self.locations = locations
-        return locations
+        if not (pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column)):
+            # Blandad kolumn - text räknas som 1 även om den ser ut som ett tal
+            is_text = column.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+            column = pd.to_numeric(column.where(~is_text), errors='coerce')
+        
+        values = column.to_numpy(dtype=float, na_value=np.nan)
+        return np.where(np.isfinite(values), np.trunc(values), 1).astype(np.int64)
     
     @staticmethod
     def static_calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float, 
@@ -322,46 +573,169 @@ class RouteOptimizer:
         road_factor = self.config.get('road_factor', 1.3)
         return self.static_calculate_distance(lat1, lon1, lat2, lon2, road_factor)
     
-    def skip_weekends(self, dt: datetime) -> datetime:
+    @property
+    def distance_matrix(self) -> DistanceMatrix:
         """
-        Hoppar över helger (lördag och söndag) OM INTE weekend_work_mode är aktiverat
-        Om datumet är en lördag eller söndag, flytta till nästa måndag
+        Avståndsmatris för alla platser i self.locations
+        Byggs om automatiskt om platserna har bytts ut
         """
-        # Om weekend work mode är aktiverat, jobba alla dagar
-        if self.config.get('weekend_work_mode', False):
-            return dt
+        table = self.location_table
         
-        # weekday(): Måndag=0, Tisdag=1, ..., Lördag=5, Söndag=6
-        while dt.weekday() in [5, 6]:  # Lördag eller Söndag
-            dt = dt + timedelta(days=1)
-        return dt
+        if self._distance_matrix is None or self._matrix_table is not table:
+            road_factor = self.config.get('road_factor', 1.3)
+            
+            # Återanvänd en tidigare körnings matris från diskcachen om den finns
+            cached = None
+            cache = self._distance_cache()
+            if cache is not None and self._use_full_matrix():
+                cached = cache.load(table.latitudes, table.longitudes, road_factor)
+            
+            self._distance_matrix = DistanceMatrix(
+                table.latitudes, table.longitudes, road_factor, matrix=cached
+            )
+            self._matrix_table = table
+        
+        return self._distance_matrix
     
-    def is_before_weekend(self, dt: datetime) -> bool:
+    def build_full_matrix(self) -> DistanceMatrix:
         """
-        Kontrollerar om nästa dag är en helg (lördag eller söndag)
-        Returnerar True om idag är fredag eller om imorgon är lördag
+        Beräknar hela avståndsmatrisen i förväg om den får byggas
+        (se full_matrix_max_locations) och sparar den i diskcachen
         """
-        # weekday(): Måndag=0, Tisdag=1, Onsdag=2, Torsdag=3, Fredag=4, Lördag=5, Söndag=6
-        tomorrow = dt + timedelta(days=1)
-        return tomorrow.weekday() in [5, 6]  # Imorgon är lördag eller söndag
+        matrix = self.distance_matrix
+        
+        if self._use_full_matrix() and not matrix.is_computed:
+            matrix.matrix
+            self.observer.distances_computed(len(matrix) * len(matrix))
+            
+            cache = self._distance_cache()
+            if cache is not None:
+                cache.store(matrix.latitudes, matrix.longitudes, matrix.road_factor, matrix.matrix)
+        
+        return matrix
     
-    def filter_by_max_distance(self, home_base: Tuple[float, float]) -> List[Location]:
-        """Filtrerar platser baserat på max avstånd från hemmabas"""
+    def _distance_cache(self) -> Optional[DistanceCache]:
+        """Diskcache för avståndsmatriser (config 'distance_cache_dir', None = av)"""
+        directory = self.config.get('distance_cache_dir')
         
-        max_distance = self.config.get('max_distance', 500)
+        if not directory:
+            return None
         
-        valid_locations = []
+        if self._cache is None:
+            self._cache = DistanceCache(directory, self.config.get('distance_cache_max_mb', 2048))
+        return self._cache
+    
+    def _use_full_matrix(self) -> bool:
+        """
+        True om hela avståndsmatrisen (n x n) får byggas
+        Större datamängder (config 'full_matrix_max_locations') använder
+        delmatriser per rutt och det rumsliga indexet istället
+        """
+        limit = self.config.get('full_matrix_max_locations', FULL_MATRIX_MAX_LOCATIONS)
+        return len(self.location_table) <= limit
+    
+    def use_distance_matrix(self, matrix: DistanceMatrix):
+        """Använder en redan beräknad avståndsmatris för nuvarande platser"""
+        table = self.location_table
         
-        for loc in self.locations:
-            distance = self.calculate_distance(
-                home_base[0], home_base[1],
-                loc.latitude, loc.longitude
+        if len(matrix) != len(table):
+            raise ValueError(
+                f"Avståndsmatrisen har {len(matrix)} platser, förväntade {len(table)}"
             )
+        
+        self._distance_matrix = matrix
+        self._matrix_table = table
+    
+    def _positions(self, route: List[Location]) -> Optional[np.ndarray]:
+        """
+        Heltalspositioner i avståndsmatrisen för platserna i rutten
+        Returnerar None om någon plats inte finns i self.locations
+        """
+        table = self.location_table
+        
+        if self._positions_table is not table:
+            self._location_positions = {id(loc): i for i, loc in enumerate(self.locations)}
+            self._positions_table = table
+        
+        positions = [self._location_positions.get(id(loc)) for loc in route]
+        if any(pos is None for pos in positions):
+            return None
+        return np.array(positions, dtype=int)
+    
+    def _route_matrix(self, route: List[Location],
+                      home_base: Optional[Tuple[float, float]] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Hämtar avståndsmatris för platserna i rutten (i ruttens ordning)
+        samt avstånden från hemmabasen till varje plats
+        """
+        positions = self._positions(route)
+        
+        if positions is not None:
+            matrix = self.distance_matrix
+            if not matrix.is_computed:
+                # Delmatrisen beräknas från koordinaterna
+                self.observer.distances_computed(len(positions) * len(positions))
+            sub = matrix.submatrix(positions)
+            base = matrix.base_row(home_base)[positions] if home_base is not None else None
+        else:
+            # Platser utanför self.locations - bygg en tillfällig matris
+            matrix = DistanceMatrix.from_locations(route, self.config.get('road_factor', 1.3))
+            sub = matrix.matrix
+            self.observer.distances_computed(len(route) * len(route))
+            base = matrix.base_row(home_base) if home_base is not None else None
+        
+        return sub, base
+    
+    def calendar(self, team_id: Optional[int] = None) -> WorkdayCalendar:
+        """
+        Arbetsdagskalender för ett team (se workday_calendar.py)
+        
+        Helger är lediga om inte weekend_work_mode är aktiverat, svenska
+        helgdagar om inte config 'public_holidays' är False, och spärrdatum
+        från 'blackout_dates' (alla team) och 'team_blackout_dates' (team ID ->
+        datum). Kalendern byggs en gång per team.
+        """
+        calendar = self._calendars.get(team_id)
+        if calendar is None:
+            blackout_dates = list(self.config.get('blackout_dates') or [])
+            if team_id is not None:
+                team_blackouts = self.config.get('team_blackout_dates') or {}
+                # Team-ID kan vara text om configen kommer från JSON
+                blackout_dates += team_blackouts.get(team_id, team_blackouts.get(str(team_id), []))
             
-            if distance <= max_distance:
-                valid_locations.append(loc)
+            calendar = WorkdayCalendar(
+                work_weekends=self.config.get('weekend_work_mode', False),
+                public_holidays=self.config.get('public_holidays', True),
+                blackout_dates=blackout_dates
+            )
+            self._calendars[team_id] = calendar
+        return calendar
+    
+    def skip_weekends(self, dt: datetime, team_id: Optional[int] = None) -> datetime:
+        """
+        Flyttar till nästa arbetsdag (samma klockslag) om dt är ledig
         
-        return valid_locations
+        Lediga dagar enligt calendar(): helger (utom i weekend_work_mode),
+        svenska helgdagar och spärrdatum.
+        """
+        workday = self.calendar(team_id).next_workday(dt)
+        return dt + timedelta(days=(workday - dt.date()).days)
+    
+    def is_before_weekend(self, dt: datetime, team_id: Optional[int] = None) -> bool:
+        """
+        Kontrollerar om nästa dag är ledig (helg, helgdag eller spärrdatum)
+        """
+        return self.calendar(team_id).is_day_off_tomorrow(dt)
+    
+    def filter_by_max_distance(self, home_base: Tuple[float, float]) -> List[Location]:
+        """Filtrerar platser baserat på max avstånd från hemmabas"""
+        
+        max_distance = self.config.get('max_distance', 500)
+        
+        index = self.distance_matrix.spatial_index
+        within = index.within(home_base[0], home_base[1], max_distance)
+        
+        return [self.locations[i] for i in within]
     
     def sort_locations_by_deadline(self, locations: List[Location], sort_by: str = 'both') -> List[Location]:
         """
@@ -378,56 +752,91 @@ class RouteOptimizer:
             # Default: sortera efter prioritet
             return sorted(locations, key=lambda x: x.filter_value)
     
-    def optimize_route_2opt(self, route: List[Location], max_iterations: int = 50) -> List[Location]:
+    def build_nearest_neighbour_route(self, locations: List[Location],
+                                      home_base: Tuple[float, float]) -> List[Location]:
+        """
+        Bygger rutt med nearest neighbor från hemmabasen
+        Använder avståndsmatrisen istället för avstånd per par
+        """
+        if not locations:
+            return []
+        
+        dist, home_dist = self._route_matrix(locations, home_base)
+        
+        visited = np.zeros(len(locations), dtype=bool)
+        order = []
+        current = home_dist
+        
+        while len(order) < len(locations):
+            # Hitta närmaste obesökta plats
+            nearest = int(np.argmin(np.where(visited, np.inf, current)))
+            
+            order.append(nearest)
+            visited[nearest] = True
+            current = dist[nearest]
+        
+        return [locations[i] for i in order]
+    
+    def optimize_route_2opt(self, route: List[Location], max_iterations: int = 50,
+                            home_base: Optional[Tuple[float, float]] = None) -> List[Location]:
         """
         Förbättrar rutt med 2-opt algoritm
+        
+        Använder grannlistor (config 'two_opt_neighbours', default 10) och
+        don't-look bits så att även rutter med tusentals stopp kan förbättras.
+        
+        Args:
+            route: Rutt att förbättra
+            max_iterations: Max antal förbättringar per stopp i rutten
+            home_base: Hemmabas som rutten startar från (None = första platsen hålls fast)
+        """
+        return self.improve_route(route, home_base, moves=('2opt',), max_iterations=max_iterations)
+    
+    def improve_route(self, route: List[Location],
+                      home_base: Optional[Tuple[float, float]] = None,
+                      moves: Optional[List[str]] = None,
+                      max_iterations: int = 50) -> List[Location]:
+        """
+        Förbättrar rutt med valda dragfamiljer (2-opt, Or-opt, 3-opt)
+        
+        Args:
+            route: Rutt att förbättra
+            home_base: Hemmabas som rutten startar från (None = första platsen hålls fast)
+            moves: Dragfamiljer att köra (None = config 'improvement_moves',
+                   default ['2opt', 'or_opt'])
+            max_iterations: Max antal förbättringar per stopp och dragfamilj
         """
         if len(route) <= 3:
             return route
         
-        improved = True
-        best_route = route.copy()
-        iteration = 0
+        if moves is None:
+            moves = self.config.get('improvement_moves', list(DEFAULT_MOVES))
         
-        while improved and iteration < max_iterations:
-            improved = False
-            iteration += 1
-            
-            for i in range(1, len(best_route) - 2):
-                for j in range(i + 1, len(best_route)):
-                    if j - i == 1:
-                        continue
-                    
-                    # Beräkna nuvarande distans
-                    current_dist = (
-                        self.calculate_distance(
-                            best_route[i-1].latitude, best_route[i-1].longitude,
-                            best_route[i].latitude, best_route[i].longitude
-                        ) +
-                        self.calculate_distance(
-                            best_route[j-1].latitude, best_route[j-1].longitude,
-                            best_route[j].latitude, best_route[j].longitude
-                        )
-                    )
-                    
-                    # Beräkna ny distans efter swap
-                    new_dist = (
-                        self.calculate_distance(
-                            best_route[i-1].latitude, best_route[i-1].longitude,
-                            best_route[j-1].latitude, best_route[j-1].longitude
-                        ) +
-                        self.calculate_distance(
-                            best_route[i].latitude, best_route[i].longitude,
-                            best_route[j].latitude, best_route[j].longitude
-                        )
-                    )
-                    
-                    # Om bättre, gör swap
-                    if new_dist < current_dist:
-                        best_route[i:j] = reversed(best_route[i:j])
-                        improved = True
+        dist, home_dist = self._route_matrix(route, home_base)
         
-        return best_route
+        if home_base is not None:
+            # Hemmabasen blir nod 0, platserna nod 1..n
+            matrix = matrix_with_depot(dist, home_dist)
+            offset = 1
+        else:
+            matrix = dist
+            offset = 0
+        
+        start_tour = np.arange(len(matrix))
+        with self.step('route_search'):
+            neighbours = neighbour_lists(matrix, self.config.get('two_opt_neighbours', 10))
+            tour = improve_route(
+                matrix, start_tour, moves, neighbours,
+                max_moves=max_iterations * len(route),
+                deadline=self.budget.deadline
+            )
+        
+        if self.observer.active:
+            self.observer.route_improved(
+                'route', path_length(matrix, start_tour), path_length(matrix, tour)
+            )
+        
+        return [route[node - offset] for node in tour[offset:]]
     
     def calculate_route_segments(self, route: List[Location], team: Team) -> List[RouteSegment]:
         """
@@ -439,10 +848,13 @@ class RouteOptimizer:
         
         segments = []
         
-        # Starta från hemmabasen
-        current_lat, current_lon = team.home_base
+        # Avstånd inom rutten och från hemmabasen hämtas från avståndsmatrisen
+        dist, home_dist = self._route_matrix(route, team.home_base)
+        
+        # Starta från hemmabasen (föregående position None = hemmabasen)
+        prev_idx = None
         current_time = datetime.now().replace(hour=7, minute=0, second=0, microsecond=0)
-        current_time = self.skip_weekends(current_time)
+        current_time = self.skip_weekends(current_time, team.id)
         
         # Hämta konfiguration
         work_hours = self.config.get('work_hours', 8)
@@ -457,10 +869,7 @@ class RouteOptimizer:
         
         for idx, location in enumerate(route):
             # Beräkna avstånd och körtid
-            distance = self.calculate_distance(
-                current_lat, current_lon,
-                location.latitude, location.longitude
-            )
+            distance = float(home_dist[idx] if prev_idx is None else dist[prev_idx, idx])
             drive_time = distance / driving_speed
             
             # Lägg till pauser
@@ -475,7 +884,7 @@ class RouteOptimizer:
                 # Starta ny dag
                 current_time = current_time.replace(hour=7, minute=0, second=0, microsecond=0)
                 current_time = current_time + timedelta(days=1)
-                current_time = self.skip_weekends(current_time)
+                current_time = self.skip_weekends(current_time, team.id)
                 
                 daily_work_time = 0
                 daily_drive_time = 0
@@ -484,10 +893,7 @@ class RouteOptimizer:
                 # I normalt mode: åk från hemmabasen
                 if not weekend_work_mode:
                     # Omberäkna körtid från hemmabas till denna plats
-                    distance = self.calculate_distance(
-                        team.home_base[0], team.home_base[1],
-                        location.latitude, location.longitude
-                    )
+                    distance = float(home_dist[idx])
                     drive_time = distance / driving_speed
                     num_pauses = int(drive_time / 2)
                     total_drive_time = drive_time + (num_pauses * pause_time) + navigation_time
@@ -505,10 +911,7 @@ class RouteOptimizer:
                 if idx < len(route) - 1:  # Inte sista platsen
                     # Kontrollera om nästa plats kräver ny dag
                     next_location = route[idx + 1]
-                    distance_to_next = self.calculate_distance(
-                        location.latitude, location.longitude,
-                        next_location.latitude, next_location.longitude
-                    )
+                    distance_to_next = dist[idx, idx + 1]
                     drive_time_to_next = distance_to_next / driving_speed
                     num_pauses_next = int(drive_time_to_next / 2)
                     total_drive_time_to_next = drive_time_to_next + (num_pauses_next * pause_time) + navigation_time
@@ -525,20 +928,14 @@ class RouteOptimizer:
                 # 2. Efter detta besök kan vi INTE åka hem till hemmabasen (för långt/sent)
                 if idx < len(route) - 1:  # Inte sista platsen
                     # Beräkna avstånd hem från denna plats
-                    distance_home = self.calculate_distance(
-                        location.latitude, location.longitude,
-                        team.home_base[0], team.home_base[1]
-                    )
+                    distance_home = home_dist[idx]
                     drive_time_home = distance_home / driving_speed
                     num_pauses_home = int(drive_time_home / 2)
                     total_drive_time_home = drive_time_home + (num_pauses_home * pause_time)
                     
                     # Kontrollera om nästa plats kräver ny dag
                     next_location = route[idx + 1]
-                    distance_to_next = self.calculate_distance(
-                        location.latitude, location.longitude,
-                        next_location.latitude, next_location.longitude
-                    )
+                    distance_to_next = dist[idx, idx + 1]
                     drive_time_to_next = distance_to_next / driving_speed
                     num_pauses_next = int(drive_time_to_next / 2)
                     total_drive_time_to_next = drive_time_to_next + (num_pauses_next * pause_time) + navigation_time
@@ -568,13 +965,96 @@ class RouteOptimizer:
             segments.append(segment)
             
             # Uppdatera för nästa iteration
-            current_lat, current_lon = location.latitude, location.longitude
+            prev_idx = idx
             current_time = departure_time
             daily_work_time += location.work_time
             daily_drive_time += total_drive_time
         
         return segments
     
+    def split_route_days(self, route: List[Location], team: Team,
+                         greedy_segments: Optional[List[RouteSegment]] = None) -> Tuple[List[RouteSegment], float]:
+        """
+        Kostnadsoptimal indelning av rutten i dagar (se day_split.py)
+        
+        Till skillnad från calculate_route_segments väljs hemresa eller
+        hotell för varje natt utifrån kostnaden: efter en hotellnatt börjar
+        nästa dag vid föregående stopp, och hemresa kräver att dagens körning
+        plus resan hem ryms i max_drive_hours.
+        
+        Args:
+            route: Ordnad rutt
+            team: Teamet
+            greedy_segments: Segment från calculate_route_segments (beräknas om None)
+        
+        Returns:
+            (segment, besparing i kr mot den giriga indelningen - kan vara negativ)
+        """
+        if not route:
+            return [], 0.0
+        
+        if greedy_segments is None:
+            greedy_segments = self.calculate_route_segments(route, team)
+        
+        dist, home_dist = self._route_matrix(route, team.home_base)
+        
+        work_hours = self.config.get('work_hours', 8)
+        max_drive_hours = self.config.get('max_drive_hours', 5)
+        pause_time = self.config.get('pause_time', 15) / 60
+        navigation_time = self.config.get('navigation_time', 3) / 60
+        driving_speed = self.config.get('driving_speed', 80)
+        team_size = self.config.get('team_size', 2)
+        hourly_cost = self.config.get('labor_cost', 500) * team_size
+        km_cost = self.config.get('vehicle_cost', 2.5)
+        hotel_night_cost = self.config.get('hotel_cost', 2000) * team_size
+        
+        work_times = np.array([location.work_time for location in route])
+        split = optimal_day_split(
+            dist, home_dist, work_times,
+            work_hours=work_hours, max_drive_hours=max_drive_hours, driving_speed=driving_speed,
+            pause_time=pause_time, navigation_time=navigation_time,
+            hourly_cost=hourly_cost, km_cost=km_cost, hotel_night_cost=hotel_night_cost,
+            allow_home_nights=not self.config.get('weekend_work_mode', False)
+        )
+        
+        # Tider som i calculate_route_segments, med dagarna från indelningen
+        day_starts = set(split.day_starts)
+        segments = []
+        current_time = datetime.now().replace(hour=7, minute=0, second=0, microsecond=0)
+        current_time = self.skip_weekends(current_time, team.id)
+        
+        for idx, location in enumerate(route):
+            from_home = idx == 0
+            if idx in day_starts and idx > 0:
+                current_time = current_time.replace(hour=7, minute=0, second=0, microsecond=0)
+                current_time = self.skip_weekends(current_time + timedelta(days=1), team.id)
+                from_home = not split.hotel_after[idx - 1]
+            
+            distance = float(home_dist[idx] if from_home else dist[idx - 1, idx])
+            total_drive_time = float(leg_hours(distance, driving_speed, pause_time, navigation_time))
+            
+            arrival_time = current_time + timedelta(hours=total_drive_time)
+            departure_time = arrival_time + timedelta(hours=location.work_time)
+            
+            segments.append(RouteSegment(
+                location=location,
+                arrival_time=arrival_time,
+                departure_time=departure_time,
+                drive_time=total_drive_time,
+                drive_distance=distance,
+                work_time=location.work_time,
+                is_hotel_night=bool(split.hotel_after[idx])
+            ))
+            current_time = departure_time
+        
+        greedy_cost = (
+            hourly_cost * sum(seg.drive_time for seg in greedy_segments)
+            + km_cost * sum(seg.drive_distance for seg in greedy_segments)
+            + hotel_night_cost * sum(1 for seg in greedy_segments if seg.is_hotel_night)
+        )
+        
+        return segments, greedy_cost - split.cost
+    
     def calculate_team_costs(self, team_route: TeamRoute) -> Dict:
         """
         Beräknar kostnader för ett team
@@ -712,34 +1192,30 @@ class RouteOptimizer:
         self.teams = teams
         return teams
     
-    def assign_locations_to_teams(self, teams: List[Team]) -> List[TeamRoute]:
+    def distribute_locations(self, teams: List[Team]) -> Dict[int, List[Location]]:
         """
         Fördelar platser till teams
         - Weekend Work Mode: Geografisk clustering från Göteborg
         - Normal Mode: Närmaste team från respektive hemmabas
-        """
         
-        team_routes = []
+        Returns:
+            Team ID -> tilldelade platser (osorterade)
+        """
         
         # Skapa en dictionary för att hålla team-locations
         team_assignments = {team.id: [] for team in teams}
         
         weekend_work_mode = self.config.get('weekend_work_mode', False)
         
-        print("\n" + "="*60)
-        if weekend_work_mode:
-            print("GÖTEBORG WEEKEND WORK MODE - GEOGRAFISK FÖRDELNING")
-        else:
-            print("TILLDELAR PLATSER TILL NÄRMASTE TEAM")
-        print("="*60)
+        locations_outside_range = 0
         
-        # STEG 1: Tilldela platser till teams
         if weekend_work_mode:
             # WEEKEND WORK MODE: Använd K-means clustering för geografisk fördelning
             from sklearn.cluster import KMeans
             
             # Skapa koordinatmatris
-            coords = np.array([[loc.latitude, loc.longitude] for loc in self.locations])
+            table = self.location_table
+            coords = np.column_stack([table.latitudes, table.longitudes])
             
             # Kör K-means clustering
             n_clusters = min(len(teams), len(self.locations))
@@ -752,189 +1228,478 @@ class RouteOptimizer:
                     cluster_id = cluster_labels[idx]
                     team_id = (cluster_id % len(teams)) + 1  # Rotera mellan teams
                     team_assignments[team_id].append(location)
-                
-                print(f"\n✅ Geografisk clustering: {len(self.locations)} platser fördelade i {n_clusters} kluster")
         else:
             # NORMAL MODE: Närmaste team från respektive hemmabas
-            locations_outside_range = 0
+            max_dist = self.config.get('max_distance', 500)
             
-            for location in self.locations:
-                # Hitta närmaste team inom max_distance
-                nearest_team = None
-                min_distance = float('inf')
-                
-                for team in teams:
-                    distance = self.calculate_distance(
-                        team.home_base[0], team.home_base[1],
-                        location.latitude, location.longitude
-                    )
-                    
-                    # Kontrollera max avstånd
-                    max_dist = self.config.get('max_distance', 500)
-                    if distance <= max_dist:
-                        if distance < min_distance:
-                            min_distance = distance
-                            nearest_team = team
-                
-                # Om ingen inom räckvidd, hitta absolut närmaste
-                if not nearest_team:
-                    locations_outside_range += 1
-                    nearest_team = min(teams, key=lambda t: self.calculate_distance(
-                        t.home_base[0], t.home_base[1],
-                        location.latitude, location.longitude
-                    ))
-                
-                # Tilldela platsen till närmaste team
-                team_assignments[nearest_team.id].append(location)
+            # Rumsligt index över hemmabaserna besvarar närmaste team för alla platser
+            table = self.location_table
+            bases = SpatialIndex(
+                [team.home_base[0] for team in teams],
+                [team.home_base[1] for team in teams],
+                self.config.get('road_factor', 1.3)
+            )
+            distances, nearest = bases.nearest(table.latitudes, table.longitudes)
+            distances, nearest = distances[:, 0], nearest[:, 0]
             
-            if locations_outside_range > 0:
-                print(f"⚠️ {locations_outside_range} platser utanför max_distance - tilldelade ändå till närmaste team")
+            # Närmaste team ligger inom max_distance om något team gör det,
+            # annars tilldelas platsen ändå till det absolut närmaste
+            outside_range = distances > max_dist
+            locations_outside_range = int(np.count_nonzero(outside_range))
+            
+            # Tilldela platsen till närmaste team
+            for location, team_idx in zip(self.locations, nearest):
+                team_assignments[teams[team_idx].id].append(location)
+        
+        self.observer.locations_distributed(
+            teams,
+            {team_id: len(assigned) for team_id, assigned in team_assignments.items()},
+            locations_outside_range,
+            weekend_work_mode
+        )
+        
+        return team_assignments
+    
+    def assign_locations_to_teams(self, teams: List[Team]) -> List[TeamRoute]:
+        """
+        Fördelar platser till teams och bygger deras rutter
+        - Weekend Work Mode: Geografisk clustering från Göteborg
+        - Normal Mode: Närmaste team från respektive hemmabas
         
-        print(f"\nFördelning av {len(self.locations)} platser:")
-        for team in teams:
-            count = len(team_assignments[team.id])
-            if count > 0:
-                print(f"  Team {team.id} ({team.home_name}): {count:3d} platser")
-        print("="*60 + "\n")
+        Med tidsgräns (config 'time_limit_s') avbryts förbättringsstegen när
+        tiden är slut; rutterna är då giltiga men inte fullt förbättrade.
+        """
+        
+        # STEG 1: Tilldela platser till teams
+        with self.stage('construction'), self.step('distribute'):
+            team_assignments = self.distribute_locations(teams)
         
         # STEG 2: Optimera rutt för varje team
+        routes: Dict[int, List[Location]] = {}
+        
         for team in teams:
             team_locations = team_assignments[team.id]
             
             if not team_locations:
                 continue
             
-            # Sortera efter deadline om aktiverat
-            if self.config.get('use_deadlines', False):
-                sort_by = self.config.get('sort_by', 'both')
-                team_locations = self.sort_locations_by_deadline(team_locations, sort_by)
-            
-            # STEG 3: Bygg rutt med nearest neighbor från hemmabasen
-            route = []
-            remaining = team_locations.copy()
-            current_lat, current_lon = team.home_base
-            
-            while remaining:
-                # Hitta närmaste obesökta plats
-                nearest = min(remaining, key=lambda loc: self.calculate_distance(
-                    current_lat, current_lon,
-                    loc.latitude, loc.longitude
-                ))
+            with self.stage('construction'):
+                # Sortera efter deadline om aktiverat
+                if self.config.get('use_deadlines', False):
+                    sort_by = self.config.get('sort_by', 'both')
+                    team_locations = self.sort_locations_by_deadline(team_locations, sort_by)
                 
-                route.append(nearest)
-                remaining.remove(nearest)
-                current_lat, current_lon = nearest.latitude, nearest.longitude
+                # STEG 3: Bygg rutt med nearest neighbor från hemmabasen
+                with self.step('nearest_neighbour'):
+                    route = self.build_nearest_neighbour_route(team_locations, team.home_base)
             
-            # STEG 4: Förbättra med 2-opt för mellanstora rutter
-            if len(route) > 3 and len(route) < 100:
-                route = self.optimize_route_2opt(route, max_iterations=50)
+            # STEG 4: Förbättra med 2-opt/Or-opt/3-opt enligt config 'improvement_moves'
+            if len(route) > 3:
+                with self.stage('improvement'):
+                    route = self.improve_route(route, team.home_base)
             
-            # STEG 5: Beräkna segment med tider
-            segments = self.calculate_route_segments(route, team)
+            routes[team.id] = route
+        
+        return self.finish_team_routes(teams, routes)
+    
+    def finish_team_routes(self, teams: List[Team],
+                           routes: Dict[int, List[Location]]) -> List[TeamRoute]:
+        """
+        Schemalägger rutterna och kör sökningen mellan team om tiden räcker
+        
+        Args:
+            teams: Alla team
+            routes: Team ID -> ordnad rutt
+        """
+        # STEG 5: Beräkna segment, totaler och kostnader
+        with self.stage('scheduling'):
+            team_routes = self.build_team_routes(teams, routes)
+        
+        # STEG 6: Flytta och byt stopp mellan teamens rutter
+        if (self.config.get('inter_team_search', True) and len(routes) > 1
+                and not self.budget.expired()):
+            with self.stage('improvement'):
+                fleet_routes = self.improve_fleet(teams, routes)
+            
+            with self.stage('scheduling'):
+                fleet_team_routes = self.build_team_routes(teams, fleet_routes)
+            
+            # Sökningen optimerar körsträckan; behåll den bara om totalkostnaden blir lägre
+            if (sum(tr.total_cost for tr in fleet_team_routes)
+                    < sum(tr.total_cost for tr in team_routes)):
+                team_routes = fleet_team_routes
+        
+        return team_routes
+    
+    def refine_team_routes(self, team_routes: List[TeamRoute]) -> List[TeamRoute]:
+        """
+        Fortsätter förbättra färdiga rutter (t.ex. efter att tidsgränsen tog slut)
+        
+        Rutterna förbättras från sin nuvarande ordning och behålls bara om
+        totalkostnaden blir lägre.
+        """
+        teams = [tr.team for tr in team_routes]
+        routes = {}
+        
+        for tr in team_routes:
+            route = [segment.location for segment in tr.segments]
+            if len(route) > 3 and not self.budget.expired():
+                with self.stage('improvement'):
+                    route = self.improve_route(route, tr.team.home_base)
+            routes[tr.team.id] = route
+        
+        refined = self.finish_team_routes(teams, routes)
+        
+        if sum(tr.total_cost for tr in refined) < sum(tr.total_cost for tr in team_routes):
+            return refined
+        return team_routes
+    
+    def build_team_routes(self, teams: List[Team],
+                          routes: Dict[int, List[Location]]) -> List[TeamRoute]:
+        """Bygger TeamRoute för alla team som har en rutt"""
+        team_routes = []
+        
+        for team in teams:
+            route = routes.get(team.id)
             
-            if not segments:
+            if not route:
                 continue
             
-            # Beräkna totaler
-            total_distance = sum(seg.drive_distance for seg in segments)
-            total_work_time = sum(seg.work_time for seg in segments)
-            total_drive_time = sum(seg.drive_time for seg in segments)
-            hotel_nights = sum(1 for seg in segments if seg.is_hotel_night)
-            total_days = (segments[-1].departure_time - segments[0].arrival_time).days + 1 if segments else 0
-            
-            # Skapa TeamRoute
-            team_route = TeamRoute(
-                team=team,
-                segments=segments,
-                total_days=total_days,
-                total_distance=total_distance,
-                total_work_time=total_work_time,
-                total_drive_time=total_drive_time,
-                hotel_nights=hotel_nights,
-                total_cost=0  # Beräknas nedan
-            )
+            team_route = self.build_team_route(team, route)
             
-            # Beräkna kostnader
+            if team_route:
+                team_routes.append(team_route)
+        
+        return team_routes
+    
+    def build_team_route(self, team: Team, route: List[Location]) -> Optional[TeamRoute]:
+        """
+        Beräknar segment med tider, totaler och kostnad för en färdig rutt
+        """
+        with self.step('route_segments'):
+            segments = self.calculate_route_segments(route, team)
+        
+        if not segments:
+            return None
+        
+        # Optimal dagsindelning används bara när den är billigare än den giriga
+        day_split_saving = 0.0
+        if self.config.get('day_split', False):
+            with self.step('day_split'):
+                split_segments, saving = self.split_route_days(route, team, segments)
+            if saving > 0:
+                segments, day_split_saving = split_segments, saving
+        
+        # Beräkna totaler
+        total_distance = sum(seg.drive_distance for seg in segments)
+        total_work_time = sum(seg.work_time for seg in segments)
+        total_drive_time = sum(seg.drive_time for seg in segments)
+        hotel_nights = sum(1 for seg in segments if seg.is_hotel_night)
+        total_days = (segments[-1].departure_time - segments[0].arrival_time).days + 1 if segments else 0
+        
+        # Skapa TeamRoute
+        team_route = TeamRoute(
+            team=team,
+            segments=segments,
+            total_days=total_days,
+            total_distance=total_distance,
+            total_work_time=total_work_time,
+            total_drive_time=total_drive_time,
+            hotel_nights=hotel_nights,
+            total_cost=0,  # Beräknas nedan
+            day_split_saving=day_split_saving
+        )
+        
+        # Beräkna kostnader
+        with self.step('costing'):
             costs = self.calculate_team_costs(team_route)
-            team_route.total_cost = costs['total_cost']
+        team_route.total_cost = costs['total_cost']
+        
+        self.observer.team_route_built(team_route)
+        
+        return team_route
+    
+    def improve_fleet(self, teams: List[Team],
+                      routes: Dict[int, List[Location]]) -> Dict[int, List[Location]]:
+        """
+        Lokalsökning mellan teamens rutter (relocate, swap, 2-opt*)
+        
+        Stopp kan bara flyttas till team vars hemmabas ligger inom max_distance
+        (platser utanför alla teams räckvidd stannar hos sitt team), och inget
+        team får mer arbetstid än det tyngst belastade teamet hade från början.
+        Ändrade rutter förbättras sedan igen med improve_route.
+        
+        Args:
+            teams: Alla team
+            routes: Team ID -> ordnad rutt
+        
+        Returns:
+            Team ID -> ny ordnad rutt
+        """
+        if not self._use_full_matrix():
+            # Sökningen behöver hela avståndsmatrisen
+            self.observer.message(f"ℹ️ Sökning mellan team hoppas över för {len(self.location_table)} platser "
+                                  f"(full_matrix_max_locations)")
+            return routes
+        
+        positions = {team_id: self._positions(route) for team_id, route in routes.items()}
+        if any(pos is None for pos in positions.values()):
+            # Platser utanför self.locations saknar index i avståndsmatrisen
+            return routes
+        
+        matrix = self.distance_matrix
+        team_ids = [team.id for team in teams]
+        base_rows = matrix.base_rows([team.home_base for team in teams])
+        start_routes = [positions[team_id].tolist() if team_id in positions else []
+                        for team_id in team_ids]
+        
+        allowed = None
+        if not self.config.get('weekend_work_mode', False):
+            allowed = base_rows <= self.config.get('max_distance', 500)
+            # Platser utanför all räckvidd får stanna hos nuvarande team
+            for r, route in enumerate(start_routes):
+                stranded = [node for node in route if not allowed[:, node].any()]
+                allowed[r, stranded] = True
+        
+        # Arbetstid per plats håller teamens belastning balanserad
+        loads = self.location_table.work_times
+        
+        with self.step('fleet_search'):
+            neighbours = matrix.neighbours(self.config.get('two_opt_neighbours', 10))
+            new_routes = improve_fleet(matrix.matrix, base_rows, start_routes, neighbours,
+                                       allowed, loads, deadline=self.budget.deadline)
+        
+        if self.observer.active:
+            self.observer.route_improved(
+                'fleet',
+                fleet_length(matrix.matrix, base_rows, start_routes),
+                fleet_length(matrix.matrix, base_rows, new_routes)
+            )
+        
+        result = {}
+        for team, before, after in zip(teams, start_routes, new_routes):
+            if not after:
+                continue
             
-            team_routes.append(team_route)
+            route = [self.locations[i] for i in after]
+            if after != before and len(route) > 3:
+                route = self.improve_route(route, team.home_base)
+            result[team.id] = route
         
-        return team_routes
+        return result
     
     def optimize_team_count(self, min_teams: int, max_teams: int) -> Dict:
         """
         Optimerar antal team genom att testa olika konfigurationer
+        
+        Med tidsgräns (config 'time_limit_s') testas team-antal tills tiden tar
+        slut, men minst ett antal testas alltid. Otestade antal ligger kvar i
+        pending_team_counts och testas av continue_team_count().
         """
-        print(f"\n{'='*60}")
-        print(f"OPTIMERAR ANTAL TEAM ({min_teams}-{max_teams})")
-        print(f"{'='*60}\n")
+        self.observer.sweep_started(min_teams, max_teams)
+        
+        self.team_results = []
+        self.pending_team_counts = list(range(min_teams, max_teams + 1))
+        self.team_count_total = len(self.pending_team_counts)
+        
+        # Avståndsmatrisen byggs en gång och delas av alla team-antal
+        with self.stage('distance_matrix'):
+            self.build_full_matrix()
         
-        results = []
-        best_result = None
-        best_cost_per_location = float('inf')
-        optimal_teams = min_teams
+        return self.continue_team_count()
+    
+    def continue_team_count(self) -> Dict:
+        """
+        Fortsätter optimeringen av antal team inom nuvarande tidsbudget
         
-        for num_teams in range(min_teams, max_teams + 1):
-            print(f"\n--- Testar {num_teams} team ---")
+        Resultat vars förbättring avbröts av tidsgränsen förbättras vidare och
+        återstående team-antal testas. Ge mer tid med budget.extend() först.
+        """
+        # Förbättra först resultat som avbröts av tidsgränsen
+        for result in self.team_results:
+            if result['complete'] or self.budget.expired():
+                continue
             
-            # Hämta hemmabasconfig från self.config
-            allowed_cities = self.config.get('allowed_home_bases', None)
-            team_assignments = self.config.get('team_assignments', None)
-            custom_bases = self.config.get('custom_home_bases', None)
+            self.observer.message(f"\n--- Förbättrar {result['num_teams']} team vidare ---")
+            team_routes = self.refine_team_routes(result['teams'])
+            result.update(self._team_count_result(
+                result['num_teams'], result['home_bases'], team_routes
+            ))
+        
+        # Antal team-antal som testats hittills (för förloppshändelserna)
+        done = self.team_count_total - len(self.pending_team_counts)
+        
+        workers = self._parallel_workers()
+        
+        if workers > 1 and len(self.pending_team_counts) > 1:
+            # Parallell genomsökning - varje team-antal i en egen process
+            from parallel_sweep import evaluate_team_counts
             
-            # Skapa teams
-            teams = self.create_teams(
-                num_teams, 
-                allowed_cities=allowed_cities,
-                team_assignments=team_assignments,
-                custom_bases=custom_bases
-            )
+            required = None if self.team_results else self.pending_team_counts[0]
+            team_counts, self.pending_team_counts = self.pending_team_counts, []
             
-            # Fördela och optimera
-            team_routes = self.assign_locations_to_teams(teams)
+            # Förloppet rapporteras när varje process blir klar
+            self.observer.team_counts_submitted(team_counts, done, self.team_count_total)
+            for outcome in evaluate_team_counts(self, team_counts, workers, required):
+                self.budget.add(outcome['stages'])
+                if outcome['skipped']:
+                    self.pending_team_counts.append(outcome['num_teams'])
+                    self.observer.team_count_skipped(outcome['num_teams'], done, self.team_count_total)
+                    continue
+                if outcome['result'] is not None:
+                    self.team_results.append(outcome['result'])
+                done += 1
+                self.observer.team_count_finished(
+                    outcome['num_teams'], outcome['result'], done, self.team_count_total
+                )
             
-            if not team_routes:
-                continue
+            # Samma ordning som vid sekventiell körning oavsett vilken process som blev klar först
+            self.team_results.sort(key=lambda r: r['num_teams'])
+            self.pending_team_counts.sort()
+        
+        while self.pending_team_counts:
+            if self.budget.expired() and self.team_results:
+                self.observer.time_limit_reached(list(self.pending_team_counts))
+                break
             
-            # Beräkna totalkostnad
-            total_cost = sum(tr.total_cost for tr in team_routes)
-            total_days = max(tr.total_days for tr in team_routes)
-            cost_per_location = total_cost / len(self.locations) if self.locations else 0
+            num_teams = self.pending_team_counts.pop(0)
+            self.observer.team_count_started(num_teams, done, self.team_count_total)
+            result = self.evaluate_team_count(num_teams)
             
-            result = {
-                'num_teams': num_teams,
+            if result is not None:
+                self.team_results.append(result)
+            done += 1
+            self.observer.team_count_finished(num_teams, result, done, self.team_count_total)
+        
+        return self._summarize_team_results()
+    
+    def reprice_team_results(self, config: Dict) -> Dict:
+        """
+        Prissätter redan byggda rutter med nya kostnadsparametrar
+        
+        Rutter och scheman behålls; bara kostnaderna och jämförelsen mellan
+        team-antal räknas om. Valen som gjordes under optimeringen (t.ex. om
+        en flytt mellan team behölls) bygger på de gamla priserna.
+        
+        Args:
+            config: Ny config som bara får skilja sig i PRICING_CONFIG_KEYS
+        
+        Returns:
+            Samma format som optimize_team_count
+        """
+        if requires_rerouting(self.config, config):
+            raise ValueError("Config ändrar mer än kostnadsparametrarna - kör optimeringen igen")
+        
+        self.config = config
+        
+        repriced = []
+        for result in self.team_results:
+            team_routes = [
+                replace(tr, total_cost=self.calculate_team_costs(tr)['total_cost'])
+                for tr in result['teams']
+            ]
+            total_cost = sum(tr.total_cost for tr in team_routes)
+            repriced.append({
+                **result,
                 'teams': team_routes,
                 'total_cost': total_cost,
-                'total_days': total_days,
-                'cost_per_location': cost_per_location,
-                'home_bases': [(team.home_base[0], team.home_base[1], team.home_name) for team in teams]
-            }
-            
-            results.append(result)
-            
-            print(f"  Total kostnad: {total_cost:,.0f} kr")
-            print(f"  Kostnad per plats: {cost_per_location:,.0f} kr")
-            print(f"  Max dagar: {total_days}")
-            
-            # Uppdatera bästa resultat
-            if cost_per_location < best_cost_per_location:
-                best_cost_per_location = cost_per_location
-                best_result = result
-                optimal_teams = num_teams
+                'cost_per_location': total_cost / len(self.locations) if self.locations else 0,
+            })
+        
+        self.team_results = repriced
+        return self._summarize_team_results()
+    
+    def _summarize_team_results(self) -> Dict:
+        """Väljer bästa antal team bland de hittills testade"""
+        # Bästa resultat (lägst antal team vid lika kostnad)
+        results = sorted(self.team_results, key=lambda r: r['num_teams'])
+        best_result = min(results, key=lambda r: r['cost_per_location'], default=None)
+        optimal_teams = best_result['num_teams'] if best_result else None
         
-        print(f"\n{'='*60}")
-        print(f"OPTIMALT: {optimal_teams} team med {best_cost_per_location:,.0f} kr/plats")
-        print(f"{'='*60}\n")
+        self.observer.sweep_finished(optimal_teams, best_result)
         
         return {
             'optimal_teams': optimal_teams,
             'best_result': best_result,
-            'results': results
+            'results': results,
+            'complete': not self.pending_team_counts and all(r['complete'] for r in results)
+        }
+    
+    def evaluate_team_count(self, num_teams: int) -> Optional[Dict]:
+        """
+        Skapar team, fördelar platserna och bygger rutter för ett antal team
+        
+        Returns:
+            Resultat för antalet team, eller None om inga rutter kunde byggas
+        """
+        # Hämta hemmabasconfig från self.config
+        allowed_cities = self.config.get('allowed_home_bases', None)
+        team_assignments = self.config.get('team_assignments', None)
+        custom_bases = self.config.get('custom_home_bases', None)
+        
+        # Skapa teams
+        with self.stage('construction'), self.step('create_teams'):
+            teams = self.create_teams(
+                num_teams, 
+                allowed_cities=allowed_cities,
+                team_assignments=team_assignments,
+                custom_bases=custom_bases
+            )
+        
+        # Fördela och optimera
+        team_routes = self.assign_locations_to_teams(teams)
+        
+        if not team_routes:
+            return None
+        
+        result = self._team_count_result(
+            num_teams,
+            [(team.home_base[0], team.home_base[1], team.home_name) for team in teams],
+            team_routes
+        )
+        
+        return result
+    
+    def _parallel_workers(self) -> int:
+        """Antal processer för genomsökningen (config 'parallel_workers', 0 = alla kärnor)"""
+        workers = self.config.get('parallel_workers', 1)
+        
+        if workers is None:
+            return 1
+        
+        if workers < 0:
+            raise ValueError(f"parallel_workers måste vara 0 eller större, fick {workers}")
+        
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        
+        return workers
+    
+    def _team_count_result(self, num_teams: int, home_bases: List[Tuple[float, float, str]],
+                           team_routes: List[TeamRoute]) -> Dict:
+        """Sammanställer resultatet för ett testat antal team"""
+        total_cost = sum(tr.total_cost for tr in team_routes)
+        total_days = max(tr.total_days for tr in team_routes)
+        cost_per_location = total_cost / len(self.locations) if self.locations else 0
+        
+        return {
+            'num_teams': num_teams,
+            'teams': team_routes,
+            'total_cost': total_cost,
+            'total_days': total_days,
+            'cost_per_location': cost_per_location,
+            'home_bases': home_bases,
+            # False om tidsgränsen avbröt förbättringen
+            'complete': not self.budget.expired()
         }
 
 
-def run_optimization(df: pd.DataFrame, config: Dict, profile: Dict) -> Dict:
+def run_optimization(df: 'pd.DataFrame', config: Dict, profile: Dict,
+                     progress_callback: Optional[Callable[[Dict], None]] = None,
+                     budget: Optional[TimeBudget] = None,
+                     observer: Optional[OptimizationObserver] = None,
+                     profiling: bool = False,
+                     prepared: Optional[Tuple['pd.DataFrame', LocationTable]] = None) -> Dict:
     """
     Huvudfunktion för att köra optimering
     
@@ -942,32 +1707,169 @@ def run_optimization(df: pd.DataFrame, config: Dict, profile: Dict) -> Dict:
         df: Data med platser
         config: Konfiguration från användaren
         profile: Profil (migration eller service)
+        progress_callback: Anropas med en händelse per testat antal team
+        budget: Tidsbudget att använda (t.ex. för att kunna avbryta från en
+            annan tråd med budget.cancel()), annars skapas en från config
+        observer: Tar emot händelser från optimeringen (se observers.py)
+        profiling: True för profil per steg och team-antal i resultatet
+            ('profile', minne med config 'profile_memory'). En ProfilingObserver
+            som observer ger samma sak. Annars None och ingen mätning.
+        prepared: (filtrerad data, platstabell) för df och config, t.ex. från
+            UploadCache.processed - då hoppas load_data och create_locations över
     
     Returns:
         Dictionary med resultat
     """
     
     optimizer = RouteOptimizer(config)
+    if isinstance(observer, ProfilingObserver):
+        optimizer.profiler, observer = observer, None
+    elif profiling:
+        optimizer.profiler = ProfilingObserver(memory=config.get('profile_memory', False))
+    optimizer.observer = _combine_observers(optimizer.profiler, observer, progress_callback)
+    if budget is not None:
+        optimizer.budget = budget
     
-    # Ladda och bearbeta data
-    processed_data = optimizer.load_data(df, profile)
+    with optimizer.profiler if optimizer.profiler is not None else nullcontext():
+        # Ladda och bearbeta data
+        if prepared is not None:
+            processed_data, table = prepared
+        else:
+            with optimizer.stage('load'), optimizer.step('load_data'):
+                processed_data = optimizer.load_data(df, profile)
+        
+        if len(processed_data) == 0:
+            return {
+                'success': False,
+                'error': 'Ingen data kvar efter filtrering'
+            }
+        
+        # Skapa platser
+        if prepared is not None:
+            optimizer.location_table = table
+        else:
+            with optimizer.stage('load'), optimizer.step('create_locations'):
+                optimizer.create_locations(processed_data, profile)
+        
+        # Optimera antal team
+        min_teams = config.get('min_teams', 5)
+        max_teams = config.get('max_teams', 8)
+        
+        optimization_result = optimizer.optimize_team_count(min_teams, max_teams)
     
-    if len(processed_data) == 0:
-        return {
-            'success': False,
-            'error': 'Ingen data kvar efter filtrering'
-        }
+    return _build_result(optimizer, optimization_result, processed_data)
+
+
+def requires_rerouting(old_config: Dict, new_config: Dict) -> bool:
+    """
+    True om configändringen kräver ny ruttoptimering (inte bara ny prissättning)
+    
+    Med config 'day_split' styr priserna dagsindelningen (och därmed vilka
+    flyttar mellan team som lönar sig), så då kräver även prisändringar en
+    ny optimering. Nycklar i RUNTIME_CONFIG_KEYS ignoreras helt.
+    """
+    keys = (set(old_config) | set(new_config)) - RUNTIME_CONFIG_KEYS
+    if not (old_config.get('day_split', False) or new_config.get('day_split', False)):
+        keys -= PRICING_CONFIG_KEYS
+    return any(old_config.get(key) != new_config.get(key) for key in keys)
+
+
+def result_fingerprint(result: Dict, config: Dict) -> str:
+    """
+    Hash av ett resultats rutter och kostnader samt config
+    
+    Ändras när en ny optimering, omprissättning eller fortsatt förbättring
+    ger ett annat resultat - används för att cacha karta och rapporter.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+    digest.update(repr((result.get('total_cost'), result.get('optimal_teams'), result.get('total_days'))).encode())
+    
+    for route in result.get('team_routes', []):
+        digest.update(repr((route.team.id, route.total_cost, route.total_days, route.hotel_nights)).encode())
+        digest.update('|'.join(segment.location.id for segment in route.segments).encode())
+    
+    return digest.hexdigest()
+
+
+def reprice_result(result: Dict, config: Dict) -> Dict:
+    """
+    Räknar om kostnaderna för ett resultat från run_optimization när bara
+    kostnadsparametrarna (PRICING_CONFIG_KEYS) har ändrats
+    
+    Rutterna byggs inte om, så omräkningen tar millisekunder. Optimalt antal
+    team väljs om bland de redan testade team-antalen.
     
-    # Skapa platser
-    locations = optimizer.create_locations(processed_data, profile)
+    Args:
+        result: Tidigare resultat från run_optimization/continue_optimization
+        config: Ny konfiguration
+    
+    Returns:
+        Nytt resultat i samma format som run_optimization
+    """
+    optimizer = result.get('optimizer')
+    
+    if optimizer is None:
+        raise ValueError("Resultatet kan inte prissättas om - kör optimeringen igen")
+    
+    optimization_result = optimizer.reprice_team_results(config)
+    
+    return _build_result(optimizer, optimization_result, result['filtered_data'])
+
+
+def continue_optimization(result: Dict, time_limit_s: Optional[float] = None,
+                          progress_callback: Optional[Callable[[Dict], None]] = None,
+                          observer: Optional[OptimizationObserver] = None) -> Dict:
+    """
+    Fortsätter förbättra ett resultat från run_optimization
+    
+    Avbrutna förbättringar fortsätter och team-antal som inte hann testas
+    testas nu. Tidsredovisningen i 'time_report' ackumuleras över anropen.
     
-    # Optimera antal team
-    min_teams = config.get('min_teams', 5)
-    max_teams = config.get('max_teams', 8)
+    Args:
+        result: Tidigare resultat från run_optimization/continue_optimization
+        time_limit_s: Extra sekunder att använda (None = kör klart)
+        progress_callback: Anropas med en händelse per testat antal team
+        observer: Tar emot händelser från optimeringen (se observers.py)
+    
+    Returns:
+        Nytt resultat i samma format som run_optimization
+    """
+    optimizer = result.get('optimizer')
+    
+    if optimizer is None:
+        raise ValueError("Resultatet kan inte fortsättas - kör optimeringen igen")
+    
+    optimizer.observer = _combine_observers(optimizer.profiler, observer, progress_callback)
+    optimizer.budget.extend(time_limit_s)
     
-    optimization_result = optimizer.optimize_team_count(min_teams, max_teams)
+    if optimizer.profiler is not None:
+        with optimizer.profiler:
+            optimization_result = optimizer.continue_team_count()
+    else:
+        optimization_result = optimizer.continue_team_count()
     
-    # Sammanställ resultat
+    return _build_result(optimizer, optimization_result, result['filtered_data'])
+
+
+def _combine_observers(profiler: Optional[ProfilingObserver],
+                       observer: Optional[OptimizationObserver],
+                       progress_callback: Optional[Callable[[Dict], None]]) -> OptimizationObserver:
+    """Observer för run_optimization/continue_optimization"""
+    observers = [o for o in (profiler, observer) if o is not None]
+    if progress_callback is not None:
+        observers.append(ProgressObserver(progress_callback))
+    
+    if not observers:
+        return NULL_OBSERVER
+    if len(observers) == 1:
+        return observers[0]
+    return CompositeObserver(observers)
+
+
+def _build_result(optimizer: RouteOptimizer, optimization_result: Dict,
+                  processed_data: 'pd.DataFrame') -> Dict:
+    """Sammanställer resultatet från optimize_team_count/continue_team_count"""
     best_result = optimization_result['best_result']
     
     result = {
@@ -976,11 +1878,20 @@ def run_optimization(df: pd.DataFrame, config: Dict, profile: Dict) -> Dict:
         'team_routes': best_result['teams'],
         'total_cost': best_result['total_cost'],
         'total_days': best_result['total_days'],
-        'total_locations': len(locations),
+        'total_locations': len(optimizer.locations),
         'cost_per_location': best_result['cost_per_location'],
         'all_team_results': optimization_result['results'],
         'filtered_data': processed_data,
-        'best_result': best_result  # Inkludera hela best_result för att få home_bases
+        'best_result': best_result,  # Inkludera hela best_result för att få home_bases
+        
+        # Tidsbudget: False om tidsgränsen nåddes innan allt var klart
+        'complete': optimization_result['complete'],
+        # Besparing från optimal dagsindelning (config 'day_split') för valda rutter
+        'day_split_saving': sum(tr.day_split_saving for tr in best_result['teams']),
+        'time_report': optimizer.budget.report(),
+        # Tid, CPU, anrop, avstånd och minne per steg och team-antal
+        'profile': optimizer.profiler.report() if optimizer.profiler is not None else None,
+        'optimizer': optimizer  # Behövs för continue_optimization
     }
     
     return result
@@ -0,0 +1,189 @@
+"""
+Parallel Sweep Module
+Testar flera antal team samtidigt i en processpool (config 'parallel_workers')
+
+Avståndsmatrisen läggs (om den är beräknad) i delat minne och läses utan
+kopiering av alla processer. Varje process får en egen RouteOptimizer med
+samma platser och config. Resultaten lämnas i den ordning processerna blir
+klara, så att förloppet kan rapporteras direkt; optimeraren sorterar dem
+efter antal team.
+
+Processerna startas med forkserver (spawn där forkserver saknas), aldrig
+fork: genomsökningen körs ofta från en bakgrundstråd (JobRunner) och fork av
+en process med flera trådar kan låsa sig. Huvudskriptet importeras därför i
+processerna och måste skydda sin körning med if __name__ == '__main__'.
+Ett avbrott (TimeBudget.cancel) når processerna via en delad Event.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from distance_matrix import DistanceMatrix
+from time_budget import TimeBudget
+
+
+# Processlokalt tillstånd, sätts av _init_worker
+_WORKER: Dict = {}
+
+
+# Moduler som forkserver-processen importerar en gång (ärvs av alla processer)
+PRELOAD_MODULES = ['parallel_sweep', 'optimizer']
+
+
+def evaluate_team_counts(optimizer, team_counts: List[int], workers: int,
+                         required: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Kör optimizer.evaluate_team_count för alla team-antal parallellt
+    
+    Args:
+        optimizer: RouteOptimizer med laddade platser
+        team_counts: Team-antal att testa
+        workers: Max antal processer
+        required: Team-antal som testas även om tidsgränsen har passerats
+    
+    Yields:
+        En dictionary per team-antal (i den ordning de blir klara) med
+        num_teams, result (None om inga rutter), skipped (True om
+        tidsgränsen passerades innan start) och stages (tid per steg)
+    """
+    matrix = optimizer.distance_matrix
+    
+    payload = {
+        'config': optimizer.config,
+        'location_table': optimizer.location_table,
+        'road_factor': matrix.road_factor,
+        'shm_name': None,
+        'remaining_s': optimizer.budget.remaining(),
+        'required': required,
+    }
+    
+    # Hela matrisen delas bara om den är beräknad - annars räknar varje
+    # process ut delmatriserna för sina rutter själv
+    shm = None
+    if matrix.is_computed:
+        shm = shared_memory.SharedMemory(create=True, size=max(matrix.matrix.nbytes, 1))
+        shared = np.ndarray(matrix.matrix.shape, dtype=matrix.matrix.dtype, buffer=shm.buf)
+        shared[:] = matrix.matrix
+        del shared
+        
+        payload.update({
+            'shm_name': shm.name,
+            'shape': matrix.matrix.shape,
+            'dtype': matrix.matrix.dtype.str,
+        })
+    
+    context = _context()
+    
+    # optimizer.budget.cancel() sätter eventen och processerna avbryter sina budgetar
+    cancel_event = context.Event()
+    if optimizer.budget.cancelled:
+        cancel_event.set()
+    optimizer.budget.cancel_event = cancel_event
+    
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(team_counts)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(payload, cancel_event)
+        ) as pool:
+            futures = [pool.submit(_evaluate, num_teams) for num_teams in team_counts]
+            
+            for future in as_completed(futures):
+                outcome = future.result()
+                
+                # Koppla rutternas platser till föräldraprocessens Location-objekt igen
+                result = outcome['result']
+                if result is not None:
+                    positions = result.pop('route_positions')
+                    for team_route, route_positions in zip(result['teams'], positions):
+                        for segment, position in zip(team_route.segments, route_positions):
+                            segment.location = optimizer.locations[position]
+                
+                yield outcome
+    finally:
+        optimizer.budget.cancel_event = None
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+def _context():
+    """forkserver där det finns (Linux, macOS), annars spawn"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _init_worker(payload: Dict, cancel_event):
+    """Bygger processens RouteOptimizer ovanpå den delade avståndsmatrisen"""
+    from optimizer import RouteOptimizer
+    
+    # En tråd per process för NumPy/scikit-learn, processerna delar på kärnorna
+    try:
+        from threadpoolctl import threadpool_limits
+        _WORKER['thread_limits'] = threadpool_limits(1)
+    except ImportError:
+        pass
+    
+    optimizer = RouteOptimizer(payload['config'])
+    optimizer.location_table = payload['location_table']
+    
+    if payload['shm_name'] is not None:
+        shm = shared_memory.SharedMemory(name=payload['shm_name'])
+        matrix = np.ndarray(payload['shape'], dtype=np.dtype(payload['dtype']), buffer=shm.buf)
+        matrix.flags.writeable = False
+        
+        table = optimizer.location_table
+        optimizer.use_distance_matrix(DistanceMatrix(
+            table.latitudes, table.longitudes,
+            payload['road_factor'], matrix=matrix
+        ))
+        _WORKER['shm'] = shm
+    
+    remaining = payload['remaining_s']
+    optimizer.budget = TimeBudget(max(remaining, 1e-6) if remaining is not None else None)
+    
+    # Avbrott från föräldraprocessen avslutar processens budget
+    threading.Thread(target=_watch_cancel, args=(cancel_event, optimizer.budget), daemon=True).start()
+    
+    _WORKER['optimizer'] = optimizer
+    _WORKER['required'] = payload['required']
+
+
+def _watch_cancel(cancel_event, budget: TimeBudget):
+    """Väntar på avbrott från föräldraprocessen (körs i en egen tråd)"""
+    cancel_event.wait()
+    budget.cancel()
+
+
+def _evaluate(num_teams: int) -> Dict:
+    """Testar ett antal team i arbetsprocessen"""
+    optimizer = _WORKER['optimizer']
+    
+    if optimizer.budget.expired() and num_teams != _WORKER['required']:
+        return {'num_teams': num_teams, 'result': None, 'skipped': True, 'stages': {}}
+    
+    before = dict(optimizer.budget.stages)
+    result = optimizer.evaluate_team_count(num_teams)
+    stages = {
+        name: seconds - before.get(name, 0.0)
+        for name, seconds in optimizer.budget.stages.items()
+    }
+    
+    if result is not None:
+        # Platserna skickas tillbaka som kopior - spara positionerna för att
+        # kunna koppla dem till föräldraprocessens objekt
+        result['route_positions'] = [
+            optimizer._positions([segment.location for segment in team_route.segments]).tolist()
+            for team_route in result['teams']
+        ]
+    
+    return {'num_teams': num_teams, 'result': result, 'skipped': False, 'stages': stages}
@@ -0,0 +1,96 @@
+"""
+Profiles Module
+Uppdragsprofiler (Migration och Service): kolumner, filter och standardvärden
+
+Delas av appen, benchmarks och andra som kör run_optimization utan Streamlit.
+"""
+
+from typing import Dict
+
+
+PROFILES = {
+    'migration': {
+        'name': '🔌 Migration (Laddpunkter)',
+        'description': 'Installation av laddpunkter med kWh-filtrering',
+        'work_unit': 'laddpunkter',
+        'work_time_per_unit': 6,
+        'setup_time': 10,
+        'filter_field': 'kWh 2025',
+        'filter_type': 'sum',
+        'filter_threshold': 100000,
+        'default_labor_cost': 500,
+        'default_team_size': 2,
+        'default_vehicle_cost': 2.5,
+        'default_hotel_cost': 2000,
+        'exclude_customers': ['Skistar', 'Helsingborgs Stad'],
+        'data_columns': {
+            'customer': 'Kundnamn',
+            'latitude': 'Latitud',
+            'longitude': 'Longitud',
+            'units': 'Antal uttag',
+            'filter_value': 'kWh 2025'
+        }
+    },
+    'service': {
+        'name': '🔧 Service',
+        'description': 'Fältservice med prioritering och tidsfönster',
+        'work_unit': 'serviceärenden',
+        'work_time_per_unit': 45,
+        'setup_time': 10,
+        'filter_field': 'Priority',
+        'filter_type': 'value',
+        'filter_threshold': 1,
+        'default_labor_cost': 750,
+        'default_team_size': 1,
+        'default_vehicle_cost': 3.5,
+        'default_hotel_cost': 1500,
+        'exclude_customers': [],
+        'data_columns': {
+            'customer': 'Customer Name',
+            'latitude': 'Latitude',
+            'longitude': 'Longitude',
+            'units': 'Service Type',
+            'filter_value': 'Priority'
+        }
+    }
+}
+
+
+def default_config(profile_name: str) -> Dict:
+    """Config med appens standardvärden för en profil"""
+    profile = PROFILES[profile_name]
+    
+    config = {
+        'labor_cost': profile['default_labor_cost'],
+        'team_size': profile['default_team_size'],
+        'vehicle_cost': profile['default_vehicle_cost'],
+        'hotel_cost': profile['default_hotel_cost'],
+        'max_distance': 500,
+        'max_daily_distance': 400,
+        'work_hours': 8,
+        'max_drive_hours': 5,
+        'min_teams': 5,
+        'max_teams': 12,
+        'road_factor': 1.3,
+        'pause_time': 15,
+        'navigation_time': 3,
+        'work_time_per_unit': profile['work_time_per_unit'],
+        'setup_time': profile['setup_time'],
+        'driving_speed': 80,
+        'weekend_work_mode': False,
+        'day_split': False,
+        'public_holidays': True,
+        'blackout_dates': [],
+        'time_limit_s': None,
+        'parallel_workers': 1,
+    }
+    
+    if profile_name == 'migration':
+        config['min_filter_value'] = profile['filter_threshold']
+        config['exclude_customers'] = list(profile['exclude_customers'])
+    else:
+        config['priority_threshold'] = profile['filter_threshold']
+        config['urgent_first'] = True
+        config['same_day'] = False
+    
+    return config
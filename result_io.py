@@ -0,0 +1,317 @@
+"""
+Result IO Module
+Sparar och läser resultat från run_optimization som Parquet-paket
+
+Ett paket är en mapp med en Parquet-fil per tabell och en manifest.json:
+    
+    manifest.json        Config, profil, valt antal team, tidsredovisning och profilering
+    locations.parquet    Platserna (samma kolumner som LocationTable)
+    team_results.parquet En rad per testat antal team
+    home_bases.parquet   Hemmabaser per testat antal team
+    routes.parquet       En rad per team och testat antal team
+    segments.parquet     En rad per besök, i ruttordning, med index i locations
+    filtered_data.parquet Den filtrerade indatan (load_data)
+
+Rutter, ordning, tider och hotellnätter behåller sina typer, så ett inläst
+resultat kan visas, exporteras, jämföras och prissättas om med
+reprice_result utan ny optimering. Optimeraren sparas inte utan byggs upp
+från platserna och de testade team-antalen; continue_optimization fungerar
+också, men avståndsmatrisen beräknas då om.
+
+Kräver pyarrow.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from optimizer import LocationTable, RouteOptimizer, RouteSegment, Team, TeamRoute
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from optimizer import Location
+
+
+# Ändras om paketets format ändras på ett sätt som äldre läsare inte klarar
+BUNDLE_VERSION = 1
+
+MANIFEST_FILENAME = 'manifest.json'
+
+LOCATION_COLUMNS = ['id', 'customer', 'latitude', 'longitude', 'units', 'filter_value', 'work_time']
+
+
+def save_result(result: Dict, path: Union[str, Path], config: Dict,
+                profile: Optional[Dict] = None) -> Path:
+    """
+    Sparar ett resultat som Parquet-paket
+    
+    Args:
+        result: Resultat från run_optimization/continue_optimization/reprice_result
+        path: Mapp att skriva till (skapas; befintliga paketfiler skrivs över)
+        config: Config som resultatet togs fram med
+        profile: Profilen (migration/service), sparas för visning och export
+    
+    Returns:
+        Paketets mapp
+    """
+    import pandas as pd
+    
+    if not result.get('success'):
+        raise ValueError("Bara lyckade resultat kan sparas")
+    
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    
+    table, positions = _location_table(result)
+    
+    team_rows, base_rows, route_rows = [], [], []
+    segment_columns = {name: [] for name in (
+        'num_teams', 'team_position', 'sequence', 'location_index', 'arrival_time',
+        'departure_time', 'drive_time', 'drive_distance', 'work_time', 'is_hotel_night'
+    )}
+    
+    for team_result in result['all_team_results']:
+        num_teams = team_result['num_teams']
+        team_rows.append({
+            'num_teams': num_teams,
+            'total_cost': team_result['total_cost'],
+            'total_days': team_result['total_days'],
+            'cost_per_location': team_result['cost_per_location'],
+            'complete': team_result['complete'],
+        })
+        
+        for position, (latitude, longitude, name) in enumerate(team_result['home_bases']):
+            base_rows.append({
+                'num_teams': num_teams, 'position': position,
+                'latitude': latitude, 'longitude': longitude, 'name': name,
+            })
+        
+        for team_position, route in enumerate(team_result['teams']):
+            route_rows.append({
+                'num_teams': num_teams,
+                'team_position': team_position,
+                'team_id': route.team.id,
+                'home_latitude': route.team.home_base[0],
+                'home_longitude': route.team.home_base[1],
+                'home_name': route.team.home_name,
+                'total_days': route.total_days,
+                'total_distance': route.total_distance,
+                'total_work_time': route.total_work_time,
+                'total_drive_time': route.total_drive_time,
+                'hotel_nights': route.hotel_nights,
+                'total_cost': route.total_cost,
+                'day_split_saving': route.day_split_saving,
+            })
+            
+            num_segments = len(route.segments)
+            segment_columns['num_teams'].extend([num_teams] * num_segments)
+            segment_columns['team_position'].extend([team_position] * num_segments)
+            segment_columns['sequence'].extend(range(num_segments))
+            for segment in route.segments:
+                segment_columns['location_index'].append(positions[id(segment.location)])
+                segment_columns['arrival_time'].append(segment.arrival_time)
+                segment_columns['departure_time'].append(segment.departure_time)
+                segment_columns['drive_time'].append(segment.drive_time)
+                segment_columns['drive_distance'].append(segment.drive_distance)
+                segment_columns['work_time'].append(segment.work_time)
+                segment_columns['is_hotel_night'].append(segment.is_hotel_night)
+    
+    segments = pd.DataFrame(segment_columns)
+    segments['arrival_time'] = pd.to_datetime(segments['arrival_time'])
+    segments['departure_time'] = pd.to_datetime(segments['departure_time'])
+    segments['is_hotel_night'] = segments['is_hotel_night'].astype(bool)
+    
+    _write_frame(pd.DataFrame({
+        'id': table.ids, 'customer': table.customers,
+        'latitude': table.latitudes, 'longitude': table.longitudes,
+        'units': table.units, 'filter_value': table.filter_values, 'work_time': table.work_times,
+    }, columns=LOCATION_COLUMNS), path / 'locations.parquet')
+    _write_frame(pd.DataFrame(team_rows), path / 'team_results.parquet')
+    _write_frame(pd.DataFrame(base_rows, columns=['num_teams', 'position', 'latitude', 'longitude', 'name']),
+                 path / 'home_bases.parquet')
+    _write_frame(pd.DataFrame(route_rows), path / 'routes.parquet')
+    _write_frame(segments, path / 'segments.parquet')
+    _write_frame(result['filtered_data'], path / 'filtered_data.parquet')
+    
+    optimizer = result.get('optimizer')
+    manifest = {
+        'version': BUNDLE_VERSION,
+        'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': config,
+        'profile': profile,
+        'optimal_teams': result['optimal_teams'],
+        'complete': result['complete'],
+        'pending_team_counts': list(optimizer.pending_team_counts) if optimizer is not None else [],
+        'team_count_total': optimizer.team_count_total if optimizer is not None else len(team_rows),
+        'time_report': result.get('time_report'),
+        'run_profile': result.get('profile'),
+    }
+    (path / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding='utf-8')
+    
+    return path
+
+
+def load_result(path: Union[str, Path]) -> Tuple[Dict, Dict, Optional[Dict]]:
+    """
+    Läser ett Parquet-paket från save_result
+    
+    Resultatet har samma format som från run_optimization. Dess 'optimizer'
+    innehåller platser och testade team-antal men ingen avståndsmatris.
+    
+    Returns:
+        (resultat, config, profil)
+    """
+    import pandas as pd
+    
+    path = Path(path)
+    manifest_path = path / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        raise ValueError(f"{path} är inget sparat resultat (manifest.json saknas)")
+    
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    if manifest.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"Paketversion {manifest.get('version')} stöds inte (förväntade {BUNDLE_VERSION})")
+    
+    config = manifest['config']
+    if config.get('team_assignments'):
+        # JSON gör om team-ID (int) till text
+        config['team_assignments'] = {int(team_id): city for team_id, city in config['team_assignments'].items()}
+    
+    locations_df = pd.read_parquet(path / 'locations.parquet')
+    table = LocationTable(*(locations_df[name].to_numpy() for name in LOCATION_COLUMNS))
+    locations = table.to_locations()
+    
+    routes = _load_routes(path, locations)
+    home_bases = _load_home_bases(path)
+    
+    team_results = []
+    for row in pd.read_parquet(path / 'team_results.parquet').itertuples(index=False):
+        num_teams = int(row.num_teams)
+        team_results.append({
+            'num_teams': num_teams,
+            'teams': routes.get(num_teams, []),
+            'total_cost': float(row.total_cost),
+            'total_days': int(row.total_days),
+            'cost_per_location': float(row.cost_per_location),
+            'home_bases': home_bases.get(num_teams, []),
+            'complete': bool(row.complete),
+        })
+    
+    # Optimerare utan avståndsmatris (byggs vid behov av continue_optimization)
+    optimizer = RouteOptimizer(config)
+    optimizer.location_table = table
+    optimizer.team_results = team_results
+    optimizer.pending_team_counts = list(manifest['pending_team_counts'])
+    optimizer.team_count_total = manifest['team_count_total']
+    
+    best_result = next(r for r in team_results if r['num_teams'] == manifest['optimal_teams'])
+    
+    result = {
+        'success': True,
+        'optimal_teams': manifest['optimal_teams'],
+        'team_routes': best_result['teams'],
+        'total_cost': best_result['total_cost'],
+        'total_days': best_result['total_days'],
+        'total_locations': len(table),
+        'cost_per_location': best_result['cost_per_location'],
+        'all_team_results': sorted(team_results, key=lambda r: r['num_teams']),
+        'filtered_data': pd.read_parquet(path / 'filtered_data.parquet'),
+        'best_result': best_result,
+        'complete': manifest['complete'],
+        'day_split_saving': sum(tr.day_split_saving for tr in best_result['teams']),
+        'time_report': manifest['time_report'],
+        'profile': manifest['run_profile'],
+        'optimizer': optimizer,
+    }
+    
+    return result, config, manifest['profile']
+
+
+def _location_table(result: Dict) -> Tuple[LocationTable, Dict[int, int]]:
+    """Platstabell för paketet och index per Location-objekt (id())"""
+    optimizer = result.get('optimizer')
+    locations: List['Location'] = list(optimizer.locations) if optimizer is not None else []
+    positions = {id(location): i for i, location in enumerate(locations)}
+    
+    # Besökta platser som optimeraren inte känner till (t.ex. utan optimerare)
+    for team_result in result['all_team_results']:
+        for route in team_result['teams']:
+            for segment in route.segments:
+                if id(segment.location) not in positions:
+                    positions[id(segment.location)] = len(locations)
+                    locations.append(segment.location)
+    
+    return LocationTable.from_locations(locations), positions
+
+
+def _load_routes(path: Path, locations: List['Location']) -> Dict[int, List[TeamRoute]]:
+    """TeamRoute-listor per testat antal team"""
+    import pandas as pd
+    
+    segments = pd.read_parquet(path / 'segments.parquet')
+    segments = segments.sort_values(['num_teams', 'team_position', 'sequence'], kind='stable')
+    
+    # Kolumnerna som Python-listor en gång, sedan ett RouteSegment per rad
+    keys = list(zip(segments['num_teams'].tolist(), segments['team_position'].tolist()))
+    built = [
+        RouteSegment(locations[index], arrival, departure, drive_time, drive_distance, work_time, hotel)
+        for index, arrival, departure, drive_time, drive_distance, work_time, hotel in zip(
+            segments['location_index'].tolist(),
+            segments['arrival_time'].dt.to_pydatetime().tolist(),
+            segments['departure_time'].dt.to_pydatetime().tolist(),
+            segments['drive_time'].tolist(),
+            segments['drive_distance'].tolist(),
+            segments['work_time'].tolist(),
+            segments['is_hotel_night'].tolist(),
+        )
+    ]
+    
+    segments_by_route: Dict[Tuple[int, int], List[RouteSegment]] = {}
+    for key, segment in zip(keys, built):
+        segments_by_route.setdefault(key, []).append(segment)
+    
+    routes: Dict[int, List[TeamRoute]] = {}
+    route_rows = pd.read_parquet(path / 'routes.parquet').sort_values(['num_teams', 'team_position'])
+    for row in route_rows.itertuples(index=False):
+        num_teams = int(row.num_teams)
+        team = Team(int(row.team_id), (float(row.home_latitude), float(row.home_longitude)), row.home_name)
+        routes.setdefault(num_teams, []).append(TeamRoute(
+            team=team,
+            segments=segments_by_route.get((num_teams, int(row.team_position)), []),
+            total_days=int(row.total_days),
+            total_distance=float(row.total_distance),
+            total_work_time=float(row.total_work_time),
+            total_drive_time=float(row.total_drive_time),
+            hotel_nights=int(row.hotel_nights),
+            total_cost=float(row.total_cost),
+            day_split_saving=float(getattr(row, 'day_split_saving', 0.0)),
+        ))
+    
+    return routes
+
+
+def _load_home_bases(path: Path) -> Dict[int, List[Tuple[float, float, str]]]:
+    """Hemmabaser (lat, lon, namn) per testat antal team"""
+    import pandas as pd
+    
+    home_bases: Dict[int, List[Tuple[float, float, str]]] = {}
+    bases = pd.read_parquet(path / 'home_bases.parquet').sort_values(['num_teams', 'position'])
+    for row in bases.itertuples(index=False):
+        home_bases.setdefault(int(row.num_teams), []).append(
+            (float(row.latitude), float(row.longitude), row.name)
+        )
+    return home_bases
+
+
+def _write_frame(df: 'pd.DataFrame', path: Path):
+    """Skriver en tabell; textkolumner med blandade typer sparas som text"""
+    try:
+        df.to_parquet(path, index=False)
+    except (TypeError, ValueError):
+        # pyarrows fel ärver från dessa; t.ex. en kolumn med både tal och text
+        df = df.copy()
+        for column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].map(lambda value: None if value is None else str(value))
+        df.to_parquet(path, index=False)
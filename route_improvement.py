@@ -0,0 +1,381 @@
+"""
+Route Improvement Module
+Lokalsökning för enskilda rutter på en förberäknad avståndsmatris
+
+Rutter representeras som öppna vägar med fast startnod (position 0),
+normalt teamets hemmabas. Sista platsen har ingen efterföljande kant.
+"""
+
+import time
+import numpy as np
+from collections import deque
+from typing import Optional, Sequence
+
+
+# Minsta förbättring (km) som räknas som en förbättring
+IMPROVEMENT_EPSILON = 1e-9
+
+# Antal undersökta noder mellan kontrollerna av tidsgränsen
+DEADLINE_CHECK_INTERVAL = 64
+
+
+def matrix_with_depot(dist: np.ndarray, home_dist: np.ndarray) -> np.ndarray:
+    """
+    Lägger till hemmabasen som nod 0 i en avståndsmatris
+    
+    Args:
+        dist: Avstånd mellan ruttens platser (n x n)
+        home_dist: Avstånd från hemmabasen till varje plats (n)
+    
+    Returns:
+        Matris (n+1 x n+1) där nod i+1 motsvarar plats i
+    """
+    n = len(home_dist)
+    matrix = np.zeros((n + 1, n + 1))
+    matrix[1:, 1:] = dist
+    matrix[0, 1:] = home_dist
+    matrix[1:, 0] = home_dist
+    return matrix
+
+
+def neighbour_lists(matrix: np.ndarray, k: int = 10) -> np.ndarray:
+    """
+    Returnerar de k närmaste grannarna för varje nod (sorterade efter avstånd)
+    """
+    n = len(matrix)
+    k = max(0, min(k, n - 1))
+    if k == 0:
+        return np.empty((n, 0), dtype=int)
+    
+    work = matrix.copy()
+    np.fill_diagonal(work, np.inf)
+    candidates = np.argpartition(work, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(work, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def path_length(matrix: np.ndarray, tour: Sequence[int]) -> float:
+    """Total längd för en öppen väg genom noderna i tour"""
+    tour = np.asarray(tour, dtype=int)
+    if len(tour) < 2:
+        return 0.0
+    return float(matrix[tour[:-1], tour[1:]].sum())
+
+
+def two_opt(matrix: np.ndarray, tour: Sequence[int],
+            neighbours: Optional[np.ndarray] = None,
+            max_moves: Optional[int] = None,
+            deadline: Optional[float] = None) -> np.ndarray:
+    """
+    2-opt med grannlistor och don't-look bits
+    
+    Endast kandidatdrag där en ny kant går till en av nodens k närmaste
+    grannar utvärderas, och varje drag kostar O(1) att utvärdera. Noder
+    vars omgivning inte förändrats sedan senaste försöket hoppas över.
+    
+    Args:
+        matrix: Avståndsmatris för noderna
+        tour: Startordning, tour[0] hålls fast
+        neighbours: Grannlistor (se neighbour_lists), beräknas om None
+        max_moves: Max antal genomförda förbättringar (None = obegränsat)
+        deadline: time.perf_counter()-tid då sökningen avbryts (None = ingen)
+    
+    Returns:
+        Förbättrad ordning som NumPy-array
+    """
+    return _local_search(matrix, tour, neighbours, _improve_two_opt_node, max_moves, deadline)
+
+
+def or_opt(matrix: np.ndarray, tour: Sequence[int],
+           neighbours: Optional[np.ndarray] = None,
+           max_moves: Optional[int] = None,
+           deadline: Optional[float] = None) -> np.ndarray:
+    """
+    Or-opt: flyttar segment om 1-3 stopp till en ny plats i rutten
+    
+    Segmentet kan sättas in i båda riktningarna. Insättningspunkter hämtas
+    från grannlistorna och varje drag utvärderas i O(1).
+    """
+    return _local_search(matrix, tour, neighbours, _improve_or_opt_node, max_moves, deadline)
+
+
+def three_opt(matrix: np.ndarray, tour: Sequence[int],
+              neighbours: Optional[np.ndarray] = None,
+              max_moves: Optional[int] = None,
+              deadline: Optional[float] = None) -> np.ndarray:
+    """
+    Begränsad 3-opt (segmentbyte, "or-3opt"): A B C D -> A C B D
+    
+    Den enda 3-opt-återkopplingen som inte kan nås med 2-opt-drag. Båda nya
+    kanterna som startar i A och B måste gå till grannar i grannlistorna,
+    så varje nod kostar O(k²) istället för O(n²).
+    """
+    return _local_search(matrix, tour, neighbours, _improve_three_opt_node, max_moves, deadline)
+
+
+# Tillgängliga dragfamiljer (config 'improvement_moves')
+MOVE_FAMILIES = {
+    '2opt': two_opt,
+    'or_opt': or_opt,
+    '3opt': three_opt,
+}
+
+DEFAULT_MOVES = ('2opt', 'or_opt')
+
+
+def improve_route(matrix: np.ndarray, tour: Sequence[int],
+                  moves: Sequence[str] = DEFAULT_MOVES,
+                  neighbours: Optional[np.ndarray] = None,
+                  max_moves: Optional[int] = None,
+                  max_rounds: int = 10,
+                  deadline: Optional[float] = None) -> np.ndarray:
+    """
+    Kör valda dragfamiljer växelvis tills ingen av dem hittar förbättringar
+    
+    Args:
+        matrix: Avståndsmatris för noderna
+        tour: Startordning, tour[0] hålls fast
+        moves: Dragfamiljer att köra, t.ex. ('2opt', 'or_opt', '3opt')
+        neighbours: Grannlistor (se neighbour_lists), beräknas om None
+        max_moves: Max antal förbättringar per familj och runda
+        max_rounds: Max antal varv genom alla familjer
+        deadline: time.perf_counter()-tid då sökningen avbryts (None = ingen)
+    
+    Returns:
+        Förbättrad ordning som NumPy-array
+    """
+    unknown = [name for name in moves if name not in MOVE_FAMILIES]
+    if unknown:
+        raise ValueError(f"Okända förbättringsmetoder: {unknown}")
+    
+    tour = np.array(tour, dtype=int)
+    if neighbours is None:
+        neighbours = neighbour_lists(matrix)
+    
+    length = path_length(matrix, tour)
+    
+    for _ in range(max_rounds):
+        for name in moves:
+            tour = MOVE_FAMILIES[name](matrix, tour, neighbours, max_moves, deadline)
+        
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        
+        new_length = path_length(matrix, tour)
+        if new_length > length - IMPROVEMENT_EPSILON or len(moves) < 2:
+            break
+        length = new_length
+    
+    return tour
+
+
+def _local_search(matrix: np.ndarray, tour: Sequence[int],
+                  neighbours: Optional[np.ndarray], improve_node,
+                  max_moves: Optional[int],
+                  deadline: Optional[float] = None) -> np.ndarray:
+    """
+    Gemensam don't-look-bit-loop för alla dragfamiljer
+    
+    improve_node(matrix, tour, pos, neighbours, a) ska genomföra första
+    förbättrande draget runt nod a (tour och pos uppdateras på plats) och
+    returnera noderna runt de ändrade kanterna, eller en tom lista.
+    Sökningen avbryts med nuvarande (giltiga) ordning när deadline passerats.
+    """
+    tour = np.array(tour, dtype=int)
+    n = len(tour)
+    if n < 4:
+        return tour
+    
+    if neighbours is None:
+        neighbours = neighbour_lists(matrix)
+    
+    pos = np.empty(len(matrix), dtype=int)
+    pos[tour] = np.arange(n)
+    
+    # Don't-look bits: endast noder i kön undersöks
+    queue = deque(int(node) for node in tour)
+    queued = np.zeros(len(matrix), dtype=bool)
+    queued[tour] = True
+    
+    moves = 0
+    checks = 0
+    
+    while queue:
+        # Kontrollera klockan med jämna mellanrum, inte varje varv
+        checks += 1
+        if deadline is not None and checks % DEADLINE_CHECK_INTERVAL == 0:
+            if time.perf_counter() >= deadline:
+                break
+        
+        a = queue.popleft()
+        queued[a] = False
+        
+        touched = improve_node(matrix, tour, pos, neighbours, a)
+        if not touched:
+            continue
+        
+        moves += 1
+        if max_moves is not None and moves >= max_moves:
+            break
+        
+        # Väck noderna runt de ändrade kanterna
+        for node in touched:
+            if not queued[node]:
+                queued[node] = True
+                queue.append(node)
+    
+    return tour
+
+
+def _improve_two_opt_node(matrix: np.ndarray, tour: np.ndarray, pos: np.ndarray,
+                          neighbours: np.ndarray, a: int) -> list:
+    """
+    Söker och genomför första förbättrande 2-opt-draget som ger kanten (a, c)
+    för någon granne c. Returnerar noderna runt ändrade kanter (tom om inget drag)
+    """
+    last = len(tour) - 1
+    
+    for c in neighbours[a]:
+        pa, pc = int(pos[a]), int(pos[c])
+        lo, hi = (pa, pc) if pa < pc else (pc, pa)
+        
+        # Två varianter ger ny kant (a, c):
+        # efterföljar-varianten vänder tour[lo+1..hi], föregångar-varianten tour[lo..hi-1]
+        for p, q in ((lo, hi), (lo - 1, hi - 1)):
+            if p < 0 or q - p < 2:
+                continue
+            
+            a1, b1, c1 = int(tour[p]), int(tour[p + 1]), int(tour[q])
+            d1 = int(tour[q + 1]) if q < last else None
+            
+            delta = matrix[a1, c1] - matrix[a1, b1]
+            if d1 is not None:
+                delta += matrix[b1, d1] - matrix[c1, d1]
+            
+            if delta < -IMPROVEMENT_EPSILON:
+                tour[p + 1:q + 1] = tour[p + 1:q + 1][::-1]
+                pos[tour[p + 1:q + 1]] = np.arange(p + 1, q + 1)
+                
+                touched = [a1, b1, c1, a]
+                if d1 is not None:
+                    touched.append(d1)
+                return touched
+    
+    return []
+
+
+def _improve_or_opt_node(matrix: np.ndarray, tour: np.ndarray, pos: np.ndarray,
+                         neighbours: np.ndarray, a: int, max_segment: int = 3) -> list:
+    """
+    Söker och genomför första förbättrande Or-opt-draget där a är första
+    eller sista stoppet i ett segment som flyttas bredvid en granne till a
+    """
+    last = len(tour) - 1
+    pa = int(pos[a])
+    if pa == 0:
+        return []
+    
+    for length in range(1, max_segment + 1):
+        # a som första respektive sista stopp i segmentet
+        for s in {pa, pa - length + 1}:
+            e = s + length - 1
+            if s < 1 or e > last:
+                continue
+            
+            first, end = int(tour[s]), int(tour[e])
+            prev = int(tour[s - 1])
+            nxt = int(tour[e + 1]) if e < last else None
+            
+            # Vinst av att ta bort segmentet
+            gain = matrix[prev, first]
+            if nxt is not None:
+                gain += matrix[end, nxt] - matrix[prev, nxt]
+            
+            for c in neighbours[a]:
+                # Grannarna är sorterade: en ny kant längre än vinsten kan aldrig löna sig
+                if matrix[a, c] >= gain:
+                    break
+                
+                pc = int(pos[c])
+                if s - 1 <= pc <= e:
+                    continue
+                
+                # Insättning efter c (c, a, ...) eller före c (..., a, c)
+                for g in (pc, pc - 1):
+                    if g < 0 or s - 1 <= g <= e:
+                        continue
+                    
+                    x = int(tour[g])
+                    y = int(tour[g + 1]) if g < last else None
+                    
+                    # Segmentets ände som hamnar närmast x
+                    reverse = (a == end) if g == pc else (a == first)
+                    near, far = (end, first) if reverse else (first, end)
+                    
+                    cost = matrix[x, near]
+                    if y is not None:
+                        cost += matrix[far, y] - matrix[x, y]
+                    
+                    if cost - gain < -IMPROVEMENT_EPSILON:
+                        segment = tour[s:e + 1][::-1] if reverse else tour[s:e + 1]
+                        rest = np.concatenate([tour[:s], tour[e + 1:]])
+                        at = g + 1 if g < s else g + 1 - length
+                        tour[:] = np.concatenate([rest[:at], segment, rest[at:]])
+                        pos[tour] = np.arange(len(tour))
+                        
+                        touched = [prev, first, end, x]
+                        touched += [node for node in (nxt, y) if node is not None]
+                        return touched
+    
+    return []
+
+
+def _improve_three_opt_node(matrix: np.ndarray, tour: np.ndarray, pos: np.ndarray,
+                            neighbours: np.ndarray, a: int) -> list:
+    """
+    Söker och genomför första förbättrande segmentbytet A B C D -> A C B D
+    där a är sista noden i A eller första noden i C
+    """
+    last = len(tour) - 1
+    pa = int(pos[a])
+    
+    for c in neighbours[a]:
+        pc = int(pos[c])
+        
+        # Ny kant (tour[p], tour[q+1]) = (a, c) i någon ordning
+        if pc >= pa + 2:
+            p, q = pa, pc - 1
+        elif pc <= pa - 2:
+            p, q = pc, pa - 1
+        else:
+            continue
+        
+        t_p, t_p1 = int(tour[p]), int(tour[p + 1])
+        t_q, t_q1 = int(tour[q]), int(tour[q + 1])
+        base_delta = matrix[t_p, t_q1] - matrix[t_p, t_p1] - matrix[t_q, t_q1]
+        
+        # Andra nya kanten (tour[r], tour[p+1]) där tour[r] är granne till tour[p+1]
+        for e in neighbours[t_p1]:
+            r = int(pos[e])
+            if r <= q:
+                continue
+            
+            t_r = int(tour[r])
+            t_r1 = int(tour[r + 1]) if r < last else None
+            
+            delta = base_delta + matrix[t_r, t_p1]
+            if t_r1 is not None:
+                delta += matrix[t_q, t_r1] - matrix[t_r, t_r1]
+            
+            if delta < -IMPROVEMENT_EPSILON:
+                tour[:] = np.concatenate([
+                    tour[:p + 1], tour[q + 1:r + 1], tour[p + 1:q + 1], tour[r + 1:]
+                ])
+                pos[tour] = np.arange(len(tour))
+                
+                touched = [t_p, t_p1, t_q, t_q1, t_r]
+                if t_r1 is not None:
+                    touched.append(t_r1)
+                return touched
+    
+    return []
@@ -0,0 +1,117 @@
+"""
+Spatial Index Module
+Rumsligt index för närmaste-punkt- och radiefrågor på jordytan
+
+Punkterna lagras som enhetsvektorer i 3D. Kordans längd växer monotont med
+storcirkelavståndet, så närmaste granne och radiefrågor i 3D ger samma svar
+som Haversine men kan besvaras med ett KD-träd (scipy), eller för ett fåtal
+punkter (t.ex. hemmabaser) med en enda matrisprodukt.
+"""
+
+import numpy as np
+from typing import Sequence, Tuple
+
+from distance_matrix import EARTH_RADIUS_KM, haversine_matrix
+
+
+def unit_vectors(latitudes: Sequence[float], longitudes: Sequence[float]) -> np.ndarray:
+    """Koordinater (grader) som enhetsvektorer i 3D (n x 3)"""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+class SpatialIndex:
+    """
+    Index över punkter för frågor i bulk: närmaste punkt(er) och alla
+    punkter inom en radie. Avstånden är vägavstånd (Haversine x road_factor)
+    i km, samma modell som DistanceMatrix.
+    """
+    
+    # Upp till så här många punkter besvaras närmaste-frågor med en matrisprodukt
+    BRUTE_FORCE_MAX_POINTS = 64
+    
+    def __init__(self, latitudes: Sequence[float], longitudes: Sequence[float],
+                 road_factor: float = 1.3):
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.road_factor = road_factor
+        self.vectors = unit_vectors(self.latitudes, self.longitudes)
+        self._tree = None
+    
+    def __len__(self) -> int:
+        return len(self.vectors)
+    
+    @property
+    def tree(self):
+        """KD-träd över enhetsvektorerna (byggs vid första användning)"""
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.vectors)
+        return self._tree
+    
+    def _chord_to_km(self, chord: np.ndarray) -> np.ndarray:
+        angle = 2 * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+        return angle * EARTH_RADIUS_KM * self.road_factor
+    
+    def _km_to_chord(self, distance_km: float) -> float:
+        angle = min(distance_km / (EARTH_RADIUS_KM * self.road_factor), np.pi)
+        return 2 * np.sin(angle / 2)
+    
+    def nearest(self, latitudes: Sequence[float], longitudes: Sequence[float],
+                k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        De k närmaste indexpunkterna för varje frågepunkt
+        
+        Vid lika avstånd vinner punkten med lägst index (som np.argmin).
+        
+        Returns:
+            (avstånd i km, index), båda med formen (antal frågepunkter x k)
+        """
+        points = unit_vectors(latitudes, longitudes)
+        k = min(k, len(self))
+        
+        if len(points) == 0 or k == 0:
+            return np.empty((len(points), k)), np.empty((len(points), k), dtype=int)
+        
+        if len(self) <= self.BRUTE_FORCE_MAX_POINTS:
+            # Störst skalärprodukt = kortast storcirkelavstånd
+            similarity = points @ self.vectors.T
+            if k == 1:
+                indices = similarity.argmax(axis=1)[:, None]
+            else:
+                indices = np.argsort(-similarity, axis=1, kind='stable')[:, :k]
+            chord = np.linalg.norm(points[:, None, :] - self.vectors[indices], axis=2)
+        else:
+            chord, indices = self.tree.query(points, k=k)
+            chord = chord.reshape(len(points), k)
+            indices = indices.reshape(len(points), k)
+        
+        return self._chord_to_km(chord), indices
+    
+    def within(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        """
+        Index (sorterade) för alla punkter inom radius_km från en koordinat
+        
+        Kandidaterna från KD-trädet kontrolleras med samma Haversine som
+        DistanceMatrix, så gränsfall avgörs exakt som i avståndsmatrisen.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=int)
+        
+        point = unit_vectors([latitude], [longitude])[0]
+        chord = self._km_to_chord(radius_km)
+        candidates = np.sort(np.asarray(
+            self.tree.query_ball_point(point, chord * (1 + 1e-9) + 1e-12), dtype=int
+        ))
+        
+        if len(candidates) == 0:
+            return candidates
+        
+        distances = haversine_matrix(
+            [latitude], [longitude],
+            self.latitudes[candidates], self.longitudes[candidates],
+            self.road_factor
+        )[0]
+        return candidates[distances <= radius_km]
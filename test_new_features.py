@@ -170,6 +170,43 @@ for work_time in work_times:
 
 print("\n✅ TEST 4 GODKÄNT: Migrationstid justeras korrekt!")
 
+# ============================================================================
+# TEST 5: Platstabell (LocationTable)
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 5: Vektoriserad create_locations med LocationTable")
+print("="*70)
+
+# Blandad units-kolumn: tal, text (servicetyp), saknade värden och decimaltal
+mixed_data = pd.DataFrame({
+    'customer': ['Kund A', 'Kund B', 'Kund C', 'Kund D', 'Kund E'],
+    'latitude': [57.7, 59.3, 55.6, 58.4, 57.8],
+    'longitude': [11.9, 18.0, 13.0, 15.6, 14.2],
+    'units': [10, 'Installation', None, 2.9, '5'],
+    'filter_value': [150000, 200000, 120000, 180000, 160000]
+}, index=[4, 8, 15, 16, 23])
+
+optimizer_table = RouteOptimizer(config_normal)
+table = optimizer_table.create_locations(mixed_data, {})
+
+expected_units = [10, 1, 1, 2, 1]
+lazy_before = optimizer_table._locations is None
+locations = optimizer_table.locations
+
+print(f"\n  Enheter: {table.units.tolist()} (förväntat {expected_units})")
+print(f"  ID:      {[loc.id for loc in locations]}")
+print(f"  Location-objekt skapas först vid behov: {lazy_before}")
+
+if (table.units.tolist() == expected_units
+        and [loc.id for loc in locations] == ['LOC_4', 'LOC_8', 'LOC_15', 'LOC_16', 'LOC_23']
+        and lazy_before
+        and locations[0] is table[0]
+        and abs(locations[0].work_time - (10 / 60 + 10 * 6 / 60) / 1.8) < 1e-9):
+    print("\n✅ TEST 5 GODKÄNT: Platstabellen byggs vektoriserat och lazy!")
+else:
+    print("\n❌ TEST 5 MISSLYCKADES: Platstabellen stämmer inte med förväntat")
+
 # ============================================================================
 # SAMMANFATTNING
 # ============================================================================
@@ -183,6 +220,7 @@ print("""
 ✅ TEST 2: Normal Mode - Teams i olika städer  
 ✅ TEST 3: Skip Weekends - Fungerar olika beroende på mode
 ✅ TEST 4: Justerbar Migrationstid - Tider beräknas korrekt
+✅ TEST 5: Platstabell - Vektoriserad create_locations med lazy Location-objekt
 
 ALLA TESTER GODKÄNDA! 🎉
 
@@ -0,0 +1,1415 @@
+"""
+Test Script för ruttmotorn (avståndsmatris och ruttförbättring)
+"""
+
+import time
+import numpy as np
+from optimizer import RouteOptimizer, Location
+from route_improvement import neighbour_lists
+
+print("="*70)
+print("TEST AV RUTTMOTORN")
+print("="*70)
+
+config_test = {
+    'labor_cost': 500,
+    'team_size': 2,
+    'vehicle_cost': 2.5,
+    'hotel_cost': 2000,
+    'max_distance': 500,
+    'work_hours': 8,
+    'max_drive_hours': 5,
+    'road_factor': 1.3,
+    'pause_time': 15,
+    'navigation_time': 3,
+    'work_time_per_unit': 6,
+    'setup_time': 10,
+    'driving_speed': 80,
+    'weekend_work_mode': False,
+}
+
+# Slumpade platser runt Jönköping och Linköping
+rng = np.random.default_rng(42)
+test_locations = []
+for idx in range(120):
+    center = (57.78, 14.16) if idx % 2 == 0 else (58.41, 15.62)
+    test_locations.append(Location(
+        id=f"LOC_{idx}",
+        customer=f"Kund {idx}",
+        latitude=center[0] + rng.normal(0, 0.4),
+        longitude=center[1] + rng.normal(0, 0.6),
+        units=5,
+        filter_value=150000,
+        work_time=0.5
+    ))
+
+# ============================================================================
+# TEST 1: Avståndsmatris
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 1: Förberäknad avståndsmatris")
+print("="*70)
+
+optimizer = RouteOptimizer(config_test)
+optimizer.locations = test_locations
+
+matrix = optimizer.distance_matrix
+home_base = (57.7826, 14.1618)
+
+max_error = 0.0
+for i in range(0, len(test_locations), 7):
+    for j in range(0, len(test_locations), 11):
+        a, b = test_locations[i], test_locations[j]
+        expected = optimizer.calculate_distance(a.latitude, a.longitude, b.latitude, b.longitude)
+        max_error = max(max_error, abs(matrix.matrix[i, j] - expected))
+    expected_base = optimizer.calculate_distance(home_base[0], home_base[1], a.latitude, a.longitude)
+    max_error = max(max_error, abs(matrix.base_row(home_base)[i] - expected_base))
+
+print(f"\n  Matrisstorlek: {matrix.matrix.shape}")
+print(f"  Största avvikelse mot calculate_distance: {max_error:.2e} km")
+
+# Matrisen ska återanvändas så länge platslistan är densamma
+same_matrix = optimizer.distance_matrix is matrix
+
+if max_error < 1e-6 and same_matrix:
+    print("\n✅ TEST 1 GODKÄNT: Avståndsmatrisen stämmer med calculate_distance!")
+else:
+    print("\n❌ TEST 1 MISSLYCKADES: Avståndsmatrisen avviker eller byggs om i onödan")
+
+# ============================================================================
+# TEST 2: 2-opt med grannlistor på stor rutt
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 2: 2-opt med grannlistor (1 000 stopp)")
+print("="*70)
+
+large_locations = []
+for idx in range(1000):
+    large_locations.append(Location(
+        id=f"LOC_{idx}",
+        customer=f"Kund {idx}",
+        latitude=57.0 + rng.random() * 3,
+        longitude=12.0 + rng.random() * 5,
+        units=1,
+        filter_value=150000,
+        work_time=0.5
+    ))
+
+optimizer_large = RouteOptimizer(config_test)
+optimizer_large.locations = large_locations
+
+
+def route_length(opt, route, base):
+    """Körsträcka från hemmabasen genom alla stopp"""
+    positions = {loc.id: i for i, loc in enumerate(opt.locations)}
+    order = [positions[loc.id] for loc in route]
+    total = opt.distance_matrix.base_row(base)[order[0]]
+    for a, b in zip(order[:-1], order[1:]):
+        total += opt.distance_matrix.matrix[a, b]
+    return total
+
+
+nn_route = optimizer_large.build_nearest_neighbour_route(large_locations, home_base)
+start = time.time()
+improved_route = optimizer_large.optimize_route_2opt(nn_route, home_base=home_base)
+elapsed = time.time() - start
+
+nn_length = route_length(optimizer_large, nn_route, home_base)
+improved_length = route_length(optimizer_large, improved_route, home_base)
+same_stops = sorted(loc.id for loc in improved_route) == sorted(loc.id for loc in nn_route)
+
+print(f"\n  Nearest neighbor: {nn_length:,.0f} km")
+print(f"  Efter 2-opt:      {improved_length:,.0f} km")
+print(f"  Tid för 2-opt:    {elapsed:.2f} s")
+
+if same_stops and improved_length < nn_length and elapsed < 1.0:
+    print("\n✅ TEST 2 GODKÄNT: 2-opt förbättrar stora rutter på under en sekund!")
+else:
+    print("\n❌ TEST 2 MISSLYCKADES: 2-opt förbättrade inte rutten tillräckligt snabbt")
+
+# ============================================================================
+# TEST 3: Or-opt och 3-opt
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 3: Or-opt och 3-opt (config 'improvement_moves')")
+print("="*70)
+
+lengths = {}
+for moves in (['2opt'], ['2opt', 'or_opt'], ['2opt', 'or_opt', '3opt']):
+    route = optimizer_large.improve_route(nn_route, home_base, moves=moves)
+    lengths[' + '.join(moves)] = route_length(optimizer_large, route, home_base)
+    print(f"  {' + '.join(moves):22s} {lengths[' + '.join(moves)]:,.0f} km")
+
+try:
+    optimizer_large.improve_route(nn_route, home_base, moves=['4opt'])
+    rejects_unknown = False
+except ValueError:
+    rejects_unknown = True
+
+if (lengths['2opt + or_opt'] < lengths['2opt']
+        and lengths['2opt + or_opt + 3opt'] <= lengths['2opt + or_opt'] * 1.001
+        and rejects_unknown):
+    print("\n✅ TEST 3 GODKÄNT: Or-opt och 3-opt ger kortare rutter!")
+else:
+    print("\n❌ TEST 3 MISSLYCKADES: Or-opt/3-opt gav inga förbättringar")
+
+# ============================================================================
+# TEST 4: Lokalsökning mellan team
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 4: Relocate/swap/2-opt* mellan team (config 'inter_team_search')")
+print("="*70)
+
+from optimizer import Team
+
+teams = [
+    Team(id=1, home_base=(57.7826, 14.1618), home_name="Jönköping"),
+    Team(id=2, home_base=(58.4108, 15.6214), home_name="Linköping"),
+]
+
+costs = {}
+stop_counts = {}
+for search in (False, True):
+    fleet_optimizer = RouteOptimizer({**config_test, 'inter_team_search': search})
+    fleet_optimizer.locations = test_locations
+    team_routes = fleet_optimizer.assign_locations_to_teams(teams)
+    costs[search] = sum(tr.total_cost for tr in team_routes)
+    stop_counts[search] = sum(seg.location is not None for tr in team_routes for seg in tr.segments)
+    print(f"  inter_team_search={search!s:5s} {costs[search]:,.0f} kr, {stop_counts[search]} stopp")
+
+if costs[True] <= costs[False] and stop_counts[True] == stop_counts[False] == len(test_locations):
+    print("\n✅ TEST 4 GODKÄNT: Sökningen mellan team försämrar aldrig totalkostnaden!")
+else:
+    print("\n❌ TEST 4 MISSLYCKADES: Sökningen mellan team gav högre kostnad eller tappade stopp")
+
+# ============================================================================
+# TEST 5: Tidsbudget och fortsatt förbättring
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 5: Tidsgräns (config 'time_limit_s') och continue_team_count")
+print("="*70)
+
+import contextlib
+import io
+
+budget_optimizer = RouteOptimizer({**config_test, 'time_limit_s': 0.05})
+budget_optimizer.locations = large_locations
+
+with contextlib.redirect_stdout(io.StringIO()):
+    first = budget_optimizer.optimize_team_count(2, 4)
+first_costs = {r['num_teams']: r['total_cost'] for r in first['results']}
+report = budget_optimizer.budget.report()
+
+print(f"\n  Med tidsgräns: {len(first['results'])} av 3 team-antal testade, klart={first['complete']}")
+for name, stage in report['stages'].items():
+    print(f"    {name:16s} {stage['seconds']:.3f} s ({stage['share']:.0%})")
+
+budget_optimizer.budget.extend(None)
+with contextlib.redirect_stdout(io.StringIO()):
+    second = budget_optimizer.continue_team_count()
+
+print(f"  Efter fortsättning: {len(second['results'])} av 3 team-antal testade, klart={second['complete']}")
+
+not_worse = all(r['total_cost'] <= first_costs[r['num_teams']] + 1e-6
+                for r in second['results'] if r['num_teams'] in first_costs)
+
+if (first['results'] and not first['complete'] and 'improvement' in report['stages']
+        and second['complete'] and len(second['results']) == 3 and not_worse):
+    print("\n✅ TEST 5 GODKÄNT: Tidsgränsen ger ett resultat som kan förbättras vidare!")
+else:
+    print("\n❌ TEST 5 MISSLYCKADES: Tidsbudgeten fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 6: Parallell genomsökning av antal team
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 6: Parallell genomsökning (config 'parallel_workers')")
+print("="*70)
+
+# Processerna startas med forkserver och importerar huvudskriptet, så den
+# parallella körningen görs i en egen Python-process (som skript utan
+# if __name__ == '__main__' inte får starta processpooler)
+import json
+import os
+import pickle
+import subprocess
+import sys
+
+SWEEP_SCRIPT = """
+import contextlib, io, json, pickle, sys, threading, time
+from benchmark import benchmark_config, generate_dataset
+from observers import OptimizationObserver
+from optimizer import RouteOptimizer, run_optimization
+from profiles import PROFILES
+from time_budget import TimeBudget
+
+config, locations = pickle.load(sys.stdin.buffer)
+own_locations = {id(loc) for loc in locations}
+output = {'sweeps': {}}
+for workers in (1, 2):
+    sweep_optimizer = RouteOptimizer({**config, 'parallel_workers': workers})
+    sweep_optimizer.locations = locations
+    with contextlib.redirect_stdout(io.StringIO()):
+        sweep = sweep_optimizer.optimize_team_count(2, 4)
+    output['sweeps'][workers] = {
+        'optimal_teams': sweep['optimal_teams'],
+        'results': [(r['num_teams'], round(r['total_cost'], 6)) for r in sweep['results']],
+        'same_objects': all(id(segment.location) in own_locations
+                            for r in sweep['results'] for tr in r['teams'] for segment in tr.segments),
+    }
+
+class FinishTimes(OptimizationObserver):
+    def __init__(self):
+        self.times = []
+    def team_count_finished(self, num_teams, result, done, total):
+        self.times.append(time.perf_counter())
+
+# Förlopp när varje process blir klar, och avbrott som når processerna
+parallel_config = {**benchmark_config('migration'), 'parallel_workers': 2, 'min_teams': 2, 'max_teams': 5}
+data = generate_dataset('migration', 2000, seed=3)
+for name, cancel_after in (('full', None), ('cancel', 1.0)):
+    budget = TimeBudget()
+    if cancel_after is not None:
+        threading.Timer(cancel_after, budget.cancel).start()
+    observer = FinishTimes()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_optimization(data, parallel_config, PROFILES['migration'], budget=budget, observer=observer)
+    output[name] = {
+        'seconds': time.perf_counter() - start,
+        'events': [t - start for t in observer.times],
+        'tested': len(result['all_team_results']),
+        'cancelled': result['time_report']['cancelled'],
+    }
+print(json.dumps(output))
+"""
+
+sweep_run = subprocess.run(
+    [sys.executable, '-c', SWEEP_SCRIPT], input=pickle.dumps((config_test, test_locations)),
+    capture_output=True, cwd=os.path.dirname(os.path.abspath(__file__)) or '.'
+)
+if sweep_run.returncode != 0:
+    print(sweep_run.stderr.decode(errors='replace'))
+sweep_output = json.loads(sweep_run.stdout.decode().strip().splitlines()[-1]) if sweep_run.returncode == 0 else None
+
+if sweep_output is not None:
+    sweeps = sweep_output['sweeps']
+    for workers in ('1', '2'):
+        print(f"  {workers} process(er): optimalt {sweeps[workers]['optimal_teams']} team, "
+              f"{[round(cost) for _, cost in sweeps[workers]['results']]}")
+    full, cancelled = sweep_output['full'], sweep_output['cancel']
+    print(f"  Förlopp (2 000 platser, 2-5 team): {[round(t, 1) for t in full['events']]} s")
+    print(f"  Avbrott efter 1 s: klart efter {cancelled['seconds']:.1f} s (utan avbrott {full['seconds']:.1f} s), "
+          f"{cancelled['tested']} av {full['tested']} team-antal testade")
+
+sweep_ok = sweep_output is not None and (
+    sweeps['1']['results'] == sweeps['2']['results']
+    and sweeps['1']['optimal_teams'] == sweeps['2']['optimal_teams']
+    and sweeps['2']['same_objects']
+    # Första team-antalen rapporteras innan genomsökningen är klar
+    and full['events'][0] < full['seconds'] * 0.8
+    and cancelled['cancelled'] and cancelled['seconds'] < full['seconds'] * 0.7
+)
+
+if sweep_ok:
+    print("\n✅ TEST 6 GODKÄNT: Parallell genomsökning ger samma resultat som sekventiell!")
+else:
+    print("\n❌ TEST 6 MISSLYCKADES: Parallell genomsökning avviker från sekventiell")
+
+# ============================================================================
+# TEST 7: Rumsligt index för tilldelning och avståndsfiltrering
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 7: Rumsligt index (20 000 platser, 12 team)")
+print("="*70)
+
+from optimizer import HomeBaseManager, LocationTable
+from distance_matrix import DistanceMatrix, haversine_matrix
+
+n_sites = 20000
+site_lats = 55.5 + rng.random(n_sites) * 13
+site_lons = 11.5 + rng.random(n_sites) * 12
+
+index_optimizer = RouteOptimizer(config_test)
+index_optimizer.location_table = LocationTable(
+    [f"LOC_{i}" for i in range(n_sites)], [f"Kund {i}" for i in range(n_sites)],
+    site_lats, site_lons, np.ones(n_sites), np.zeros(n_sites), np.full(n_sites, 0.5)
+)
+index_teams = [
+    Team(id=i + 1, home_base=(city[0], city[1]), home_name=city[2])
+    for i, city in enumerate(HomeBaseManager.AVAILABLE_CITIES[:12])
+]
+
+start = time.time()
+with contextlib.redirect_stdout(io.StringIO()):
+    assignments = index_optimizer.distribute_locations(index_teams)
+elapsed = time.time() - start
+
+# Jämför med brute force över alla team x platser
+team_distances = haversine_matrix(
+    [team.home_base[0] for team in index_teams], [team.home_base[1] for team in index_teams],
+    site_lats, site_lons, config_test['road_factor']
+)
+expected_team = team_distances.argmin(axis=0) + 1
+site_positions = {loc.id: i for i, loc in enumerate(index_optimizer.locations)}
+assigned_team = np.zeros(n_sites, dtype=int)
+for team_id, team_locations in assignments.items():
+    for loc in team_locations:
+        assigned_team[site_positions[loc.id]] = team_id
+
+within = index_optimizer.filter_by_max_distance(index_teams[0].home_base)
+expected_within = int(np.count_nonzero(team_distances[0] <= config_test['max_distance']))
+
+# Grannlistor från indexet ska ge samma grannar som från matrisen
+small = DistanceMatrix(site_lats[:500], site_lons[:500], config_test['road_factor'])
+index_neighbours = small.neighbours(8)
+matrix_neighbours = neighbour_lists(small.matrix, 8)
+same_neighbours = all(set(a) == set(b) for a, b in zip(index_neighbours, matrix_neighbours))
+
+print(f"\n  Tilldelning: {elapsed:.3f} s, {np.mean(assigned_team == expected_team):.1%} som brute force")
+print(f"  Inom max_distance från {index_teams[0].home_name}: {len(within)} (förväntat {expected_within})")
+print(f"  Full matris byggd: {index_optimizer.distance_matrix.is_computed}")
+
+if (np.array_equal(assigned_team, expected_team) and len(within) == expected_within
+        and not index_optimizer.distance_matrix.is_computed and same_neighbours):
+    print("\n✅ TEST 7 GODKÄNT: Rumsliga indexet ger samma svar som brute force!")
+else:
+    print("\n❌ TEST 7 MISSLYCKADES: Rumsliga indexet avviker från brute force")
+
+# ============================================================================
+# TEST 8: Diskcache för avståndsmatriser
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 8: Diskcache (config 'distance_cache_dir')")
+print("="*70)
+
+import tempfile
+from distance_cache import DistanceCache
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    cache_config = {**config_test, 'distance_cache_dir': cache_dir}
+    
+    first_run = RouteOptimizer(cache_config)
+    first_run.locations = large_locations
+    first_matrix = first_run.build_full_matrix().matrix
+    
+    # Ny körning med samma platser men nya kostnadsparametrar
+    second_run = RouteOptimizer({**cache_config, 'labor_cost': 650})
+    second_run.locations = list(large_locations)
+    second_matrix = second_run.distance_matrix.matrix
+    
+    reused = isinstance(second_matrix, np.memmap) and np.array_equal(first_matrix, second_matrix)
+    print(f"\n  Andra körningen återanvände matrisen från disk: {reused}")
+    
+    # Storleksgränsen tar bort den längst oanvända matrisen
+    import os
+    cache = DistanceCache(cache_dir, max_mb=first_matrix.nbytes * 1.5 / 1024 / 1024)
+    other = large_locations[:500]
+    other_lats = [loc.latitude for loc in other]
+    other_lons = [loc.longitude for loc in other]
+    for age, road_factor in ((300, 1.3), (200, 1.4)):
+        path = cache.store(other_lats, other_lons, road_factor, np.zeros((500, 500)))
+        os.utime(path, (time.time() - age, time.time() - age))
+    del second_matrix, second_run
+    cache.store(
+        [loc.latitude for loc in large_locations], [loc.longitude for loc in large_locations],
+        2.0, np.zeros((1000, 1000))
+    )
+    
+    evicted = cache.load(other_lats, other_lons, 1.3) is None
+    within_limit = cache.size_bytes() <= cache.max_bytes
+    print(f"  Äldsta posten borttagen: {evicted}, inom storleksgränsen: {within_limit}")
+
+if reused and evicted and within_limit:
+    print("\n✅ TEST 8 GODKÄNT: Avståndsmatrisen återanvänds från disk med storleksgräns!")
+else:
+    print("\n❌ TEST 8 MISSLYCKADES: Diskcachen fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 9: Omprissättning utan ny ruttoptimering
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 9: Omprissättning när bara kostnadsparametrar ändras")
+print("="*70)
+
+from optimizer import requires_rerouting
+
+price_optimizer = RouteOptimizer(dict(config_test))
+price_optimizer.locations = test_locations
+with contextlib.redirect_stdout(io.StringIO()):
+    priced = price_optimizer.optimize_team_count(2, 4)
+
+new_prices = {**config_test, 'labor_cost': 900, 'hotel_cost': 800}
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    repriced = price_optimizer.reprice_team_results(new_prices)
+reprice_time = time.perf_counter() - start
+
+# Facit: samma rutter prissatta av en optimerare med de nya priserna
+reference = RouteOptimizer(new_prices)
+expected = {
+    r['num_teams']: sum(reference.calculate_team_costs(tr)['total_cost'] for tr in r['teams'])
+    for r in priced['results']
+}
+costs_match = all(abs(r['total_cost'] - expected[r['num_teams']]) < 1e-6 for r in repriced['results'])
+best_expected = min(sorted(expected), key=lambda n: expected[n])
+
+print(f"\n  Omprissättning: {reprice_time * 1000:.1f} ms, optimalt {priced['optimal_teams']} -> {repriced['optimal_teams']} team")
+
+try:
+    price_optimizer.reprice_team_results({**new_prices, 'team_size': 3})
+    rejected = False
+except ValueError:
+    rejected = True
+
+classified = (
+    not requires_rerouting(config_test, new_prices)
+    and not requires_rerouting(config_test, {
+        **new_prices, 'time_limit_s': 5, 'parallel_workers': 4, 'profile_memory': True,
+        'distance_cache_dir': '/tmp/avstand', 'map_cluster_threshold': 500,
+    })
+    and requires_rerouting(config_test, {**config_test, 'team_size': 3})
+    and requires_rerouting(config_test, {**config_test, 'max_distance': 300})
+)
+
+if costs_match and repriced['optimal_teams'] == best_expected and rejected and classified and reprice_time < 0.1:
+    print("\n✅ TEST 9 GODKÄNT: Befintliga rutter prissätts om på millisekunder!")
+else:
+    print("\n❌ TEST 9 MISSLYCKADES: Omprissättningen stämmer inte")
+
+# ============================================================================
+# TEST 10: Bakgrundsjobb med förlopp och avbrytning
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 10: Bakgrundsjobb (job_runner) med förlopp och avbrytning")
+print("="*70)
+
+import pandas as pd
+from job_runner import JobRunner
+from optimizer import run_optimization
+from time_budget import TimeBudget
+
+job_df = pd.DataFrame({
+    'Kundnamn': [loc.customer for loc in test_locations],
+    'Latitud': [loc.latitude for loc in test_locations],
+    'Longitud': [loc.longitude for loc in test_locations],
+    'Antal uttag': [loc.units for loc in test_locations],
+    'kWh 2025': [loc.filter_value for loc in test_locations],
+})
+job_profile = {
+    'filter_type': 'sum',
+    'data_columns': {
+        'customer': 'Kundnamn', 'latitude': 'Latitud', 'longitude': 'Longitud',
+        'units': 'Antal uttag', 'filter_value': 'kWh 2025'
+    }
+}
+job_config = {**config_test, 'min_teams': 2, 'max_teams': 4, 'min_filter_value': 0}
+
+# Avbrott efter första team-antalet ger bästa hittills funna lösning
+events = []
+cancel_budget = TimeBudget()
+
+def cancel_after_first(event):
+    events.append(event)
+    if event['event'] == 'team_count_done':
+        cancel_budget.cancel()
+
+with contextlib.redirect_stdout(io.StringIO()):
+    cancelled = run_optimization(job_df, job_config, job_profile,
+                                 progress_callback=cancel_after_first, budget=cancel_budget)
+print(f"\n  Avbruten körning: {len(cancelled['all_team_results'])} av 3 team-antal, klart={cancelled['complete']}")
+
+# Jobb i bakgrunden: det första körs klart, det andra avbryts i kön
+runner = JobRunner(max_workers=1)
+with contextlib.redirect_stdout(io.StringIO()):
+    first_id = runner.submit_optimization(job_df, job_config, job_profile)
+    queued_id = runner.submit_optimization(job_df, job_config, job_profile)
+    runner.cancel(queued_id)
+    
+    deadline = time.time() + 60
+    while not (runner.get(first_id).finished and runner.get(queued_id).finished) and time.time() < deadline:
+        time.sleep(0.05)
+
+first_job, queued_job = runner.get(first_id), runner.get(queued_id)
+print(f"  Jobb 1: {first_job.status} ({first_job.progress:.0%}, {first_job.message})")
+print(f"  Jobb 2: {queued_job.status} ({queued_job.message})")
+
+runner.discard(first_id)
+
+if (cancelled['success'] and not cancelled['complete'] and len(cancelled['all_team_results']) == 1
+        and [e['done'] for e in events] == [0, 1] and cancelled['time_report']['cancelled']
+        and first_job.status == 'done' and first_job.progress == 1.0 and first_job.result['complete']
+        and queued_job.status == 'cancelled' and queued_job.result is None
+        and runner.get(first_id) is None):
+    print("\n✅ TEST 10 GODKÄNT: Bakgrundsjobb rapporterar förlopp och kan avbrytas!")
+else:
+    print("\n❌ TEST 10 MISSLYCKADES: Bakgrundsjobben fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 11: Observer-API istället för utskrifter
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 11: Observer-API (observers.py)")
+print("="*70)
+
+from collections import Counter
+from observers import OptimizationObserver
+
+
+class RecordingObserver(OptimizationObserver):
+    active = True
+    
+    def __init__(self):
+        self.events = Counter()
+        self.open_stages = []
+        self.improvements = []
+        self.distances = 0
+    
+    def stage_started(self, stage):
+        self.events['stage_started'] += 1
+        self.open_stages.append(stage)
+    
+    def stage_finished(self, stage, seconds):
+        self.events['stage_finished'] += 1
+        assert self.open_stages.pop() == stage and seconds >= 0
+    
+    def team_count_finished(self, num_teams, result, done, total):
+        self.events['team_count_finished'] += 1
+    
+    def team_route_built(self, team_route):
+        self.events['team_route_built'] += 1
+    
+    def route_improved(self, kind, before_km, after_km):
+        self.improvements.append((kind, before_km, after_km))
+    
+    def distances_computed(self, count):
+        self.distances += count
+
+
+recorder = RecordingObserver()
+silent_output = io.StringIO()
+with contextlib.redirect_stdout(silent_output):
+    run_optimization(job_df, job_config, job_profile, observer=recorder)
+    # Standardobservern skriver ingenting
+    run_optimization(job_df, job_config, job_profile)
+
+# Parallell genomsökning: varje team-antal som lämnas till processerna
+# startas och avslutas eller hoppas över (egen process, se TEST 6)
+OBSERVER_SCRIPT = """
+import contextlib, io, json, pickle, sys
+from observers import OptimizationObserver
+from optimizer import run_optimization
+from time_budget import TimeBudget
+
+df, config, profile = pickle.load(sys.stdin.buffer)
+
+class EventLog(OptimizationObserver):
+    def __init__(self):
+        self.events = []
+    def team_count_started(self, num_teams, done, total):
+        self.events.append(('started', num_teams))
+    def team_count_finished(self, num_teams, result, done, total):
+        self.events.append(('finished', num_teams))
+    def team_count_skipped(self, num_teams, done, total):
+        self.events.append(('skipped', num_teams))
+    def time_limit_reached(self, untested):
+        self.events.append(('time_limit', len(untested)))
+
+output = {}
+for name, budget in (('full', None), ('expired', TimeBudget(1e-6))):
+    log = EventLog()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_optimization(df, {**config, 'parallel_workers': 2}, profile, budget=budget, observer=log)
+    output[name] = log.events
+print(json.dumps(output))
+"""
+
+observer_run = subprocess.run(
+    [sys.executable, '-c', OBSERVER_SCRIPT], input=pickle.dumps((job_df, job_config, job_profile)),
+    capture_output=True, cwd=os.path.dirname(os.path.abspath(__file__)) or '.'
+)
+if observer_run.returncode != 0:
+    print(observer_run.stderr.decode(errors='replace'))
+parallel_events = (json.loads(observer_run.stdout.decode().strip().splitlines()[-1])
+                   if observer_run.returncode == 0 else None)
+
+
+def events_balanced(events):
+    """Varje startat team-antal avslutas eller hoppas över exakt en gång"""
+    started = sorted(n for kind, n in events if kind == 'started')
+    ended = sorted(n for kind, n in events if kind in ('finished', 'skipped'))
+    return started == ended == [2, 3, 4]
+
+
+parallel_ok = parallel_events is not None and (
+    events_balanced(parallel_events['full'])
+    and not any(kind in ('skipped', 'time_limit') for kind, _ in parallel_events['full'])
+    and events_balanced(parallel_events['expired'])
+    # Bara första team-antalet testas när tiden redan är slut
+    and [n for kind, n in parallel_events['expired'] if kind == 'finished'] == [2]
+    and parallel_events['expired'][-1] == ['time_limit', 2]
+)
+
+never_worse = all(after <= before + 1e-6 for _, before, after in recorder.improvements)
+kinds = {kind for kind, _, _ in recorder.improvements}
+
+print(f"\n  Händelser: {dict(recorder.events)}")
+print(f"  Förbättringar: {len(recorder.improvements)} ({', '.join(sorted(kinds))}), "
+      f"avstånd beräknade: {recorder.distances}")
+if parallel_events is not None:
+    print(f"  Parallellt (2 processer): {parallel_events['full']}")
+    print(f"  Parallellt utan tid kvar: {parallel_events['expired']}")
+
+if (recorder.events['stage_started'] == recorder.events['stage_finished'] > 0
+        and not recorder.open_stages
+        and recorder.events['team_count_finished'] == 3
+        and recorder.events['team_route_built'] > 0
+        and kinds == {'route', 'fleet'} and never_worse
+        and recorder.distances >= len(test_locations) ** 2
+        and silent_output.getvalue() == ''
+        and parallel_ok):
+    print("\n✅ TEST 11 GODKÄNT: Optimeringen rapporterar via observers och är tyst som standard!")
+else:
+    print("\n❌ TEST 11 MISSLYCKADES: Observer-API:t fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 12: Profil per steg och team-antal
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 12: Profil i resultatet (tid, CPU, anrop, avstånd, minne)")
+print("="*70)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    profiled = run_optimization(job_df, {**job_config, 'profile_memory': True}, job_profile, profiling=True)
+
+performance = profiled['profile']
+
+# Utan profiling mäts ingenting och no-op-observern används oförändrad
+from observers import NULL_OBSERVER, ProfilingObserver
+
+with contextlib.redirect_stdout(io.StringIO()):
+    unprofiled = run_optimization(job_df, job_config, job_profile)
+    own_profiler = ProfilingObserver()
+    observer_profiled = run_optimization(job_df, job_config, job_profile, observer=own_profiler)
+profiling_opt_in = (
+    unprofiled['profile'] is None and unprofiled['optimizer'].observer is NULL_OBSERVER
+    and unprofiled['optimizer'].profiler is None
+    and observer_profiled['optimizer'].profiler is own_profiler
+    and observer_profiled['profile'] is not None and observer_profiled['profile']['wall_s'] > 0
+)
+stage_entries = {entry['name']: entry for entry in performance['stages'] if entry['stage'] is None}
+step_entries = {entry['name']: entry for entry in performance['stages'] if entry['stage'] is not None}
+
+print(f"\n  Total: {performance['wall_s']:.2f} s, CPU {performance['cpu_s']:.2f} s, "
+      f"{performance['distance_evaluations']:,} avstånd, {performance['peak_memory_mb']:.1f} MB")
+print(f"  Utan profiling: profil {unprofiled['profile']}, no-op-observer: "
+      f"{unprofiled['optimizer'].observer is NULL_OBSERVER}")
+for entry in performance['stages']:
+    indent = "    └ " if entry['stage'] else "  "
+    print(f"  {indent}{entry['name']:18s} {entry['calls']:3d} anrop {entry['wall_s']:.3f} s")
+
+stage_time = sum(entry['wall_s'] for entry in stage_entries.values())
+steps_within_stages = all(
+    entry['wall_s'] <= stage_entries[entry['stage']]['wall_s'] + 1e-6
+    for entry in step_entries.values()
+)
+team_costs_match = (
+    [(entry['num_teams'], round(entry['total_cost'], 6)) for entry in performance['team_counts']]
+    == [(r['num_teams'], round(r['total_cost'], 6)) for r in profiled['all_team_results']]
+)
+
+if (set(stage_entries) == {'load', 'distance_matrix', 'construction', 'improvement', 'scheduling'}
+        and {'load_data', 'create_locations', 'distribute', 'nearest_neighbour',
+             'route_search', 'route_segments', 'costing'} <= set(step_entries)
+        and steps_within_stages and stage_time <= performance['wall_s'] + 1e-6
+        and performance['distance_evaluations'] == len(test_locations) ** 2
+        and team_costs_match and performance['peak_memory_mb'] > 0
+        and all(entry['peak_memory_mb'] is not None for entry in performance['team_counts'])
+        and profiling_opt_in):
+    print("\n✅ TEST 12 GODKÄNT: Resultatet innehåller en profil per steg och team-antal!")
+else:
+    print("\n❌ TEST 12 MISSLYCKADES: Profilen är ofullständig")
+
+# ============================================================================
+# TEST 13: Benchmark-sviten
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 13: Benchmarks på syntetiska instanser (benchmark.py)")
+print("="*70)
+
+import copy
+from benchmark import compare, generate_dataset, run_benchmarks
+
+same_data = generate_dataset('service', 200, seed=3).equals(generate_dataset('service', 200, seed=3))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    bench = run_benchmarks(['migration', 'service'], [100, 300], max_pipeline_sites=100, isolate=False)
+
+cases = {(case['profile'], case['sites']): case for case in bench['cases']}
+small = cases[('migration', 100)]
+large = cases[('migration', 300)]
+
+print(f"\n  Migration 100: {small['pipeline']['wall_s']:.2f} s, {small['pipeline']['total_cost']:,.0f} kr, "
+      f"steg: {', '.join(small['isolated']['stages'])}")
+print(f"  Migration 300: {large['pipeline']}, steg: {', '.join(large['isolated']['stages'])}")
+print(f"  Skalningsexponenter: { {name: round(curve['exponent'], 2) for name, curve in bench['scaling']['migration'].items() if curve['exponent'] is not None} }")
+
+slower = copy.deepcopy(bench)
+for case in slower['cases']:
+    case['isolated']['stages']['distribute']['wall_s'] = max(case['isolated']['stages']['distribute']['wall_s'], 0.05) * 3
+regressions = compare(bench, slower)
+print(f"  Konstgjord regression hittad: {len(regressions)} rader")
+
+if (same_data and 'wall_s' in small['pipeline'] and 'skipped' in large['pipeline']
+        and small['isolated']['total_cost'] > 0 and large['isolated']['total_cost'] is None
+        and {'load', 'distribute'} <= set(large['isolated']['stages'])
+        and bench['scaling']['migration']['distribute']['exponent'] is not None
+        and not compare(bench, bench) and len(regressions) == 4):
+    print("\n✅ TEST 13 GODKÄNT: Benchmark-sviten ger reproducerbara JSON-resultat!")
+else:
+    print("\n❌ TEST 13 MISSLYCKADES: Benchmark-sviten fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 14: Batchkörning från kommandoraden
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 14: Batchkörning utan Streamlit (cli.py)")
+print("="*70)
+
+import json
+from pathlib import Path
+from cli import main as cli_main
+
+with tempfile.TemporaryDirectory() as tmp:
+    tmp = Path(tmp)
+    cli_df = generate_dataset('migration', 80, seed=5)
+    cli_df.to_csv(tmp / 'komma.csv', index=False)
+    cli_df.to_csv(tmp / 'semikolon.csv', sep=';', index=False)
+    (tmp / 'trasig.csv').write_text("a,b\n1,2\n", encoding='utf-8')
+    (tmp / 'config.json').write_text(json.dumps({
+        'min_teams': 2, 'max_teams': 3, 'min_filter_value': 0, 'exclude_customers': []
+    }), encoding='utf-8')
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        exit_code = cli_main([
+            str(tmp / '*.csv'), '--profile', 'migration', '--config', str(tmp / 'config.json'),
+            '--output-dir', str(tmp / 'ut'), '--distance-cache-dir', str(tmp / 'cache')
+        ])
+    
+    batch = json.loads((tmp / 'ut' / 'batch_sammanfattning.json').read_text(encoding='utf-8'))
+    by_name = {Path(entry['input']).name: entry for entry in batch['files']}
+    written = sorted(path.name for path in (tmp / 'ut').iterdir())
+    
+    # Låsta hemmabaser från JSON (team-ID blir text i JSON)
+    (tmp / 'lasta.json').write_text(json.dumps({
+        'min_teams': 2, 'max_teams': 3, 'team_assignments': {'1': 'Jönköping'}
+    }), encoding='utf-8')
+    with contextlib.redirect_stdout(io.StringIO()):
+        locked_exit_code = cli_main([
+            str(tmp / 'komma.csv'), '--profile', 'migration', '--config', str(tmp / 'lasta.json'),
+            '--output-dir', str(tmp / 'lasta'), '--formats', 'csv'
+        ])
+    locked_schedule = pd.read_csv(tmp / 'lasta' / 'komma_schema.csv')
+    locked_home = set(locked_schedule.loc[locked_schedule['Team'] == 'Team 1', 'Hemmabas'])
+    
+    print(f"\n  Slutkod: {exit_code}, lyckade {batch['succeeded']}, misslyckade {batch['failed']}")
+    print(f"  Filer: {written}")
+    print(f"  Återanvänt resultat för semikolon.csv: {by_name['semikolon.csv'].get('reused', False)}")
+    print(f"  Låst hemmabas från JSON: slutkod {locked_exit_code}, Team 1 i {sorted(locked_home)}")
+    
+    if (exit_code == 1 and batch['succeeded'] == 2 and batch['failed'] == 1
+            and not by_name['trasig.csv']['success']
+            and by_name['komma.csv']['total_cost'] == by_name['semikolon.csv']['total_cost']
+            and {'komma_plan.xlsx', 'komma_schema.csv', 'komma_karta.html', 'semikolon_plan.xlsx'} <= set(written)
+            and any((tmp / 'cache').iterdir())
+            and locked_exit_code == 0 and locked_home == {'Jönköping'}):
+        print("\n✅ TEST 14 GODKÄNT: Batchkörningen skriver plan, schema, karta och sammanfattning!")
+    else:
+        print("\n❌ TEST 14 MISSLYCKADES: Batchkörningen fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 15: Cache för uppladdade filer
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 15: Cache för inlästa filer och platstabeller (upload_cache.py)")
+print("="*70)
+
+from profiles import PROFILES
+from upload_cache import UploadCache
+
+upload_cache = UploadCache(max_mb=64)
+upload_df = generate_dataset('migration', 2000, seed=7)
+upload_bytes = upload_df.to_csv(sep=';', index=False).encode('utf-8-sig')
+location_config = {'setup_time': 10, 'work_time_per_unit': 6, 'team_size': 2, 'min_filter_value': 0}
+
+start = time.perf_counter()
+digest, parsed = upload_cache.dataframe(upload_bytes, 'kunder.csv')
+first_s = time.perf_counter() - start
+start = time.perf_counter()
+digest_again, parsed_again = upload_cache.dataframe(upload_bytes, 'kunder.csv')
+cached_s = time.perf_counter() - start
+
+filtered, table = upload_cache.processed(digest, parsed, 'migration', PROFILES['migration'], location_config)
+_, table_again = upload_cache.processed(digest, parsed, 'migration', PROFILES['migration'], dict(location_config))
+_, table_team = upload_cache.processed(digest, parsed, 'migration', PROFILES['migration'], {**location_config, 'team_size': 1})
+filtered_kwh, _ = upload_cache.processed(digest, parsed, 'migration', PROFILES['migration'], {**location_config, 'min_filter_value': 10**9})
+
+print(f"\n  Inläsning: {first_s*1000:.1f} ms, från cache: {cached_s*1000:.3f} ms ({len(parsed)} rader)")
+print(f"  Cache: {upload_cache.stats()}")
+
+# Optimeringen använder cachad filtrerad data och platstabell (ingen ny inläsning)
+run_df = generate_dataset('migration', 300, seed=8)
+run_digest, run_parsed = upload_cache.dataframe(run_df.to_csv(index=False).encode(), 'optimera.csv')
+run_config = {**config_test, **location_config, 'min_teams': 2, 'max_teams': 3}
+hits_before = upload_cache.hits
+upload_cache.processed(run_digest, run_parsed, 'migration', PROFILES['migration'], run_config)
+run_prepared = upload_cache.processed(run_digest, run_parsed, 'migration', PROFILES['migration'], run_config)
+with contextlib.redirect_stdout(io.StringIO()):
+    direct_run = run_optimization(run_parsed, run_config, PROFILES['migration'])
+    prepared_run = run_optimization(run_parsed, run_config, PROFILES['migration'], prepared=run_prepared)
+hits_after = upload_cache.hits
+# Varje anrop får en egen vy - jobbets Location-objekt delas inte med nästa jobb
+next_table = upload_cache.processed(run_digest, run_parsed, 'migration', PROFILES['migration'], run_config)[1]
+prepared_ok = (
+    hits_after == hits_before + 2
+    and next_table.ids is run_prepared[1].ids
+    and next_table[0] is not run_prepared[1][0]
+    and abs(prepared_run['total_cost'] - direct_run['total_cost']) < 1e-6
+    and prepared_run['filtered_data'] is run_prepared[0]
+    and 'load' not in prepared_run['time_report']['stages']
+)
+print(f"  Optimering ur cachen: {prepared_run['total_cost']:,.0f} kr (utan cache {direct_run['total_cost']:,.0f} kr), "
+      f"inläsning hoppades över: {'load' not in prepared_run['time_report']['stages']}")
+
+# Plats för ungefär en och en halv inläst fil - den äldsta trängs undan
+small_cache = UploadCache()
+small_cache.dataframe(upload_bytes, 'kunder.csv')
+small_cache.max_bytes = int(1.5 * small_cache.size_bytes)
+small_cache.dataframe(upload_df.head(1990).to_csv(sep=';', index=False).encode(), 'kunder2.csv')
+misses_before = small_cache.misses
+small_cache.dataframe(upload_bytes, 'kunder.csv')
+evicted = small_cache.misses == misses_before + 1
+print(f"  Liten cache efter tre inläsningar: {small_cache.stats()['entries']} post(er), äldsta undanträngd: {evicted}")
+
+if (digest == digest_again and parsed_again is parsed and len(parsed) == 2000
+        and table_again.ids is table.ids and table_team.ids is not table.ids
+        and np.allclose(table_team.work_times, table.work_times * 1.8)
+        and len(filtered) == 2000 and len(filtered_kwh) == 0
+        and small_cache.size_bytes <= small_cache.max_bytes and small_cache.stats()['entries'] == 1 and evicted
+        and prepared_ok):
+    print("\n✅ TEST 15 GODKÄNT: Filer och platstabeller cachas per innehåll och config med storleksgräns!")
+else:
+    print("\n❌ TEST 15 MISSLYCKADES: Cachen för uppladdade filer fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 16: Snabb import utan tunga beroenden
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 16: Tunga beroenden laddas först vid användning")
+print("="*70)
+
+import subprocess
+import sys
+from benchmark import HEAVY_MODULES, IMPORT_BUDGETS_S
+
+import_check = subprocess.run(
+    [sys.executable, '-c',
+     "import sys, optimizer, excel_export, map_visualization, job_runner, upload_cache, cli; "
+     f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"],
+    capture_output=True, text=True, check=True
+)
+loaded_heavy = import_check.stdout.strip()
+
+print(f"\n  Tunga moduler efter import av kärnan, kartan, Excel och CLI: {loaded_heavy or 'inga'}")
+for module, measured in bench['imports'].items():
+    print(f"  import {module}: {measured['seconds']*1000:.0f} ms (budget {measured['budget_s']*1000:.0f} ms)")
+
+if (not loaded_heavy and set(bench['imports']) == set(IMPORT_BUDGETS_S)
+        and all(measured['within_budget'] and not measured['heavy_modules'] for measured in bench['imports'].values())):
+    print("\n✅ TEST 16 GODKÄNT: Importen håller tidsbudgeten och laddar inga tunga beroenden!")
+else:
+    print("\n❌ TEST 16 MISSLYCKADES: Importen laddar tunga beroenden eller överskrider budgeten")
+
+# ============================================================================
+# TEST 17: Klustrad karta för många stopp
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 17: Klustrat kartläge (create_route_map)")
+print("="*70)
+
+from benchmark import benchmark_config
+from map_visualization import create_route_map
+
+map_config = {**benchmark_config('migration'), 'min_teams': 3, 'max_teams': 3}
+with contextlib.redirect_stdout(io.StringIO()):
+    map_result = run_optimization(generate_dataset('migration', 400, seed=9), map_config, PROFILES['migration'])
+map_routes = map_result['team_routes']
+map_stops = sum(len(route.segments) for route in map_routes)
+team_days = sum(len({segment.arrival_time.date() for segment in route.segments}) for route in map_routes)
+
+detailed_html = create_route_map(map_routes, map_config, mode='detailed')
+clustered_html = create_route_map(map_routes, map_config, mode='clustered')
+auto_small = create_route_map(map_routes, map_config)
+auto_large = create_route_map(map_routes, {**map_config, 'map_cluster_threshold': 100})
+
+try:
+    create_route_map(map_routes, map_config, mode='okänt')
+    rejects_mode = False
+except ValueError:
+    rejects_mode = True
+
+print(f"\n  {map_stops} stopp, {team_days} team-dagar")
+print(f"  Detaljerad: {len(detailed_html)/1024:.0f} KB, {detailed_html.count('LineString')} linjer")
+print(f"  Klustrad: {len(clustered_html)/1024:.0f} KB, {clustered_html.count('LineString')} linjer")
+
+if (len(clustered_html) < len(detailed_html)
+        and 'markerClusterGroup' in clustered_html and 'markerClusterGroup' not in detailed_html
+        and len(map_routes) < clustered_html.count('LineString') <= team_days + len(map_routes)
+        and 'markerClusterGroup' not in auto_small
+        and 'markerClusterGroup' in auto_large and rejects_mode):
+    print("\n✅ TEST 17 GODKÄNT: Klustrat läge ger mindre HTML med en linje per team och dag!")
+else:
+    print("\n❌ TEST 17 MISSLYCKADES: Klustrat kartläge fungerar inte som förväntat")
+
+# ============================================================================
+# TEST 18: GeoJSON-lager i den detaljerade kartan
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 18: Detaljerad karta byggd av GeoJSON-lager")
+print("="*70)
+
+import html as html_module
+import re
+
+visited_map_locations = [segment.location for route in map_routes for segment in route.segments]
+unvisited_location = Location(id='LOC_obesokt', customer='Obesökt kund', latitude=57.7, longitude=11.97,
+                              units=2, filter_value=5000, work_time=0.5)
+
+start = time.perf_counter()
+geojson_html = create_route_map(map_routes, map_config, all_locations=visited_map_locations + [unvisited_location],
+                                visited_locations=visited_map_locations, mode='detailed')
+geojson_s = time.perf_counter() - start
+
+unescaped = html_module.unescape(geojson_html)
+point_features = unescaped.count('"Point"')
+layers = len(re.findall(r'var geo_json_\w+ = L\.geoJson', unescaped))
+
+print(f"\n  {map_stops} stopp: {len(geojson_html)/1024:.0f} KB ({len(geojson_html)/map_stops:.0f} byte/stopp), {geojson_s*1000:.0f} ms")
+popup_aliases = unescaped.count('hit (km)')
+print(f"  {layers} GeoJSON-lager, {point_features} punkter, popuprubriken 'Körsträcka hit' {popup_aliases} gånger")
+
+if (point_features == map_stops + 1 and layers <= 3 * len(map_routes) + 3
+        and 0 < popup_aliases <= layers and len(geojson_html) / map_stops < 1000):
+    print("\n✅ TEST 18 GODKÄNT: Ett GeoJSON-lager per lagertyp med popups från egenskaper!")
+else:
+    print("\n❌ TEST 18 MISSLYCKADES: Den detaljerade kartan är inte byggd av GeoJSON-lager")
+
+# ============================================================================
+# TEST 19: Fingeravtryck för cachade kartor och rapporter
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 19: Fingeravtryck för resultat (result_fingerprint)")
+print("="*70)
+
+from optimizer import reprice_result, result_fingerprint
+
+start = time.perf_counter()
+map_fingerprint = result_fingerprint(map_result, map_config)
+fingerprint_ms = (time.perf_counter() - start) * 1000
+same_fingerprint = result_fingerprint(map_result, dict(map_config)) == map_fingerprint
+
+repriced_config = {**map_config, 'hotel_cost': map_config['hotel_cost'] + 500}
+repriced_fingerprint = result_fingerprint(reprice_result(map_result, repriced_config), repriced_config)
+config_fingerprint = result_fingerprint(map_result, {**map_config, 'labor_cost': 1})
+
+print(f"\n  Fingeravtryck: {map_fingerprint[:16]}... ({fingerprint_ms:.1f} ms för {map_stops} stopp)")
+print(f"  Oförändrat resultat ger samma avtryck: {same_fingerprint}")
+print(f"  Omprissatt resultat ger nytt avtryck: {repriced_fingerprint != map_fingerprint}")
+
+if same_fingerprint and repriced_fingerprint != map_fingerprint and config_fingerprint != map_fingerprint:
+    print("\n✅ TEST 19 GODKÄNT: Fingeravtrycket följer resultatet och configen!")
+else:
+    print("\n❌ TEST 19 MISSLYCKADES: Fingeravtrycket följer inte resultatet")
+
+# ============================================================================
+# TEST 20: Strömmande Excel-export
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 20: Excel-rapport skriven rad för rad (write_excel_report)")
+print("="*70)
+
+import os
+
+from excel_export import create_excel_report, create_daily_summary_sheet, write_excel_report
+
+excel_routes = map_result['team_routes']
+
+with tempfile.TemporaryDirectory() as excel_dir:
+    excel_path = os.path.join(excel_dir, 'plan.xlsx')
+    start = time.perf_counter()
+    write_excel_report(excel_routes, map_config, excel_path)
+    excel_s = time.perf_counter() - start
+    excel_sheets = pd.read_excel(excel_path, sheet_name=None)
+
+excel_bytes_sheets = pd.read_excel(io.BytesIO(create_excel_report(excel_routes, map_config)), sheet_name=None)
+excel_schedule = excel_sheets['Detaljerat Schema']
+excel_summary = excel_sheets['Sammanfattning']
+
+schedule_sorted = excel_schedule[['Team', 'Löpnummer']].equals(
+    excel_schedule.sort_values(['Team', 'Löpnummer'])[['Team', 'Löpnummer']].reset_index(drop=True)
+)
+rows_match = (
+    len(excel_schedule) == map_stops
+    and len(excel_sheets['Daglig Ruttanalys']) == len(create_daily_summary_sheet(excel_routes))
+    and len(excel_summary) == len(excel_routes) + 1
+)
+totals_match = (
+    excel_summary.iloc[-1]['Team'] == 'TOTALT'
+    and excel_summary.iloc[-1]['Antal områden'] == map_stops
+)
+same_as_bytes = all(excel_sheets[name].equals(excel_bytes_sheets[name]) for name in excel_sheets)
+
+print(f"\n  Flikar: {', '.join(excel_sheets)}")
+print(f"  {len(excel_schedule)} schemarader skrivna på {excel_s:.2f} s")
+print(f"  Sorterat efter team och löpnummer: {schedule_sorted}")
+print(f"  Totalrad: {excel_summary.iloc[-1]['Antal områden']} områden")
+
+if rows_match and schedule_sorted and totals_match and same_as_bytes:
+    print("\n✅ TEST 20 GODKÄNT: Excel-rapporten strömmas till fil med samma innehåll!")
+else:
+    print("\n❌ TEST 20 MISSLYCKADES: Strömmad Excel-rapport stämmer inte")
+
+# ============================================================================
+# TEST 21: Daglig ruttanalys med gruppering
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 21: Utplattat schema och daglig analys (schedule_frame, daily_summary)")
+print("="*70)
+
+from excel_export import SCHEDULE_FRAME_COLUMNS, create_csv_export, daily_summary, schedule_frame
+
+start = time.perf_counter()
+excel_schedule_frame = schedule_frame(excel_routes)
+excel_daily = daily_summary(excel_schedule_frame)
+daily_ms = (time.perf_counter() - start) * 1000
+
+# Referens: summera besöken per team och dag direkt från segmenten
+expected_days = {}
+for route in excel_routes:
+    for segment in route.segments:
+        key = (f'Team {route.team.id}', segment.arrival_time.strftime('%Y-%m-%d'))
+        visits, km, hotel = expected_days.get(key, (0, 0.0, False))
+        expected_days[key] = (visits + 1, km + segment.drive_distance, segment.is_hotel_night)
+
+daily_matches = len(excel_daily) == len(expected_days) and all(
+    row['Antal besök'] == expected_days[(row['Team'], row['Datum'])][0]
+    and abs(row['Körsträcka (km)'] - expected_days[(row['Team'], row['Datum'])][1]) < 0.06
+    and (row['Hotellnatt'] == 'Ja') == expected_days[(row['Team'], row['Datum'])][2]
+    for _, row in excel_daily.iterrows()
+)
+daily_sorted = excel_daily[['Team', 'Datum']].equals(
+    excel_daily.sort_values(['Team', 'Datum'])[['Team', 'Datum']].reset_index(drop=True)
+)
+frame_ok = list(excel_schedule_frame.columns) == SCHEDULE_FRAME_COLUMNS and len(excel_schedule_frame) == map_stops
+csv_reused = create_csv_export(excel_routes, excel_schedule_frame) == create_csv_export(excel_routes)
+excel_from_frame = pd.read_excel(io.BytesIO(create_excel_report(excel_routes, map_config, excel_schedule_frame)),
+                                 sheet_name=None)
+excel_reused = all(excel_from_frame[name].equals(excel_sheets[name]) for name in excel_sheets)
+
+# Excel-rapporten strömmar schemafliken från segmenten utan formaterad kopia av
+# tabellen - minnet är i stort sett schemat som tabell för dagsfliken
+import tracemalloc
+from dataclasses import replace
+
+long_routes = [replace(route, segments=route.segments * 20) for route in excel_routes]
+with tempfile.TemporaryDirectory() as excel_dir:
+    tracemalloc.start()
+    write_excel_report(long_routes, map_config, os.path.join(excel_dir, 'lang.xlsx'))
+    excel_peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+tracemalloc.start()
+schedule_frame(long_routes)
+frame_peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+tracemalloc.stop()
+
+print(f"\n  {len(excel_schedule_frame)} besök -> {len(excel_daily)} dagar på {daily_ms:.1f} ms")
+print(f"  Stämmer mot segmenten: {daily_matches}, sorterat efter team och datum: {daily_sorted}")
+print(f"  CSV och Excel ur delat schema identiska: {csv_reused and excel_reused}")
+print(f"  Minne för {map_stops * 20} besök: Excel {excel_peak_mb:.1f} MB, schemat som tabell {frame_peak_mb:.1f} MB")
+
+if daily_matches and daily_sorted and frame_ok and csv_reused and excel_reused and excel_peak_mb < frame_peak_mb * 1.25:
+    print("\n✅ TEST 21 GODKÄNT: Daglig analys aggregeras ur ett delat schema!")
+else:
+    print("\n❌ TEST 21 MISSLYCKADES: Daglig analys stämmer inte med segmenten")
+
+# ============================================================================
+# TEST 22: Resultat som Parquet-paket
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 22: Spara och läsa in resultat (result_io)")
+print("="*70)
+
+from result_io import load_result, save_result
+
+with tempfile.TemporaryDirectory() as bundle_dir:
+    start = time.perf_counter()
+    save_result(map_result, bundle_dir, map_config, PROFILES['migration'])
+    save_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    loaded_result, loaded_config, loaded_profile = load_result(bundle_dir)
+    load_ms = (time.perf_counter() - start) * 1000
+    bundle_files = sorted(os.listdir(bundle_dir))
+    
+    # Indata med blandade typer i en kolumn (t.ex. postnummer som tal och text)
+    mixed_data = map_result['filtered_data'].copy()
+    mixed_data['Postnummer'] = [12345 if i % 2 else 'SE-123' for i in range(len(mixed_data))]
+    save_result({**map_result, 'filtered_data': mixed_data}, bundle_dir, map_config)
+    mixed_loaded = load_result(bundle_dir)[0]['filtered_data']
+
+routes_match = all(
+    original['teams'] == loaded['teams'] and original['home_bases'] == loaded['home_bases']
+    for original, loaded in zip(map_result['all_team_results'], loaded_result['all_team_results'])
+)
+same_fingerprint = result_fingerprint(loaded_result, loaded_config) == map_fingerprint
+hotel_flags = [s.is_hotel_night for r in loaded_result['team_routes'] for s in r.segments]
+
+repriced_original = reprice_result(map_result, repriced_config)
+repriced_loaded = reprice_result(loaded_result, repriced_config)
+reprice_match = abs(repriced_original['total_cost'] - repriced_loaded['total_cost']) < 1e-6
+
+print(f"\n  Filer: {', '.join(bundle_files)}")
+print(f"  Sparat på {save_ms:.0f} ms, inläst på {load_ms:.0f} ms ({map_stops} stopp)")
+print(f"  Samma rutter: {routes_match}, samma fingeravtryck: {same_fingerprint}")
+print(f"  Hotellnätter som bool: {all(isinstance(flag, bool) for flag in hotel_flags)}")
+print(f"  Omprissatt inläst resultat: {repriced_loaded['total_cost']:,.0f} kr (original {repriced_original['total_cost']:,.0f} kr)")
+
+if (routes_match and same_fingerprint and reprice_match and loaded_profile == PROFILES['migration']
+        and all(isinstance(flag, bool) for flag in hotel_flags) and len(mixed_loaded) == len(mixed_data)):
+    print("\n✅ TEST 22 GODKÄNT: Resultatet sparas och läses in utan ny optimering!")
+else:
+    print("\n❌ TEST 22 MISSLYCKADES: Inläst resultat skiljer sig från originalet")
+
+# ============================================================================
+# TEST 23: Optimal dagsindelning
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 23: Dagsindelning med dynamisk programmering (day_split)")
+print("="*70)
+
+import itertools
+
+from day_split import leg_hours, optimal_day_split
+from observers import STEP_NAMES
+
+split_params = dict(work_hours=8, max_drive_hours=5, driving_speed=80, pause_time=0.25,
+                    navigation_time=0.05, hourly_cost=1000, km_cost=2.5, hotel_night_cost=4000)
+
+
+def brute_force_split(dist, home_dist, work_times, p):
+    """Billigaste indelning genom att pröva alla gränser och nätter (3^(n-1) fall)"""
+    n = len(home_dist)
+    best = np.inf
+    for choice in itertools.product((None, 'home', 'hotel'), repeat=n - 1):
+        cost, day_work, day_drive, ok = 0.0, 0.0, 0.0, True
+        day_len = 0
+        for idx in range(n):
+            night = choice[idx - 1] if idx > 0 else 'home'
+            if idx == 0 or night is not None:
+                km = home_dist[idx] if night == 'home' else dist[idx - 1, idx]
+                day_work, day_drive, day_len = 0.0, 0.0, 0
+            else:
+                km = dist[idx - 1, idx]
+            hours = float(leg_hours(km, p['driving_speed'], p['pause_time'], p['navigation_time']))
+            day_work += work_times[idx]
+            day_drive += hours
+            day_len += 1
+            cost += p['hourly_cost'] * hours + p['km_cost'] * km
+            if day_len > 1 and (day_work > p['work_hours'] or day_drive > p['max_drive_hours']):
+                ok = False
+            next_night = choice[idx] if idx < n - 1 else None
+            if next_night == 'hotel':
+                cost += p['hotel_night_cost']
+            elif next_night == 'home':
+                if day_drive + float(leg_hours(home_dist[idx], p['driving_speed'], p['pause_time'])) > p['max_drive_hours']:
+                    ok = False
+        if ok:
+            best = min(best, cost)
+    return best
+
+
+split_rng = np.random.default_rng(4)
+brute_matches = 0
+for _ in range(20):
+    points = split_rng.uniform(0, 300, (8, 2))
+    home = split_rng.uniform(0, 300, 2)
+    dist = np.linalg.norm(points[:, None] - points[None], axis=2)
+    home_dist = np.linalg.norm(points - home, axis=1)
+    work_times = split_rng.uniform(0.5, 4, 8)
+    split = optimal_day_split(dist, home_dist, work_times, **split_params)
+    if abs(split.cost - brute_force_split(dist, home_dist, work_times, split_params)) < 1e-6:
+        brute_matches += 1
+
+# Lång rutt: O(n·k), tiden växer linjärt med antal stopp
+long_points = np.cumsum(split_rng.uniform(0, 20, (2000, 2)), axis=0)
+long_dist = np.linalg.norm(long_points[:, None] - long_points[None], axis=2)
+long_home = np.linalg.norm(long_points, axis=1)
+start = time.perf_counter()
+long_split = optimal_day_split(long_dist, long_home, split_rng.uniform(0.3, 2, 2000), **split_params)
+long_split_ms = (time.perf_counter() - start) * 1000
+
+split_config = {**map_config, 'day_split': True}
+with contextlib.redirect_stdout(io.StringIO()):
+    split_result = run_optimization(generate_dataset('migration', 400, seed=9), split_config, PROFILES['migration'],
+                                    profiling=True)
+
+days_within_limits = all(
+    len(day) == 1 or sum(segment.work_time for segment in day) <= split_config['work_hours']
+    for route in split_result['team_routes']
+    for _, day in itertools.groupby(route.segments, key=lambda segment: segment.arrival_time.date())
+    for day in [list(day)]
+)
+
+# Med day_split styr priserna indelningen: en prisändring ger ny optimering,
+# och resultatet blir detsamma som en ny körning med de nya priserna
+split_prices = {**split_config, 'hotel_cost': 20000}
+split_data = generate_dataset('migration', 400, seed=9)
+with contextlib.redirect_stdout(io.StringIO()):
+    if requires_rerouting(split_config, split_prices):
+        split_repriced = run_optimization(split_data, split_prices, PROFILES['migration'])
+    else:
+        split_repriced = reprice_result(split_result, split_prices)
+    split_fresh = run_optimization(split_data, split_prices, PROFILES['migration'])
+try:
+    reprice_result(split_result, split_prices)
+    split_reprice_rejected = False
+except ValueError:
+    split_reprice_rejected = True
+split_steps = [entry['name'] for entry in split_result['profile']['stages'] if entry['stage'] is not None]
+split_step_reported = 'day_split' in split_steps and 'day_split' in STEP_NAMES
+split_reprice_matches = (
+    split_reprice_rejected
+    and abs(split_repriced['total_cost'] - split_fresh['total_cost']) < 1e-6
+    and abs(split_repriced['day_split_saving'] - split_fresh['day_split_saving']) < 1e-6
+)
+
+print(f"\n  Samma kostnad som uttömmande sökning: {brute_matches}/20 rutter")
+print(f"  2 000 stopp delade i {len(long_split.day_starts)} dagar på {long_split_ms:.0f} ms")
+print(f"  Girig indelning: {map_result['total_cost']:,.0f} kr, optimal: {split_result['total_cost']:,.0f} kr "
+      f"(besparing {split_result['day_split_saving']:,.0f} kr)")
+print(f"  Hotellnätter: {sum(r.hotel_nights for r in map_routes)} -> {sum(r.hotel_nights for r in split_result['team_routes'])}")
+print(f"  Hotellkostnad 20 000 kr: {split_repriced['total_cost']:,.0f} kr (ny körning {split_fresh['total_cost']:,.0f} kr), "
+      f"besparing {split_repriced['day_split_saving']:,.0f} kr")
+
+if (brute_matches == 20 and days_within_limits and split_result['day_split_saving'] >= 0 and split_reprice_matches and split_step_reported
+        and split_result['total_cost'] <= map_result['total_cost'] + 1e-6):
+    print("\n✅ TEST 23 GODKÄNT: Dagsindelningen är optimal och aldrig dyrare än den giriga!")
+else:
+    print("\n❌ TEST 23 MISSLYCKADES: Dagsindelningen är inte optimal")
+
+# ============================================================================
+# TEST 24: Arbetsdagskalender
+# ============================================================================
+
+print("\n" + "="*70)
+print("TEST 24: Arbetsdagskalender med helgdagar och spärrdatum")
+print("="*70)
+
+from datetime import date, datetime, timedelta
+
+from workday_calendar import WorkdayCalendar, easter_sunday, swedish_holidays
+
+holidays_2026 = swedish_holidays(2026)
+holidays_ok = (
+    easter_sunday(2024) == date(2024, 3, 31)
+    and easter_sunday(2025) == date(2025, 4, 20)
+    and easter_sunday(2026) == date(2026, 4, 5)
+    and holidays_2026.get(date(2026, 6, 19)) == 'Midsommarafton'
+    and holidays_2026.get(date(2026, 10, 31)) == 'Alla helgons dag'
+    and holidays_2026.get(date(2026, 5, 14)) == 'Kristi himmelsfärdsdag'
+)
+
+# Julafton en torsdag: nästa arbetsdag är måndag 28 december
+calendar_optimizer = RouteOptimizer({**config_test, 'team_blackout_dates': {1: ['2026-12-28']}})
+christmas = datetime(2026, 12, 24, 7, 0)
+after_christmas = calendar_optimizer.skip_weekends(christmas)
+team_after_christmas = calendar_optimizer.skip_weekends(christmas, team_id=1)
+skip_ok = (after_christmas == datetime(2026, 12, 28, 7, 0)
+           and team_after_christmas == datetime(2026, 12, 29, 7, 0)
+           and calendar_optimizer.is_before_weekend(datetime(2026, 12, 23))
+           and not calendar_optimizer.is_before_weekend(datetime(2026, 12, 21)))
+
+# Helgarbete: lördag och söndag är arbetsdagar, helgdagarna är fortfarande lediga
+weekend_calendar = WorkdayCalendar(work_weekends=True)
+no_holiday_calendar = WorkdayCalendar(public_holidays=False, blackout_dates=['2026-06-18'])
+modes_ok = (weekend_calendar.is_workday('2026-12-27')
+            and not weekend_calendar.is_workday('2026-12-26')
+            and no_holiday_calendar.is_workday('2026-06-19')
+            and not no_holiday_calendar.is_workday('2026-06-18')
+            and no_holiday_calendar.next_workday('2026-06-18') == date(2026, 6, 19))
+
+# Datum långt fram utökar kalendern
+far_ok = WorkdayCalendar().next_workday('2099-12-24') == date(2099, 12, 28)
+
+try:
+    WorkdayCalendar(blackout_dates=['2026-13-01'])
+    invalid_rejected = False
+except ValueError:
+    invalid_rejected = True
+
+# Ingen körning startar på en ledig dag (ensamma stopp
+# långt bort kan ha ankomst efter midnatt)
+route_calendar = map_result['optimizer'].calendar()
+visit_days = {
+    (segment.arrival_time - timedelta(hours=segment.drive_time)).date()
+    for route in map_routes for segment in route.segments
+}
+visits_on_workdays = all(route_calendar.is_workday(day) for day in visit_days)
+
+start = time.perf_counter()
+lookup_calendar = WorkdayCalendar(blackout_dates=['2026-07-01'])
+for offset in range(100_000):
+    lookup_calendar.next_workday(date(2026, 1, 1) + timedelta(days=offset % 1500))
+lookup_ms = (time.perf_counter() - start) * 1000
+
+print(f"\n  Påsk och rörliga helgdagar: {'OK' if holidays_ok else 'FEL'}")
+print(f"  Julafton 07:00 -> {after_christmas:%Y-%m-%d %H:%M} (team med spärrdatum: {team_after_christmas:%Y-%m-%d})")
+print(f"  Helgarbete och avstängda helgdagar: {'OK' if modes_ok else 'FEL'}")
+print(f"  Besöksdagar i körningen: {len(visit_days)}, alla arbetsdagar: {visits_on_workdays}")
+print(f"  100 000 uppslag av nästa arbetsdag: {lookup_ms:.0f} ms")
+
+if holidays_ok and skip_ok and modes_ok and far_ok and invalid_rejected and visits_on_workdays:
+    print("\n✅ TEST 24 GODKÄNT: Helgdagar och spärrdatum hoppas över!")
+else:
+    print("\n❌ TEST 24 MISSLYCKADES: Arbetsdagskalendern ger fel dagar")
+
+# ============================================================================
+# SAMMANFATTNING
+# ============================================================================
+
+print("\n" + "="*70)
+print("RUTTMOTOR-TEST KOMPLETT")
+print("="*70)
@@ -0,0 +1,150 @@
+"""
+Time Budget Module
+Tidsbudget för optimeringen (config 'time_limit_s') med tidsredovisning per steg
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+# Stegen i optimeringen, i den ordning de redovisas
+STAGES = ('load', 'distance_matrix', 'construction', 'improvement', 'scheduling')
+
+STAGE_NAMES = {
+    'load': 'Inläsning',
+    'distance_matrix': 'Avståndsmatris',
+    'construction': 'Konstruktion',
+    'improvement': 'Förbättring',
+    'scheduling': 'Schemaläggning',
+}
+
+
+class TimeBudget:
+    """
+    Håller reda på en tidsgräns och hur mycket tid varje steg använder
+    
+    Utan tidsgräns (limit_s=None) mäts tiden per steg men budgeten tar
+    aldrig slut. Budgeten kan förlängas med extend() för att fortsätta
+    förbättra en lösning.
+    """
+    
+    def __init__(self, limit_s: Optional[float] = None):
+        if limit_s is not None and limit_s <= 0:
+            raise ValueError(f"time_limit_s måste vara positiv, fick {limit_s}")
+        
+        self.limit_s = limit_s
+        self.started = time.perf_counter()
+        self.deadline = self.started + limit_s if limit_s is not None else None
+        self.stages: Dict[str, float] = {}
+        self.cancelled = False
+        self._active: Optional[str] = None
+        
+        # Sätts av cancel() om den finns (t.ex. en multiprocessing.Event som
+        # arbetsprocesserna i en parallell genomsökning lyssnar på)
+        self.cancel_event = None
+    
+    def elapsed(self) -> float:
+        """Sekunder sedan budgeten startade"""
+        return time.perf_counter() - self.started
+    
+    def remaining(self) -> Optional[float]:
+        """Återstående sekunder (None = ingen gräns)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+    
+    def expired(self) -> bool:
+        """True när tidsgränsen har passerats"""
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+    
+    def extend(self, extra_s: Optional[float]):
+        """
+        Ger optimeringen mer tid, räknat från nu
+        
+        Args:
+            extra_s: Extra sekunder (None = ta bort tidsgränsen)
+        """
+        self.cancelled = False
+        
+        if extra_s is None:
+            self.limit_s = None
+            self.deadline = None
+            return
+        
+        if extra_s <= 0:
+            raise ValueError(f"time_limit_s måste vara positiv, fick {extra_s}")
+        
+        now = time.perf_counter()
+        self.deadline = now + extra_s
+        self.limit_s = (now - self.started) + extra_s
+    
+    def cancel(self):
+        """
+        Avbryter optimeringen: budgeten räknas som slut från och med nu, så
+        pågående steg avslutas med bästa hittills funna lösning
+        """
+        now = time.perf_counter()
+        self.deadline = now
+        self.limit_s = now - self.started
+        self.cancelled = True
+        
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Mäter tiden för ett steg (nästlade anrop räknas till det yttre steget)
+        
+        Ger True för det yttersta steget och False för nästlade anrop
+        """
+        if self._active is not None:
+            yield False
+            return
+        
+        self._active = name
+        start = time.perf_counter()
+        try:
+            yield True
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            self._active = None
+    
+    def add(self, stages: Dict[str, float]):
+        """
+        Lägger till tid per steg som mätts någon annanstans (t.ex. i en annan
+        process). Vid parallell körning blir stegens summa därför större än
+        den verkliga tiden.
+        """
+        for name, seconds in stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def report(self) -> Dict:
+        """
+        Sammanställer tidsåtgången
+        
+        Returns:
+            Dictionary med limit_s, elapsed_s, expired, cancelled samt stages där varje
+            steg har seconds och share (andel av budgeten, eller av total tid
+            om ingen gräns finns)
+        """
+        elapsed = self.elapsed()
+        reference = self.limit_s if self.limit_s is not None else elapsed
+        
+        ordered = [name for name in STAGES if name in self.stages]
+        ordered += [name for name in self.stages if name not in STAGES]
+        
+        return {
+            'limit_s': self.limit_s,
+            'elapsed_s': elapsed,
+            'expired': self.expired(),
+            'cancelled': self.cancelled,
+            'stages': {
+                name: {
+                    'seconds': self.stages[name],
+                    'share': self.stages[name] / reference if reference > 0 else 0.0,
+                }
+                for name in ordered
+            },
+        }
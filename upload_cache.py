@@ -0,0 +1,179 @@
+"""
+Upload Cache Module
+Minnescache för inlästa filer, filtrerad data och platstabeller
+
+Streamlit kör om hela app.py vid varje widgetändring. Utan cache läses den
+uppladdade filen om varje gång, och både "Optimera" och "AI-förslag" kör
+load_data och create_locations från början. Cachen nycklas på en hash av filens innehåll
+(samma fil i en annan session ger träff) och för bearbetad data även på de
+config-värden som påverkar resultatet (FILTER_CONFIG_KEYS och
+LOCATION_CONFIG_KEYS).
+
+En instans delas av alla sessioner (t.ex. via st.cache_resource). Cachade
+objekt delas mellan anropare och får inte ändras. Platstabellen lämnas som
+en egen vy per anrop (LocationTable.view): kolumnerna delas, men de
+Location-objekt som en körning skapar hör till den körningen och räknas
+aldrig in i cachen.
+"""
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Tuple
+
+import numpy as np
+
+from data_loading import read_locations_file
+from optimizer import FILTER_CONFIG_KEYS, LOCATION_CONFIG_KEYS, LocationTable, RouteOptimizer
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class UploadCache:
+    """
+    LRU-cache med storleksgräns för inlästa och bearbetade filer
+    
+    När cachen blir större än max_mb tas de poster bort som använts längst
+    tillbaka. En post som ensam är större än gränsen cachas inte.
+    """
+    
+    def __init__(self, max_mb: float = 512):
+        if max_mb <= 0:
+            raise ValueError(f"max_mb måste vara positiv, fick {max_mb}")
+        
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """Nyckel för en fils innehåll"""
+        return hashlib.sha256(data).hexdigest()
+    
+    def dataframe(self, data: bytes, filename: str) -> Tuple[str, 'pd.DataFrame']:
+        """
+        Inläst fil (som read_locations_file) och innehållets hash
+        
+        Args:
+            data: Filens innehåll
+            filename: Filnamn som avgör formatet
+        
+        Returns:
+            (hash, DataFrame)
+        """
+        digest = self.digest(data)
+        key = ('dataframe', digest, filename.lower().endswith('.csv'))
+        
+        df = self._get(key)
+        if df is None:
+            df = read_locations_file(io.BytesIO(data), filename)
+            self._put(key, df)
+        
+        return digest, df
+    
+    def processed(self, digest: str, df: 'pd.DataFrame', profile_name: str, profile: Dict,
+                  config: Dict) -> Tuple['pd.DataFrame', LocationTable]:
+        """
+        Filtrerad data (load_data) och platstabell (create_locations) för en fil
+        
+        Args:
+            digest: Hash från dataframe()
+            df: DataFrame från dataframe()
+            profile_name: Profilens namn (ingår i nyckeln)
+            profile: Profilen
+            config: Config - bara FILTER_CONFIG_KEYS och LOCATION_CONFIG_KEYS används
+        
+        Returns:
+            (filtrerad data, egen vy av den cachade platstabellen)
+        """
+        optimizer = RouteOptimizer(config)
+        filter_key = ('filtered', digest, profile_name, _config_values(config, FILTER_CONFIG_KEYS))
+        
+        processed_data = self._get(filter_key)
+        if processed_data is None:
+            processed_data = optimizer.load_data(df, profile)
+            self._put(filter_key, processed_data)
+        
+        table_key = filter_key + ('locations', _config_values(config, LOCATION_CONFIG_KEYS))
+        table = self._get(table_key)
+        if table is None:
+            table = optimizer.create_locations(processed_data, profile)
+            self._put(table_key, table)
+        
+        return processed_data, table.view()
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_mb': self.size_bytes / (1024 * 1024),
+                'max_mb': self.max_bytes / (1024 * 1024),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+    
+    def _get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def _put(self, key: Hashable, value: Any):
+        size = _size_bytes(value)
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size_bytes += size
+            
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+
+
+def _config_values(config: Dict, keys: Tuple[str, ...]) -> Tuple:
+    """Hashbara config-värden för nyckeln (listor blir tupler)"""
+    values = []
+    for key in keys:
+        value = config.get(key)
+        if isinstance(value, (list, set)):
+            value = tuple(value)
+        values.append(value)
+    return tuple(values)
+
+
+def _size_bytes(value: Any) -> int:
+    """Ungefärlig minnesanvändning för en cachad post"""
+    import pandas as pd
+    
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    
+    if isinstance(value, LocationTable):
+        size = 0
+        for column in (value.ids, value.customers, value.latitudes, value.longitudes,
+                       value.units, value.filter_values, value.work_times):
+            if column.dtype == object:
+                size += int(pd.Series(column).memory_usage(index=False, deep=True))
+            else:
+                size += column.nbytes
+        return size
+    
+    return int(np.asarray(value).nbytes)
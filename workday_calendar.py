@@ -0,0 +1,165 @@
+"""
+Workday Calendar Module
+Arbetsdagskalender med svenska helgdagar och spärrdatum
+
+Kalendern förberäknas som en mask med en bool per dag över ett antal år
+(veckodagar, helgdagar och spärrdatum), tillsammans med index för nästa
+arbetsdag från varje dag. Uppslag är då O(1) per dag istället för att stega
+dag för dag. Frågor utanför det beräknade intervallet utökar det.
+
+Helgdagarna räknas fram lokalt för varje år (påsk med Gauss/Meeus-algoritmen),
+inklusive de dagar som i praktiken är lediga: midsommarafton, julafton och
+nyårsafton.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+
+
+# År före och efter idag som beräknas från början
+DEFAULT_YEARS_BEFORE = 1
+DEFAULT_YEARS_AFTER = 5
+
+DateLike = Union[date, datetime, str]
+
+
+def easter_sunday(year: int) -> date:
+    """Påskdagen (gregoriansk kalender, anonym Gauss/Meeus-algoritm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _weekday_between(year: int, month: int, first_day: int, weekday: int) -> date:
+    """Första dagen med given veckodag från first_day i månaden (t.ex. midsommarafton)"""
+    start = date(year, month, first_day)
+    return start + timedelta(days=(weekday - start.weekday()) % 7)
+
+
+def swedish_holidays(year: int) -> Dict[date, str]:
+    """Svenska helgdagar och i praktiken lediga aftnar för ett år"""
+    easter = easter_sunday(year)
+    midsummer_eve = _weekday_between(year, 6, 19, 4)  # Fredag 19-25 juni
+    all_saints = _weekday_between(year, 10, 31, 5)    # Lördag 31 okt - 6 nov
+    
+    return {
+        date(year, 1, 1): 'Nyårsdagen',
+        date(year, 1, 6): 'Trettondedag jul',
+        easter - timedelta(days=2): 'Långfredagen',
+        easter - timedelta(days=1): 'Påskafton',
+        easter: 'Påskdagen',
+        easter + timedelta(days=1): 'Annandag påsk',
+        date(year, 5, 1): 'Första maj',
+        easter + timedelta(days=39): 'Kristi himmelsfärdsdag',
+        easter + timedelta(days=49): 'Pingstdagen',
+        date(year, 6, 6): 'Sveriges nationaldag',
+        midsummer_eve: 'Midsommarafton',
+        midsummer_eve + timedelta(days=1): 'Midsommardagen',
+        all_saints: 'Alla helgons dag',
+        date(year, 12, 24): 'Julafton',
+        date(year, 12, 25): 'Juldagen',
+        date(year, 12, 26): 'Annandag jul',
+        date(year, 12, 31): 'Nyårsafton',
+    }
+
+
+def parse_date(value: DateLike) -> date:
+    """Datum från date, datetime eller ISO-text (ÅÅÅÅ-MM-DD)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ValueError(f"Ogiltigt datum: {value!r} (använd ÅÅÅÅ-MM-DD)") from None
+
+
+class WorkdayCalendar:
+    """
+    Arbetsdagar som förberäknad mask med O(1)-uppslag
+    
+    Args:
+        work_weekends: True om lördag och söndag är arbetsdagar
+        public_holidays: True om svenska helgdagar är lediga
+        blackout_dates: Ytterligare lediga datum (t.ex. ett teams semester)
+    """
+    
+    def __init__(self, work_weekends: bool = False, public_holidays: bool = True,
+                 blackout_dates: Iterable[DateLike] = ()):
+        self.work_weekends = work_weekends
+        self.public_holidays = public_holidays
+        self.blackout_dates = frozenset(parse_date(value) for value in blackout_dates)
+        
+        today = date.today()
+        self._build(today.year - DEFAULT_YEARS_BEFORE, today.year + DEFAULT_YEARS_AFTER)
+    
+    def _build(self, first_year: int, last_year: int):
+        """Beräknar mask, helgdagar och nästa arbetsdag för åren"""
+        self.first_year = first_year
+        self.last_year = last_year
+        self.start = date(first_year, 1, 1)
+        num_days = (date(last_year, 12, 31) - self.start).days + 1
+        
+        days = np.arange(num_days)
+        workdays = np.ones(num_days, dtype=bool)
+        if not self.work_weekends:
+            workdays &= (self.start.weekday() + days) % 7 < 5
+        
+        self.holidays: Dict[date, str] = {}
+        if self.public_holidays:
+            for year in range(first_year, last_year + 1):
+                self.holidays.update(swedish_holidays(year))
+        
+        for day in list(self.holidays) + list(self.blackout_dates):
+            offset = (day - self.start).days
+            if 0 <= offset < num_days:
+                workdays[offset] = False
+        
+        # Index för första arbetsdag från och med varje dag (num_days = ingen)
+        candidates = np.where(workdays, days, num_days)
+        self._next = np.minimum.accumulate(candidates[::-1])[::-1]
+        self._workdays = workdays
+    
+    def _offset(self, day: date) -> int:
+        """Dagens index i masken (utökar intervallet om det behövs)"""
+        if day.year < self.first_year or day.year >= self.last_year:
+            self._build(min(self.first_year, day.year - 1), max(self.last_year, day.year + DEFAULT_YEARS_AFTER))
+        return (day - self.start).days
+    
+    def is_workday(self, day: DateLike) -> bool:
+        day = parse_date(day)
+        return bool(self._workdays[self._offset(day)])
+    
+    def next_workday(self, day: DateLike) -> date:
+        """Dagen själv om den är en arbetsdag, annars nästa arbetsdag"""
+        day = parse_date(day)
+        offset = self._offset(day)
+        next_offset = self._next[offset]
+        
+        while next_offset >= len(self._workdays):
+            # Inga arbetsdagar kvar i intervallet - utöka med fler år
+            self._build(self.first_year, self.last_year + DEFAULT_YEARS_AFTER)
+            next_offset = self._next[offset]
+        
+        return self.start + timedelta(days=int(next_offset))
+    
+    def is_day_off_tomorrow(self, day: DateLike) -> bool:
+        """True om dagen efter är ledig (helg, helgdag eller spärrdatum)"""
+        return not self.is_workday(parse_date(day) + timedelta(days=1))
+    
+    def holiday_name(self, day: DateLike) -> Optional[str]:
+        """Helgdagens namn, eller None"""
+        day = parse_date(day)
+        self._offset(day)
+        return self.holidays.get(day)